@@ -0,0 +1,100 @@
+"""
+Compares the asyncio runner with a thread pool on a mix of short and long
+programs started at the same time.
+
+For each approach it reports the total time, the median and 95th
+percentile latency of the short and the long programs, and the longest
+delay seen by a heartbeat task that wakes up every millisecond (how
+responsive the event loop stays while the programs run). Every ready
+program runs one slice before the heartbeat runs again, so its delay grows
+with the number of programs times the slice size.
+
+Both approaches run the programs through the iterative evaluator, the
+one the asyncio runner slices, so that they do the same work; evaluate
+would run the counting loops here in closed form.
+
+    python benchmarks/async_fairness.py [programs] [threads] [slice_steps]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stimpl.aio import run_stimpl_async
+from stimpl.expression import *
+from stimpl.iterative import evaluate_iterative
+from stimpl.runtime import run_stimpl
+
+
+def counter(iterations):
+    i = Variable("i")
+    return Program(Assign(i, IntLiteral(0)),
+                   While(Lt(i, IntLiteral(iterations)), Assign(i, Add(i, IntLiteral(1)))),
+                   i)
+
+
+def workload(count):
+    # One long program for every nine short ones.
+    return [counter(20000 if n % 10 == 0 else 200) for n in range(count)]
+
+
+async def heartbeat(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - start - 0.001)
+
+
+async def measure(programs, run):
+    lags = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    start = time.perf_counter()
+
+    async def timed(program):
+        await run(program)
+        return time.perf_counter() - start
+
+    latencies = await asyncio.gather(*(timed(program) for program in programs))
+    total = time.perf_counter() - start
+    stop.set()
+    await beat
+    return total, latencies, max(lags, default=0.0)
+
+
+def report(name, programs, total, latencies, lag):
+    print(f"{name}: {total:.2f} s total, heartbeat delayed up to {lag * 1000:.1f} ms")
+    for label, long in (("short", False), ("long", True)):
+        times = sorted(latency for program, latency in zip(programs, latencies)
+                       if (program.exprs[1].condition.right.literal > 200) == long)
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        print(f"  {label:5} programs: median {statistics.median(times) * 1000:8.1f} ms, "
+              f"p95 {p95 * 1000:8.1f} ms")
+
+
+async def main(count, threads, slice_steps):
+    programs = workload(count)
+
+    async def run_async(program):
+        await run_stimpl_async(program, output=[], slice_steps=slice_steps)
+
+    report(f"asyncio runner ({slice_steps} step slices)", programs, *await measure(programs, run_async))
+
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        async def run_threaded(program):
+            await loop.run_in_executor(executor, lambda: run_stimpl(program, backend=evaluate_iterative,
+                                                                       output=[]))
+
+        report(f"thread pool ({threads} threads)", programs, *await measure(programs, run_threaded))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    slice_steps = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    asyncio.run(main(count, threads, slice_steps))
@@ -0,0 +1,54 @@
+"""
+Measures how long a fresh interpreter takes to import stimpl.
+
+Each statement runs in a new Python process, as a CLI invocation or a
+pool worker would. The script reports the median wall time over the runs,
+minus that of an empty interpreter, and the stimpl modules the statement
+loaded.
+
+    python benchmarks/import_time.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+STATEMENTS = [
+    "import stimpl",
+    "import stimpl.runtime",
+    "from stimpl.runtime import run_stimpl",
+    "from stimpl import run_stimpl",
+    "from stimpl import *",
+    "import stimpl.vm",
+]
+
+_MODULES = "import sys; print(' '.join(sorted(m for m in sys.modules if m.startswith('stimpl'))))"
+
+
+def run(code):
+    start = time.perf_counter()
+    child = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                           capture_output=True, text=True)
+    return time.perf_counter() - start, child.stdout
+
+
+def median_time(code, runs):
+    return statistics.median(run(code)[0] for _ in range(runs))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    empty = median_time("pass", runs)
+    print(f"empty interpreter: {empty * 1000:.1f} ms (subtracted below)")
+    for statement in STATEMENTS:
+        elapsed = median_time(statement, runs) - empty
+        modules = run(f"{statement}; {_MODULES}")[1].split()
+        print(f"{statement:40} {elapsed * 1000:7.1f} ms  {len(modules):2} modules: "
+              f"{', '.join(module[len('stimpl.'):] or 'stimpl' for module in modules)}")
+
+
+if __name__ == "__main__":
+    main()
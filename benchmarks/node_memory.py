@@ -0,0 +1,58 @@
+"""
+Measures what it costs to build a large program.
+
+Builds a machine-generated program of straight-line arithmetic and reports
+the memory held per node (measured with tracemalloc) and the construction
+time per node (best of five builds).
+
+    python benchmarks/node_memory.py [statements]
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stimpl.expression import *
+
+
+def generated_program(statements):
+    # Each statement is 10 nodes: x3 = ((x1 + 7) * x2) < 2.5 ...
+    exprs = []
+    for i in range(statements):
+        target = Variable(f"x{i % 10}")
+        value = Add(Multiply(Variable(f"x{(i + 1) % 10}"), IntLiteral(i)),
+                    Subtract(FloatingPointLiteral(i * 0.5), Variable(f"x{(i + 2) % 10}")))
+        exprs.append(Sequence(Assign(target, value)))
+    return Program(*exprs)
+
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nodes = statements * 10 + 1
+
+    gc.collect()
+    tracemalloc.start()
+    program = generated_program(statements)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del program
+
+    best = None
+    for _ in range(5):
+        gc.collect()
+        start = time.perf_counter()
+        program = generated_program(statements)
+        elapsed = time.perf_counter() - start
+        del program
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"nodes:            {nodes}")
+    print(f"bytes per node:   {held / nodes:.1f}")
+    print(f"build ns per node: {best / nodes * 1e9:.0f}")
+
+
+if __name__ == "__main__":
+    main()
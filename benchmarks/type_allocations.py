@@ -0,0 +1,68 @@
+"""
+Measures how much type bookkeeping costs the tree-walking interpreter.
+
+For a counting loop, reports the number of Type constructor calls made per
+evaluated node (counted with a profile hook on stimpl/types.py) and the
+evaluation throughput without the hook.
+
+    python benchmarks/type_allocations.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stimpl.expression import *
+from stimpl.runtime import EmptyState, evaluate
+import stimpl.runtime
+import stimpl.types
+
+
+def counting_loop(iterations):
+    return Program(
+        Assign(Variable("i"), IntLiteral(0)),
+        Assign(Variable("total"), IntLiteral(0)),
+        While(Lt(Variable("i"), IntLiteral(iterations)),
+              Sequence(
+                  Assign(Variable("total"), Add(Variable("total"), Variable("i"))),
+                  Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))))
+
+
+def count_calls(program):
+    counts = {"nodes": 0, "types": 0}
+    evaluate_code = stimpl.runtime.evaluate.__code__
+    types_file = stimpl.types.__file__
+
+    def profile(frame, event, arg):
+        if event == "call":
+            if frame.f_code is evaluate_code:
+                counts["nodes"] += 1
+            elif frame.f_code.co_filename == types_file:
+                counts["types"] += 1
+
+    sys.setprofile(profile)
+    try:
+        evaluate(program, EmptyState())
+    finally:
+        sys.setprofile(None)
+    return counts
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    counts = count_calls(counting_loop(iterations))
+    print(f"evaluated nodes:        {counts['nodes']}")
+    print(f"type constructor calls: {counts['types']}")
+    print(f"calls per node:         {counts['types'] / counts['nodes']:.3f}")
+
+    program = counting_loop(iterations * 5)
+    start = time.perf_counter()
+    evaluate(program, EmptyState())
+    elapsed = time.perf_counter() - start
+    print(f"nodes per second:       {counts['nodes'] * 5 / elapsed:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,53 @@
-from stimpl.errors import *
-from stimpl.expression import *
-from stimpl.runtime import *
-from stimpl.robustness import *
-from stimpl.test import *
-from stimpl.types import *
\ No newline at end of file
+import importlib
+
+"""
+The STIMPL package.
+
+Importing stimpl loads none of its modules. The names below are imported
+from the module that defines them on first use, so `from stimpl import *`
+still provides all of them, and `import stimpl.runtime` loads only the
+runtime and what it depends on, not the test harness. Other submodules
+are imported on first attribute access as well, e.g. stimpl.vm.
+"""
+
+_EXPORTS = {
+    "stimpl.errors": ("InterpError", "InterpLimitError", "InterpMathError", "InterpSyntaxError",
+                      "InterpTypeError", "pretty_type"),
+    "stimpl.expression": ("Add", "And", "Assign", "BinaryOperator", "BooleanLiteral", "Divide", "Eq",
+                          "Expr", "FloatingPointLiteral", "Gt", "Gte", "HashConsing", "If",
+                          "IntLiteral", "Literal", "Lt", "Lte", "Multiply", "Ne", "Not", "Or",
+                          "Print", "Program", "Ren", "Sequence", "StringLiteral", "Subtract",
+                          "UnaryOperator", "Variable", "While", "assigned_variables", "intern",
+                          "subexpressions"),
+    "stimpl.runtime": ("EmptyState", "State", "evaluate", "run_stimpl"),
+    "stimpl.robustness": ("run_stimpl_robustness_tests",),
+    "stimpl.test": ("TestingError", "TestingLiteralError", "check_equal", "check_program_raises",
+                    "check_run_result", "check_same_behavior", "observe_run",
+                    "run_stimpl_sanity_tests"),
+    "stimpl.types": ("BOOLEAN", "Boolean", "FLOATING_POINT", "FloatingPoint", "INTEGER", "Integer",
+                     "STRING", "String", "Type", "UNIT", "Unit"),
+}
+
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name):
+    module = _MODULES.get(name)
+    if module is not None:
+        value = getattr(importlib.import_module(module), name)
+        globals()[name] = value
+        return value
+    if not name.startswith("_"):
+        try:
+            # Importing a submodule also sets it as an attribute here.
+            return importlib.import_module(f"{__name__}.{name}")
+        except ModuleNotFoundError as e:
+            if e.name != f"{__name__}.{name}":
+                raise
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Any, Optional, Tuple
+
+from stimpl.expression import Expr
+from stimpl.types import Type
+from stimpl.runtime import EmptyState, State
+from stimpl.iterative import Machine
+from stimpl.limits import Budget, Limits, reset_budget, set_budget
+from stimpl.output import output_sink, reset_output, set_output
+from stimpl.rope import flatten, flatten_state
+
+"""
+asyncio runner.
+
+run_stimpl_async runs a program on the iterative Machine a slice of
+slice_steps work items at a time and yields to the event loop between
+slices, so any number of programs can run concurrently in one thread
+without blocking the loop:
+
+    results = await asyncio.gather(*(run_stimpl_async(p, output=[]) for p in programs))
+
+Cancelling the task raises asyncio.CancelledError inside the program at
+the end of the current slice. Smaller slices keep the event loop more
+responsive (every ready program runs a slice before the loop gets back to
+anything else) at the cost of more switching. Output and limits are set per task (both
+live in context variables), so concurrent programs never see each
+other's sinks or budgets. A timeout in limits is wall-clock time and so
+includes the time spent waiting for other tasks.
+"""
+
+
+'''
+Runs program from an empty state like run_stimpl, yielding to the event
+loop every slice_steps steps of the iterative evaluator.
+'''
+async def run_stimpl_async(program: Expr, output: Any = None, limits: Optional[Limits] = None,
+                           slice_steps: int = 1000) -> Tuple[Optional[Any], Type, State]:
+    if slice_steps < 1:
+        raise ValueError("slice_steps must be at least 1")
+    machine = Machine(program, EmptyState())
+    sink = output_sink(output)
+    budget = Budget(limits) if limits is not None else None
+    try:
+        while True:
+            # The sink and budget are installed only while a slice runs.
+            token = set_output(sink)
+            budget_token = set_budget(budget)
+            try:
+                finished = machine.run(slice_steps)
+            finally:
+                reset_budget(budget_token)
+                reset_output(token)
+            if finished:
+                value, value_type, state = machine.result()
+                return (flatten(value), value_type, flatten_state(state))
+            await asyncio.sleep(0)
+    finally:
+        if sink is not None:
+            sink.flush()
@@ -0,0 +1,85 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence as SequenceType
+
+from stimpl.expression import Expr
+from stimpl.limits import Limits
+from stimpl.output import ListSink
+from stimpl.runtime import run_stimpl
+
+"""
+Bulk execution.
+
+run_many runs a batch of independent programs, optionally spread over a
+pool of worker processes. Programs are sent to the workers in chunks, so
+each one is pickled once and every worker pays its start-up cost once per
+chunk rather than once per program.
+"""
+
+
+class ProgramResult(object):
+    def __init__(self, value: Any, value_type: Any, state: Any,
+                 output: List[str], error: Optional[BaseException]) -> None:
+        self.value = value
+        self.type = value_type
+        self.state = state
+        self.output = output
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        if self.error is not None:
+            return f"ProgramResult(error={self.error!r}, output={self.output})"
+        return f"ProgramResult(({self.value}, {self.type}), output={self.output})"
+
+
+def run_one(program: Expr, backend: Optional[Callable] = None,
+            limits: Optional[Limits] = None) -> ProgramResult:
+    """
+    Runs program and captures its result, printed lines and error instead
+    of raising.
+    """
+    sink = ListSink()
+    try:
+        value, value_type, state = run_stimpl(program, backend=backend, output=sink, limits=limits)
+    except Exception as e:
+        return ProgramResult(None, None, None, sink.lines, e)
+    return ProgramResult(value, value_type, state, sink.lines, None)
+
+
+def _run_chunk(programs: List[Expr], backend: Optional[Callable],
+               limits: Optional[Limits]) -> List[ProgramResult]:
+    return [run_one(program, backend, limits) for program in programs]
+
+
+'''
+Runs every program in programs and returns their ProgramResults in the
+same order. An error in one program is recorded in its result and does
+not affect the others.
+
+With workers greater than 1 the programs run in that many processes, in
+chunks of chunksize programs (by default about four chunks per worker).
+backend must then be picklable, for example a module-level function.
+
+limits, if given, applies to each program separately.
+'''
+def run_many(programs: SequenceType[Expr], workers: int = 1,
+             backend: Optional[Callable] = None,
+             chunksize: Optional[int] = None,
+             limits: Optional[Limits] = None) -> List[ProgramResult]:
+    programs = list(programs)
+    if workers <= 1 or len(programs) <= 1:
+        return _run_chunk(programs, backend, limits)
+
+    if chunksize is None:
+        chunksize = max(1, -(-len(programs) // (workers * 4)))
+    chunks = [programs[i:i + chunksize] for i in range(0, len(programs), chunksize)]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_results in executor.map(_run_chunk, chunks, [backend] * len(chunks),
+                                          [limits] * len(chunks)):
+            results.extend(chunk_results)
+    return results
@@ -0,0 +1,2 @@
+from stimpl.bench.workloads import WORKLOADS, Workload
+from stimpl.bench.runner import compare, count_nodes, measure, run_benchmarks
@@ -0,0 +1,5 @@
+import sys
+
+from stimpl.bench.runner import main
+
+sys.exit(main())
@@ -0,0 +1,181 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from stimpl.expression import Expr, subexpressions
+from stimpl.runtime import evaluate, run_stimpl
+from stimpl.output import NullSink
+from stimpl.bench.workloads import WORKLOADS, Workload
+
+"""
+Benchmark runner.
+
+Each workload is run repeats times with output discarded. For every
+workload the runner reports
+
+    nodes           the number of expressions in the program
+    best            the fastest of the run times, in seconds
+    p50, p90, p99   percentiles of the whole-run times over the repeats,
+                    in seconds; with few repeats p90 and p99 are simply
+                    the slowest run
+    peak_bytes      the peak memory allocated during one run
+
+A workload is the same program whatever the backend, so best compares
+backends on equal work, including backends and optimizations that skip
+work altogether. Results can be saved as a baseline JSON file and later
+runs compared against it: a workload whose best time grew by more than
+the threshold (a fraction, 0.3 meaning 30% slower) is a regression.
+
+    python -m stimpl.bench [--backend vm] [--save baseline.json]
+                           [--baseline baseline.json] [--threshold 0.3]
+"""
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def _backends() -> Dict[str, Callable]:
+    from stimpl.compiler import run_checked, run_compiled
+    from stimpl.iterative import evaluate_iterative
+    from stimpl.vm import run_vm
+    return {"evaluate": evaluate, "iterative": evaluate_iterative, "vm": run_vm,
+            "compiled": run_compiled, "checked": run_checked}
+
+
+def count_nodes(program: Expr) -> int:
+    '''
+    Returns the number of expressions in program.
+    '''
+    return sum(1 for _ in subexpressions(program))
+
+
+def _percentile(times: List[float], fraction: float) -> float:
+    ordered = sorted(times)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(workload: Workload, backend: Optional[Callable] = None, repeats: int = 10,
+            scale: float = 1.0) -> Dict[str, Any]:
+    program = workload.program(scale)
+    nodes = count_nodes(program)
+
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        run_stimpl(program, backend=backend, output=NullSink())
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run_stimpl(program, backend=backend, output=NullSink())
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "nodes": nodes,
+        "best": min(times),
+        "p50": _percentile(times, 0.5),
+        "p90": _percentile(times, 0.9),
+        "p99": _percentile(times, 0.99),
+        "peak_bytes": peak_bytes,
+    }
+
+
+'''
+Runs the named workloads (all of them by default) and returns the
+results keyed by workload name, together with the settings of the run.
+'''
+def run_benchmarks(names: Optional[Iterable[str]] = None, backend: str = "evaluate",
+                   repeats: int = 10, scale: float = 1.0) -> Dict[str, Any]:
+    backends = _backends()
+    if backend not in backends:
+        raise ValueError(f"Unknown backend {backend}; choose from {', '.join(backends)}")
+    names = list(WORKLOADS) if names is None else list(names)
+    for name in names:
+        if name not in WORKLOADS:
+            raise ValueError(f"Unknown workload {name}")
+    return {
+        "backend": backend,
+        "scale": scale,
+        "python": platform.python_version(),
+        "workloads": {name: measure(WORKLOADS[name], backends[backend], repeats, scale)
+                      for name in names},
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = 0.3) -> List[str]:
+    '''
+    Returns a description of every workload in both results and baseline
+    whose best time grew by more than threshold.
+    '''
+    regressions = []
+    for name, current in results["workloads"].items():
+        previous = baseline["workloads"].get(name)
+        if previous is None:
+            continue
+        slowdown = current["best"] / previous["best"] - 1
+        if slowdown > threshold:
+            regressions.append(f"{name}: {current['best'] * 1000:.2f} ms is "
+                               f"{slowdown:.0%} slower than the baseline "
+                               f"{previous['best'] * 1000:.2f} ms")
+    return regressions
+
+
+def format_results(results: Dict[str, Any]) -> str:
+    lines = [f"backend {results['backend']}, scale {results['scale']}, "
+             f"Python {results['python']}",
+             f"{'workload':16} {'nodes':>10} {'best ms':>9} {'p50 ms':>9} {'p90 ms':>9} "
+             f"{'p99 ms':>9} {'peak KiB':>9}"]
+    for name, result in results["workloads"].items():
+        lines.append(f"{name:16} {result['nodes']:>10,} {result['best'] * 1000:>9.2f} "
+                     f"{result['p50'] * 1000:>9.2f} {result['p90'] * 1000:>9.2f} "
+                     f"{result['p99'] * 1000:>9.2f} {result['peak_bytes'] / 1024:>9.1f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m stimpl.bench",
+                                     description="Runs the STIMPL benchmark workloads.")
+    parser.add_argument("workloads", nargs="*", help="workloads to run (default: all)")
+    parser.add_argument("--backend", default="evaluate", choices=sorted(_backends()))
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiplies the size of every workload")
+    parser.add_argument("--baseline", default=None,
+                        help=f"baseline JSON to compare against (default: {BASELINE} "
+                             f"if the backend and scale match)")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="largest allowed slowdown, as a fraction")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    arguments = parser.parse_args(argv)
+
+    results = run_benchmarks(arguments.workloads or None, arguments.backend,
+                             arguments.repeats, arguments.scale)
+    print(format_results(results))
+    if arguments.save:
+        with open(arguments.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    path = arguments.baseline
+    if path is None:
+        if not os.path.exists(BASELINE):
+            return 0
+        path = BASELINE
+    with open(path) as f:
+        baseline = json.load(f)
+    if arguments.baseline is None and (baseline["backend"], baseline["scale"]) != \
+            (results["backend"], results["scale"]):
+        return 0
+    regressions = compare(results, baseline, arguments.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
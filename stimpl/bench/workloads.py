@@ -0,0 +1,101 @@
+from typing import Callable, Dict
+
+from stimpl.expression import *
+
+"""
+Benchmark workloads.
+
+Every workload builds a program from a size: the number of loop
+iterations it runs. The programs are chosen to stress one part of the
+interpreter each and all of them finish without errors.
+"""
+
+
+class Workload(object):
+    def __init__(self, name: str, description: str, build: Callable[[int], Expr],
+                 size: int) -> None:
+        self.name = name
+        self.description = description
+        self.build = build
+        # The default size, which runs for roughly a tenth of a second
+        # under evaluate.
+        self.size = size
+
+    def program(self, scale: float = 1.0) -> Expr:
+        return self.build(max(1, int(self.size * scale)))
+
+    def __repr__(self) -> str:
+        return f"Workload({self.name})"
+
+
+def _loop(iterations: int, *body: Expr) -> Expr:
+    i = Variable("i")
+    return Sequence(Assign(i, IntLiteral(0)),
+                    While(Lt(i, IntLiteral(iterations)),
+                          Sequence(*body, Assign(i, Add(i, IntLiteral(1))))))
+
+
+def counting_loop(iterations: int) -> Expr:
+    # The square keeps the sum from being computed in closed form (see
+    # stimpl.loops), so every iteration still runs.
+    i, total = Variable("i"), Variable("total")
+    return Program(Assign(total, IntLiteral(0)),
+                   _loop(iterations, Assign(total, Add(total, Multiply(i, i)))),
+                   total)
+
+
+def if_ladder(iterations: int, rungs: int = 16) -> Expr:
+    i, rung, hits = Variable("i"), Variable("rung"), Variable("hits")
+    ladder = Assign(hits, Add(hits, IntLiteral(rungs)))
+    for r in reversed(range(rungs)):
+        ladder = If(Eq(rung, IntLiteral(r)), Assign(hits, Add(hits, IntLiteral(r))), ladder)
+    return Program(Assign(hits, IntLiteral(0)),
+                   _loop(iterations,
+                         Assign(rung, Subtract(i, Multiply(Divide(i, IntLiteral(rungs + 1)),
+                                                           IntLiteral(rungs + 1)))),
+                         ladder),
+                   hits)
+
+
+def string_building(iterations: int, chain: int = 8) -> Expr:
+    s, line = Variable("s"), Variable("line")
+    value = StringLiteral("")
+    for c in range(chain):
+        value = Add(value, StringLiteral(chr(ord("a") + c)))
+    return Program(Assign(s, StringLiteral("")),
+                   _loop(iterations, Assign(line, value), Assign(s, Add(s, line))),
+                   s)
+
+
+def deep_sequences(iterations: int, depth: int = 100) -> Expr:
+    x = Variable("x")
+    body = x
+    for _ in range(depth):
+        body = Sequence(Assign(x, Add(x, IntLiteral(1))), body)
+    return Program(Assign(x, IntLiteral(0)), _loop(iterations, body), x)
+
+
+def variable_churn(iterations: int, variables: int = 32) -> Expr:
+    names = [Variable(f"v{k}") for k in range(variables)]
+    body = [Assign(names[k], Add(names[k - 1], Variable("i"))) for k in range(variables)]
+    return Program(*[Assign(name, IntLiteral(k)) for k, name in enumerate(names)],
+                   _loop(iterations, *body),
+                   names[-1])
+
+
+def print_loop(iterations: int) -> Expr:
+    i = Variable("i")
+    return Program(_loop(iterations, Print(i), Print(Add(StringLiteral("line "), StringLiteral("x"))),
+                         Print(Lt(i, IntLiteral(10)))),
+                   i)
+
+
+WORKLOADS: Dict[str, Workload] = {workload.name: workload for workload in (
+    Workload("counting_loop", "a tight integer counting loop", counting_loop, 20000),
+    Workload("if_ladder", "a 16-rung If ladder inside a loop", if_ladder, 3000),
+    Workload("string_building", "chains of string Adds appended to a growing string",
+             string_building, 5000),
+    Workload("deep_sequences", "a loop over Sequences nested 100 deep", deep_sequences, 300),
+    Workload("variable_churn", "32 variables reassigned every iteration", variable_churn, 1000),
+    Workload("print_loop", "three Prints per iteration", print_loop, 10000),
+)}
@@ -0,0 +1,168 @@
+import copy
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Any, Callable, List, Optional, Tuple
+
+from stimpl.errors import InterpError
+from stimpl.expression import *
+from stimpl.types import Type
+from stimpl.output import OutputSink, current_output, reset_output, set_output, write_output
+
+"""
+Result cache.
+
+A closed program run from the empty state always does the same thing, so
+its result can be kept and replayed:
+
+    cache = ResultCache(max_size=256)
+    run_stimpl(program, cache=cache)
+
+Entries are keyed by the structure of the program (and the backend that
+ran it), so an equal program built afresh is a hit. An entry holds the
+final value, type and state, the printed lines and the InterpError the
+program raised, if any; a hit prints the same lines to the current output
+and returns the same result or raises a copy of the same error.
+
+Programs containing nodes from outside stimpl.expression are never
+cached, since their behaviour is not captured by the structure of the
+tree, and neither are runs that end in any other exception (such as
+RecursionError or MemoryError), which depend on the environment rather
+than the program.
+"""
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "uncacheable", "evictions",
+                                     "max_size", "size"])
+
+_CACHEABLE = frozenset([Ren, IntLiteral, FloatingPointLiteral, StringLiteral, BooleanLiteral,
+                        Variable, Assign, Print, Not, And, Or, Lt, Lte, Gt, Gte, Eq, Ne,
+                        Add, Subtract, Multiply, Divide, Program, Sequence, If, While])
+
+
+def is_cacheable(program: Expr) -> bool:
+    seen = set()
+    work = [program]
+    while work:
+        node = work.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if type(node) not in _CACHEABLE:
+            return False
+        match node:
+            case Assign(variable=variable, value=value):
+                work.append(variable)
+                work.append(value)
+            case Print(to_print=to_print):
+                work.append(to_print)
+            case Not(expr=expr):
+                work.append(expr)
+            case BinaryOperator(left=left, right=right):
+                work.append(left)
+                work.append(right)
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                work.extend(exprs)
+            case If(condition=condition, true=true, false=false):
+                work.extend((condition, true, false))
+            case While(condition=condition, body=body):
+                work.extend((condition, body))
+    return True
+
+
+class _RecordingSink(OutputSink):
+    '''
+    Passes printed lines on to the output that was current when it was
+    made, keeping a copy of each.
+    '''
+    def __init__(self, target: Optional[OutputSink]) -> None:
+        self.target = target
+        self.lines = []
+
+    def write_line(self, text: str) -> None:
+        self.lines.append(text)
+        if self.target is None:
+            print(text)
+        else:
+            self.target.write_line(text)
+
+
+class _Entry(object):
+    def __init__(self, result: Optional[Tuple[Any, Type, Any]], output: List[str],
+                 error: Optional[InterpError]) -> None:
+        self.result = result
+        self.output = output
+        self.error = error
+
+
+class ResultCache(object):
+    def __init__(self, max_size: int = 128) -> None:
+        if max_size < 1:
+            raise ValueError("ResultCache needs room for at least one entry")
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+
+    def cache_info(self) -> CacheInfo:
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.uncacheable, self.evictions,
+                             self.max_size, len(self.entries))
+
+    def cache_clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.uncacheable = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, key: Any) -> Optional[_Entry]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return entry
+
+    def store(self, key: Any, entry: _Entry) -> None:
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    '''
+    Runs program from state with backend, or replays the cached result of
+    an earlier run. Called by run_stimpl with the output sink in place.
+    '''
+    def run(self, program: Expr, backend: Callable, state: Any) -> Tuple[Any, Type, Any]:
+        if len(state) != 0 or not is_cacheable(program):
+            with self.lock:
+                self.uncacheable += 1
+            return backend(program, state)
+
+        key = (program, backend)
+        entry = self.lookup(key)
+        if entry is not None:
+            for line in entry.output:
+                write_output(line)
+            if entry.error is not None:
+                raise copy.copy(entry.error)
+            return entry.result
+
+        recorder = _RecordingSink(current_output())
+        token = set_output(recorder)
+        try:
+            result = backend(program, state)
+        except InterpError as e:
+            self.store(key, _Entry(None, recorder.lines, copy.copy(e)))
+            raise
+        finally:
+            reset_output(token)
+        self.store(key, _Entry(result, recorder.lines, None))
+        return result
@@ -0,0 +1,251 @@
+import os
+import struct
+from typing import Any, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import InterpError
+from stimpl.runtime import EmptyState, State
+from stimpl.iterative import Machine, APPLY_BINARY
+from stimpl.output import output_sink, reset_output, set_output
+from stimpl.rope import flatten, flatten_state
+from stimpl import serialize
+
+"""
+Checkpoints.
+
+A checkpoint is a snapshot of an iterative Machine between two steps,
+which is always a safe point: everything the machine will still do is in
+its work stack, its operand stack and its state. snapshot encodes that
+in a compact binary form and restore builds a Machine from it, in this or
+any other process, that continues exactly where the original stopped.
+
+Layout, all integers little-endian:
+
+    header      magic "STCK", u16 version, u16 reserved,
+                u64 steps, u32 program length
+    program     the program in the stimpl.serialize format
+    work        u32 count, then per item: u8 action, u32 argument
+    stack       u32 count, then a value per entry
+    state       u32 count, then per variable: a string name and a value
+
+Work items refer to nodes by their index in the serialized program
+(binary operators by their node kind) and use _NONE when they have no
+node. A value is a u8 type (its position in _TYPES) followed by its
+data: nothing for Unit, a u32 length and signed bytes for an integer, a
+double for a float, one byte for a boolean and a u32 length and UTF-8
+bytes for a string. The state is written out flat, one entry per live
+variable, however many assignments produced it.
+
+run_resumable runs a program with a checkpoint saved to a file every
+checkpoint_steps steps and picks up from that file if it exists, so a
+restarted worker continues a long job instead of starting again.
+"""
+
+MAGIC = b"STCK"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHQI")
+_COUNT = struct.Struct("<I")
+_WORK = struct.Struct("<BI")
+_FLOAT = struct.Struct("<d")
+_NONE = 0xFFFFFFFF
+
+_TYPES = (UNIT, INTEGER, FLOATING_POINT, STRING, BOOLEAN)
+_TYPE_CODES = {value_type: code for code, value_type in enumerate(_TYPES)}
+
+
+def _encode_value(value: Any, value_type: Type, out: List[bytes]) -> None:
+    code = _TYPE_CODES[value_type]
+    out.append(bytes((code,)))
+    if value_type is INTEGER:
+        data = value.to_bytes((value.bit_length() + 8) // 8, "little", signed=True)
+        out.append(_COUNT.pack(len(data)))
+        out.append(data)
+    elif value_type is FLOATING_POINT:
+        out.append(_FLOAT.pack(value))
+    elif value_type is BOOLEAN:
+        out.append(b"\x01" if value else b"\x00")
+    elif value_type is STRING:
+        _encode_string(value, out)
+
+
+def _encode_string(value: str, out: List[bytes]) -> None:
+    data = str(value).encode("utf-8", "surrogatepass")
+    out.append(_COUNT.pack(len(data)))
+    out.append(data)
+
+
+class _Reader(object):
+    def __init__(self, data: Any, position: int) -> None:
+        self.data = data
+        self.position = position
+
+    def take(self, size: int) -> bytes:
+        if self.position + size > len(self.data):
+            raise ValueError("Truncated STIMPL checkpoint")
+        chunk = bytes(self.data[self.position:self.position + size])
+        self.position += size
+        return chunk
+
+    def unpack(self, layout: struct.Struct) -> Tuple[Any, ...]:
+        return layout.unpack(self.take(layout.size))
+
+    def count(self) -> int:
+        return self.unpack(_COUNT)[0]
+
+    def string(self) -> str:
+        return self.take(self.count()).decode("utf-8", "surrogatepass")
+
+    def value(self) -> Tuple[Any, Type]:
+        code = self.take(1)[0]
+        if code >= len(_TYPES):
+            raise ValueError(f"Unknown value type {code} in STIMPL checkpoint")
+        value_type = _TYPES[code]
+        if value_type is INTEGER:
+            return (int.from_bytes(self.take(self.count()), "little", signed=True), value_type)
+        if value_type is FLOATING_POINT:
+            return (self.unpack(_FLOAT)[0], value_type)
+        if value_type is BOOLEAN:
+            return (self.take(1) != b"\x00", value_type)
+        if value_type is STRING:
+            return (self.string(), value_type)
+        return (None, value_type)
+
+
+'''
+Encodes the machine as a checkpoint. The machine must not be running.
+'''
+def snapshot(machine: Machine) -> bytes:
+    program, indices = serialize._encode(machine.program)
+    out = [_HEADER.pack(MAGIC, VERSION, 0, machine.steps, len(program)), program]
+
+    out.append(_COUNT.pack(len(machine.work)))
+    for action, node in machine.work:
+        if node is None:
+            argument = _NONE
+        elif action == APPLY_BINARY:
+            argument = serialize._kind(node)
+        else:
+            argument = indices[id(node)]
+        out.append(_WORK.pack(action, argument))
+
+    stack = machine.stack
+    out.append(_COUNT.pack(len(stack) // 2))
+    for position in range(0, len(stack), 2):
+        _encode_value(stack[position], stack[position + 1], out)
+
+    variables = sorted(machine.state.items())
+    out.append(_COUNT.pack(len(variables)))
+    for variable_name, (value, value_type) in variables:
+        _encode_string(variable_name, out)
+        _encode_value(value, value_type, out)
+    return b"".join(out)
+
+
+'''
+Builds a Machine from a checkpoint made by snapshot. Damaged data raises
+ValueError.
+'''
+def restore(data: Any) -> Machine:
+    if len(data) < _HEADER.size:
+        raise ValueError("Truncated STIMPL checkpoint")
+    magic, version, _, steps, program_length = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a STIMPL checkpoint")
+    if version != VERSION:
+        raise ValueError(f"Unsupported STIMPL checkpoint version {version}")
+    reader = _Reader(data, _HEADER.size)
+    nodes = serialize.ProgramImage(reader.take(program_length)).materialize_nodes()
+
+    work = []
+    for _ in range(reader.count()):
+        action, argument = reader.unpack(_WORK)
+        if argument == _NONE:
+            node = None
+        elif action == APPLY_BINARY:
+            if argument >= len(serialize._NODE_KINDS):
+                raise ValueError(f"Unknown node kind {argument} in STIMPL checkpoint")
+            node = serialize._NODE_KINDS[argument]
+        elif argument < len(nodes):
+            node = nodes[argument]
+        else:
+            raise ValueError(f"No node {argument} in the checkpointed program")
+        work.append((action, node))
+
+    stack = []
+    for _ in range(reader.count()):
+        stack.extend(reader.value())
+
+    state = EmptyState()
+    for _ in range(reader.count()):
+        variable_name = reader.string()
+        value, value_type = reader.value()
+        state = state.set_value(variable_name, value, value_type)
+    if reader.position != len(data):
+        raise ValueError("Trailing data in STIMPL checkpoint")
+
+    machine = Machine(nodes[-1], state)
+    machine.work = work
+    machine.stack = stack
+    machine.steps = steps
+    return machine
+
+
+def save_checkpoint(machine: Machine, path: str) -> None:
+    '''
+    Writes a checkpoint of machine to path, replacing any earlier one
+    atomically so that a crash never leaves a partial file behind.
+    '''
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(snapshot(machine))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path: str) -> Machine:
+    with open(path, "rb") as f:
+        return restore(f.read())
+
+
+'''
+Runs program like run_stimpl, saving a checkpoint to path every
+checkpoint_steps steps. If path already holds a checkpoint of the same
+program, the run resumes from it instead of starting over; output printed
+after that checkpoint was taken is printed again. The checkpoint is
+removed once the program finishes or raises an InterpError.
+'''
+def run_resumable(program: Expr, path: str, checkpoint_steps: int = 1000000,
+                  output: Any = None) -> Tuple[Optional[Any], Type, State]:
+    if os.path.exists(path):
+        machine = load_checkpoint(path)
+        if machine.program != program:
+            raise ValueError(f"The checkpoint in {path} is of a different program")
+    else:
+        machine = Machine(program, EmptyState())
+
+    sink = output_sink(output)
+    token = set_output(sink)
+    try:
+        while not machine.run(checkpoint_steps):
+            if sink is not None:
+                sink.flush()
+            save_checkpoint(machine, path)
+    except InterpError:
+        # Resuming would only raise the same error again.
+        _remove(path)
+        raise
+    finally:
+        reset_output(token)
+        if sink is not None:
+            sink.flush()
+    _remove(path)
+    value, value_type, state = machine.result()
+    return (flatten(value), value_type, flatten_state(state))
+
+
+def _remove(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,402 @@
+import operator
+from typing import Any, Callable, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.runtime import State
+from stimpl.loops import CountingLoop, counting_loop
+from stimpl.limits import check_variable_count, current_budget
+from stimpl import operators
+from stimpl.output import write_output
+from stimpl.typecheck import infer_types, typecheck
+from stimpl.resolve import Resolution, resolve
+
+"""
+Closure compiler.
+
+compile_stimpl walks a program once and turns every node into a specialized
+Python closure. Each closure takes a Frame and returns the same
+(value, type) pair as runtime.evaluate would for that node, so the
+structural match on node classes is paid once at compile time instead of on
+every visit. Variables are resolved to slots (see stimpl.resolve) and live
+in the Frame's flat arrays while the program runs; the final State is
+rebuilt from them at the end. Where the types of both operands are known at
+compile time the closure skips the runtime type checks altogether. Counting
+loops (see stimpl.loops) run as Python range loops, or in closed form when
+their body only accumulates integers.
+
+In checked mode the program is first run through typecheck and the
+compiler trusts its annotations, so every operation whose operand types
+were inferred runs without any type comparison. If the initial state
+contradicts the static types of the slots, the program is run from a
+version compiled without them.
+"""
+
+_LITERAL_TYPES = {
+    IntLiteral: INTEGER,
+    FloatingPointLiteral: FLOATING_POINT,
+    StringLiteral: STRING,
+    BooleanLiteral: BOOLEAN,
+}
+
+
+class Frame(object):
+    __slots__ = ("values", "types", "variables")
+
+    def __init__(self, values: List[Any], types: List[Any], variables: int) -> None:
+        self.values = values
+        self.types = types
+        # The number of variables assigned, including those of the initial
+        # state that the program never mentions.
+        self.variables = variables
+
+
+Code = Callable[[Frame], Tuple[Any, Type]]
+
+class CompiledProgram(object):
+    def __init__(self, program: Expr, resolution: Resolution, code: Code,
+                 fallback: Optional[Callable[[], 'CompiledProgram']] = None) -> None:
+        self.program = program
+        self.resolution = resolution
+        self.code = code
+        # Compiles the program without static variable types.
+        self.fallback = fallback
+        self.untyped = None
+
+    def __call__(self, state: State) -> Tuple[Optional[Any], Type, State]:
+        resolution = self.resolution
+        if not resolution.admits(state):
+            if self.untyped is None:
+                self.untyped = self.fallback()
+            return self.untyped(state)
+        values, types = resolution.load(state)
+        value, value_type = self.code(Frame(values, types, len(state)))
+        return (value, value_type, resolution.store(values, types, state))
+
+    def __repr__(self) -> str:
+        return repr(self.program)
+
+
+class Compiler(object):
+    def __init__(self, resolution: Resolution):
+        self.resolution = resolution
+        self.handlers = {
+            Ren: self.compile_ren,
+            IntLiteral: self.compile_literal,
+            FloatingPointLiteral: self.compile_literal,
+            StringLiteral: self.compile_literal,
+            BooleanLiteral: self.compile_literal,
+            Print: self.compile_print,
+            Sequence: self.compile_sequence,
+            Program: self.compile_sequence,
+            Variable: self.compile_variable,
+            Assign: self.compile_assign,
+            Not: self.compile_not,
+            If: self.compile_if,
+            While: self.compile_while,
+        }
+        for operator_class in operators.BINARY_OPERATORS:
+            self.handlers[operator_class] = self.compile_binary
+
+    def compile(self, expression: Expr) -> Code:
+        for cls in type(expression).__mro__:
+            handler = self.handlers.get(cls)
+            if handler is not None:
+                return handler(expression)
+        return self.compile_unhandled(expression)
+
+    '''
+    Returns the type class that expression is guaranteed to produce if
+    it evaluates without raising, or None if it depends on run time.
+    '''
+    def static_type(self, expression: Expr) -> Optional[type]:
+        return self.resolution.static_type(expression)
+
+    def compile_unhandled(self, expression: Expr) -> Code:
+        def run(frame):
+            raise InterpSyntaxError("Unhandled!")
+        return run
+
+    def compile_ren(self, expression: Ren) -> Code:
+        return lambda frame: (None, UNIT)
+
+    def compile_literal(self, expression: Literal) -> Code:
+        result = (expression.literal, _LITERAL_TYPES[type(expression)])
+        return lambda frame: result
+
+    def compile_print(self, expression: Print) -> Code:
+        to_print = self.compile(expression.to_print)
+
+        def run(frame):
+            value, value_type = to_print(frame)
+            write_output(operators.printable(value, value_type))
+            return (value, value_type)
+        return run
+
+    def compile_sequence(self, expression: Expr) -> Code:
+        exprs = tuple(self.compile(expr) for expr in expression.exprs)
+
+        if len(exprs) == 0:
+            return lambda frame: (None, UNIT)
+        if len(exprs) == 1:
+            return exprs[0]
+
+        def run(frame):
+            for expr in exprs:
+                result = expr(frame)
+            return result
+        return run
+
+    def compile_variable(self, expression: Variable) -> Code:
+        variable_name = expression.variable_name
+        slot = self.resolution.slots[variable_name]
+
+        def run(frame):
+            value_type = frame.types[slot]
+            if value_type is None:
+                raise operators.read_error(variable_name)
+            return (frame.values[slot], value_type)
+        return run
+
+    def compile_assign(self, expression: Assign) -> Code:
+        slot = self.resolution.slots[expression.variable.variable_name]
+        value_code = self.compile(expression.value)
+
+        variable_type = self.resolution.types[slot]
+        if variable_type is not None and variable_type is self.static_type(expression.value):
+            def run(frame):
+                value, value_type = value_code(frame)
+                types = frame.types
+                if types[slot] is None:
+                    frame.variables += 1
+                    check_variable_count(frame.variables)
+                frame.values[slot] = value
+                types[slot] = value_type
+                return (value, value_type)
+            return run
+
+        def run(frame):
+            value, value_type = value_code(frame)
+            types = frame.types
+            previous_type = types[slot]
+            if previous_type is None:
+                frame.variables += 1
+                check_variable_count(frame.variables)
+            elif previous_type is not value_type:
+                operators.check_assignment(previous_type, value_type)
+            frame.values[slot] = value
+            types[slot] = value_type
+            return (value, value_type)
+        return run
+
+    def compile_not(self, expression: Not) -> Code:
+        operand = self.compile(expression.expr)
+
+        if self.static_type(expression.expr) is Boolean:
+            def run(frame):
+                return (not operand(frame)[0], BOOLEAN)
+            return run
+
+        def run(frame):
+            value, value_type = operand(frame)
+            return operators.logical_not(value, value_type)
+        return run
+
+    def compile_binary(self, expression: BinaryOperator) -> Code:
+        left = self.compile(expression.left)
+        right = self.compile(expression.right)
+        operator_class = operators.binary_operator_class(expression)
+        apply = operators.BINARY_OPERATORS[operator_class]
+
+        left_type = self.static_type(expression.left)
+        right_type = self.static_type(expression.right)
+        if left_type is not None and left_type is right_type:
+            if operator_class is Divide and left_type in (Integer, FloatingPoint):
+                return self.compile_divide(left, right, left_type)
+            if (operator_class, left_type) in operators.FAST_BINARY_OPERATORS:
+                compute, result_type = operators.FAST_BINARY_OPERATORS[(operator_class, left_type)]
+                result_type = result_type or left_type()
+
+                def run(frame):
+                    left_value = left(frame)[0]
+                    return (compute(left_value, right(frame)[0]), result_type)
+                return run
+
+        guard = left_type or right_type
+        if guard is not None and (operator_class, guard) in operators.FAST_BINARY_OPERATORS:
+            # One operand type is known; check only the other one and fall
+            # back to the generic operator (and its errors) on a mismatch.
+            compute, result_type = operators.FAST_BINARY_OPERATORS[(operator_class, guard)]
+            result_type = result_type or guard()
+
+            def run(frame):
+                left_value, left_value_type = left(frame)
+                right_value, right_value_type = right(frame)
+                if left_value_type.__class__ is guard and right_value_type.__class__ is guard:
+                    return (compute(left_value, right_value), result_type)
+                return apply(left_value, left_value_type, right_value, right_value_type)
+            return run
+
+        def run(frame):
+            left_value, left_value_type = left(frame)
+            right_value, right_value_type = right(frame)
+            return apply(left_value, left_value_type, right_value, right_value_type)
+        return run
+
+    def compile_divide(self, left: Code, right: Code, operand_type: type) -> Code:
+        result_type = operand_type()
+        compute = operator.floordiv if operand_type is Integer else operator.truediv
+
+        def run(frame):
+            left_value = left(frame)[0]
+            right_value = right(frame)[0]
+            if right_value == 0:
+                raise InterpMathError(f"""Cannot Divide by 0""")
+            return (compute(left_value, right_value), result_type)
+        return run
+
+    def compile_if(self, expression: If) -> Code:
+        condition = self.compile(expression.condition)
+        true = self.compile(expression.true)
+        false = self.compile(expression.false)
+
+        if self.static_type(expression.condition) is Boolean:
+            def run(frame):
+                return true(frame) if condition(frame)[0] else false(frame)
+            return run
+
+        def run(frame):
+            condition_value, condition_type = condition(frame)
+            operators.check_if_condition(condition_type)
+            return true(frame) if condition_value else false(frame)
+        return run
+
+    def compile_while(self, expression: While) -> Code:
+        condition = self.compile(expression.condition)
+        body = self.compile(expression.body)
+
+        if self.static_type(expression.condition) is Boolean:
+            def run(frame):
+                budget = current_budget()
+                while condition(frame)[0]:
+                    if budget is not None:
+                        budget.charge()
+                    body(frame)
+                return (False, BOOLEAN)
+        else:
+            check = operators.check_while_condition
+
+            def run(frame):
+                condition_value, condition_type = condition(frame)
+                check(condition_type)
+                budget = current_budget()
+                while condition_value:
+                    if budget is not None:
+                        budget.charge()
+                    body(frame)
+                    condition_value, condition_type = condition(frame)
+                    check(condition_type)
+                return (condition_value, condition_type)
+
+        loop = counting_loop(expression)
+        if loop is not None:
+            return self.compile_counting_loop(loop, run)
+        return run
+
+    '''
+    Runs a counting loop as a range loop, or with its accumulations in
+    closed form. The counter and bound are only known to be integers when
+    the loop starts; otherwise the loop runs as an ordinary one through
+    general, which also raises whatever errors the loop would.
+    '''
+    def compile_counting_loop(self, loop: CountingLoop, general: Code) -> Code:
+        slots = self.resolution.slots
+        counter = slots[loop.counter]
+        step = loop.step
+        rest = self.compile(loop.rest) if loop.rest is not None else None
+        accumulations = loop.accumulations
+        if accumulations is not None:
+            accumulations = [(accumulation, slots[accumulation.variable_name])
+                             for accumulation in accumulations]
+        if type(loop.bound) is IntLiteral:
+            bound_value = loop.bound.literal
+            bound_slot = None
+        else:
+            bound_slot = slots[loop.bound.variable_name]
+
+        def run(frame):
+            values, types = frame.values, frame.types
+            if types[counter] is not INTEGER or \
+                    (bound_slot is not None and types[bound_slot] is not INTEGER):
+                return general(frame)
+            start = values[counter]
+            bound = bound_value if bound_slot is None else values[bound_slot]
+            count = loop.trip_count(start, bound)
+            if count == 0:
+                return (False, BOOLEAN)
+            budget = current_budget()
+            # Iterations run in bulk are charged up front. A loop the budget
+            # cannot cover runs one iteration at a time and stops where it
+            # would.
+            bulk = budget is None or budget.allows(count)
+
+            if bulk and accumulations is not None and \
+                    all(types[slot] is INTEGER for _, slot in accumulations):
+                if budget is not None:
+                    budget.charge(count)
+                for accumulation, slot in accumulations:
+                    values[slot] = accumulation.apply(values[slot], start, step, count)
+                values[counter] = start + step * count
+                return (False, BOOLEAN)
+
+            if rest is None:
+                if not bulk:
+                    return general(frame)
+                if budget is not None:
+                    budget.charge(count)
+                values[counter] = start + step * count
+                return (False, BOOLEAN)
+            for value in loop.counter_range(start, bound):
+                if budget is not None:
+                    budget.charge()
+                rest(frame)
+                values[counter] = value + step
+            return (False, BOOLEAN)
+        return run
+
+
+def _compile_untyped(program: Expr) -> CompiledProgram:
+    resolution = resolve(program, infer_types(program, variables=False))
+    return CompiledProgram(program, resolution, Compiler(resolution).compile(program))
+
+
+'''
+Compiles program to closures. With checked=True the program is type
+checked first (raising InterpTypeError before anything runs) and the
+inferred types are used to drop the runtime type checks.
+'''
+def compile_stimpl(program: Expr, checked: bool = False) -> CompiledProgram:
+    resolution = resolve(program, typecheck(program) if checked else None)
+    return CompiledProgram(program, resolution, Compiler(resolution).compile(program),
+                           lambda: _compile_untyped(program))
+
+
+'''
+Backend for run_stimpl that executes program through the closure
+compiler. program may be an Expr or an already compiled program.
+'''
+def run_compiled(program, state: State) -> Tuple[Optional[Any], Type, State]:
+    if not isinstance(program, CompiledProgram):
+        program = compile_stimpl(program)
+    return program(state)
+
+
+'''
+Backend for run_stimpl that type checks program ahead of time and then
+executes it without per-operation type checks.
+'''
+def run_checked(program, state: State) -> Tuple[Optional[Any], Type, State]:
+    if not isinstance(program, CompiledProgram):
+        program = compile_stimpl(program, checked=True)
+    return program(state)
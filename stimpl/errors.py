@@ -25,5 +25,20 @@ class InterpMathError(InterpError):
       error_msg = "InterpMathError"
     super().__init__(error_msg)
 
+class InterpLimitError(InterpError):
+  """
+  Raised when a run exceeds its Limits. steps is the number of loop
+  iterations that were started and elapsed the seconds since the run started.
+  """
+  def __init__(self, error_msg = None, steps = 0, elapsed = 0.0):
+    if error_msg == None:
+      error_msg = "InterpLimitError"
+    super().__init__(error_msg)
+    self.steps = steps
+    self.elapsed = elapsed
+
+  def __reduce__(self):
+    return (InterpLimitError, (self.args[0], self.steps, self.elapsed))
+
 def pretty_type(value):
   return f"{str(type(value).__name__)}"
@@ -5,8 +5,104 @@ Expressions
 
 
 class Expr(object):
-    def __init__(self):
-        pass
+    '''
+    Expressions compare and hash by structure: two nodes are equal when
+    they are of the same class and their fields are equal, whether or not
+    they are the same object. Floating-point literals compare by their
+    exact bits, so -0.0 and 0.0 differ and a NaN literal equals itself.
+    The hash is computed once and cached, so a node must not be changed
+    after it has been hashed or compared.
+    '''
+    __slots__ = ("_hash",)
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            pass
+        # Hash children before their parents, without recursing.
+        work = [self]
+        while work:
+            node = work[-1]
+            if hasattr(node, "_hash"):
+                work.pop()
+                continue
+            parts = _structure(node)
+            missing = [part for part in parts
+                       if isinstance(part, Expr) and not hasattr(part, "_hash")]
+            if missing:
+                work.extend(missing)
+                continue
+            work.pop()
+            node._hash = hash((type(node), *[part._hash if isinstance(part, Expr) else _atom_key(part)
+                                             for part in parts]))
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Expr):
+            return NotImplemented
+        work = [(self, other)]
+        while work:
+            left, right = work.pop()
+            if left is right:
+                continue
+            if type(left) is not type(right) or hash(left) != hash(right):
+                return False
+            left_parts = _structure(left)
+            right_parts = _structure(right)
+            if len(left_parts) != len(right_parts):
+                return False
+            for left_part, right_part in zip(left_parts, right_parts):
+                if isinstance(left_part, Expr):
+                    if not isinstance(right_part, Expr):
+                        return False
+                    work.append((left_part, right_part))
+                elif isinstance(right_part, Expr) or _atom_key(left_part) != _atom_key(right_part):
+                    return False
+        return True
+
+
+_FIELDS = {}
+
+
+def _fields(cls):
+    '''
+    Returns the names of the fields of an expression class, in constructor
+    order.
+    '''
+    fields = _FIELDS.get(cls)
+    if fields is None:
+        fields = []
+        for base in reversed(cls.__mro__):
+            slots = base.__dict__.get("__slots__", ())
+            fields.extend(name for name in ((slots,) if isinstance(slots, str) else slots)
+                          if name != "_hash")
+        fields = _FIELDS[cls] = tuple(fields)
+    return fields
+
+
+def _structure(expression):
+    '''
+    Returns the fields of expression flattened into a list: each tuple of
+    subexpressions is replaced by its length followed by its elements.
+    '''
+    parts = []
+    for name in _fields(type(expression)):
+        value = getattr(expression, name)
+        if isinstance(value, tuple):
+            parts.append(len(value))
+            parts.extend(value)
+        else:
+            parts.append(value)
+    return parts
+
+
+def _atom_key(value):
+    if type(value) is float:
+        return (float, value.hex())
+    return (type(value), value)
 
 
 """
@@ -15,8 +111,7 @@ Unit expression.
 
 
 class Ren(Expr):
-    def __init__(self):
-        pass
+    __slots__ = ()
 
     def __repr__(self):
         return f"Ren value"
@@ -28,6 +123,8 @@ Literal expressions.
 
 
 class Literal(Expr):
+    __slots__ = ("literal",)
+
     def __init__(self, literal):
         self.literal = literal
 
@@ -36,35 +133,43 @@ class Literal(Expr):
 
 
 class IntLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, literal):
-        if type(literal) != int:
+        if type(literal) is not int:
             raise InterpTypeError(
                 f"Integer literal cannot be {pretty_type(literal)}")
-        super().__init__(literal)
+        self.literal = literal
 
 
 class FloatingPointLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, literal):
-        if type(literal) != float:
+        if type(literal) is not float:
             raise InterpTypeError(
                 f"Floating-point literal cannot be {pretty_type(literal)}")
-        super().__init__(literal)
+        self.literal = literal
 
 
 class StringLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, literal):
-        if type(literal) != str:
+        if type(literal) is not str:
             raise InterpTypeError(
                 f"Integer literal cannot be {pretty_type(literal)}")
-        super().__init__(literal)
+        self.literal = literal
 
 
 class BooleanLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, literal):
-        if type(literal) != bool:
+        if type(literal) is not bool:
             raise InterpTypeError(
                 f"Boolean literal cannot be {pretty_type(literal)}")
-        super().__init__(literal)
+        self.literal = literal
 
 
 """
@@ -73,6 +178,8 @@ Variable Expression
 
 
 class Variable(Expr):
+    __slots__ = ("variable_name",)
+
     def __init__(self, variable_name):
         self.variable_name = variable_name
 
@@ -89,6 +196,8 @@ Operators
 
 
 class Assign(Expr):
+    __slots__ = ("variable", "value")
+
     def __init__(self, variable, value):
         if not isinstance(variable, Variable):
             raise InterpSyntaxError("Must assign to a variable.")
@@ -100,126 +209,116 @@ class Assign(Expr):
 
 
 class UnaryOperator(Expr):
-    def __init__(self):
-        super().__init__()
+    __slots__ = ()
 
 
 class Print(UnaryOperator):
+    __slots__ = ("to_print",)
+
     def __init__(self, to_print):
         self.to_print = to_print
-        super().__init__()
 
     def __repr__(self):
         return f"Print {self.to_print}"
 
 
 class Not(UnaryOperator):
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
-        super().__init__()
 
     def __repr__(self):
         return f"Not {self.expr}"
 
 
 class BinaryOperator(Expr):
+    __slots__ = ("left", "right")
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
-        super().__init__()
 
 
 class And(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} && {self.right}"
 
 
 class Or(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} || {self.right}"
 
 
 class Lt(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} < {self.right}"
 
 
 class Lte(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} <= {self.right}"
 
 
 class Gt(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} > {self.right}"
 
 
 class Gte(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} >= {self.right}"
 
 
 class Eq(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} == {self.right}"
 
 
 class Ne(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} != {self.right}"
 
 
 class Add(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} + {self.right}"
 
 
 class Subtract(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} - {self.right}"
 
 
 class Multiply(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} * {self.right}"
 
 
 class Divide(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.left} / {self.right}"
@@ -231,6 +330,8 @@ Combining forms.
 
 
 class Program(Expr):
+    __slots__ = ("exprs",)
+
     def __init__(self, *exprs):
         self.exprs = exprs
 
@@ -242,6 +343,8 @@ class Program(Expr):
 
 
 class Sequence(Expr):
+    __slots__ = ("exprs",)
+
     def __init__(self, *exprs):
         self.exprs = exprs
 
@@ -253,6 +356,8 @@ class Sequence(Expr):
 
 
 class If(Expr):
+    __slots__ = ("condition", "true", "false")
+
     def __init__(self, condition, true, false):
         self.condition = condition
         self.true = true
@@ -263,9 +368,122 @@ class If(Expr):
 
 
 class While(Expr):
+    __slots__ = ("condition", "body")
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
 
     def __repr__(self):
         return f"while ({self.condition}) {{ {self.body} }}"
+
+
+"""
+Traversal.
+"""
+
+
+def subexpressions(expression):
+    '''
+    Yields expression and every expression below it, without recursing.
+    '''
+    work = [expression]
+    while work:
+        node = work.pop()
+        yield node
+        match node:
+            case Assign(variable=variable, value=value):
+                work.append(value)
+            case Print(to_print=to_print):
+                work.append(to_print)
+            case Not(expr=expr):
+                work.append(expr)
+            case BinaryOperator(left=left, right=right):
+                work.extend((left, right))
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                work.extend(exprs)
+            case If(condition=condition, true=true, false=false):
+                work.extend((condition, true, false))
+            case While(condition=condition, body=body):
+                work.extend((condition, body))
+
+
+def assigned_variables(expression):
+    '''
+    Returns the names of the variables assigned anywhere in expression.
+    '''
+    return {node.variable.variable_name for node in subexpressions(expression)
+            if isinstance(node, Assign)}
+
+
+"""
+Hash-consing.
+"""
+
+
+def _rebuild(expression, parts):
+    '''
+    Returns expression with its fields replaced by parts (in the layout of
+    _structure), or expression itself if nothing changed.
+    '''
+    old_parts = _structure(expression)
+    if all(new is old for new, old in zip(parts, old_parts)):
+        return expression
+    arguments = []
+    position = 0
+    for name in _fields(type(expression)):
+        if isinstance(getattr(expression, name), tuple):
+            count = parts[position]
+            arguments.extend(parts[position + 1:position + 1 + count])
+            position += 1 + count
+        else:
+            arguments.append(parts[position])
+            position += 1
+    return type(expression)(*arguments)
+
+
+class HashConsing(object):
+    '''
+    A constructor mode that shares structurally equal nodes:
+
+        nodes = HashConsing()
+        square = nodes(Multiply, nodes(Variable, "x"), nodes(Variable, "x"))
+
+    builds a single Variable x used for both operands, and building the
+    same square again returns the same object. intern does the same for
+    a tree that was built the usual way.
+    '''
+    def __init__(self):
+        self.nodes = {}
+
+    def __call__(self, cls, *args):
+        return self.share(cls(*args))
+
+    def share(self, expression):
+        return self.nodes.setdefault(expression, expression)
+
+    def intern(self, expression):
+        shared = {}
+        work = [expression]
+        while work:
+            node = work[-1]
+            if id(node) in shared:
+                work.pop()
+                continue
+            parts = _structure(node)
+            missing = [part for part in parts if isinstance(part, Expr) and id(part) not in shared]
+            if missing:
+                work.extend(missing)
+                continue
+            work.pop()
+            parts = [shared[id(part)] if isinstance(part, Expr) else part for part in parts]
+            shared[id(node)] = self.share(_rebuild(node, parts))
+        return shared[id(expression)]
+
+
+def intern(expression):
+    '''
+    Returns a tree equal to expression in which structurally equal
+    subtrees are the same object.
+    '''
+    return HashConsing().intern(expression)
@@ -0,0 +1,322 @@
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.runtime import State, evaluate, run_stimpl
+
+"""
+Random programs and differential checking.
+
+A ProgramGenerator builds random programs from a seed, using every node
+class. Well-typed programs never raise InterpTypeError or
+InterpSyntaxError; they can still divide by zero. Ill-typed programs are
+well-typed programs with one or more faults injected: an operand, a
+condition or an assigned value of the wrong type, or a read of a
+variable that is never assigned. Whether a fault raises depends on
+whether the program reaches it.
+
+Every loop counts a fresh counter up to a trip count of at most
+max_trips, so programs always terminate. Strings grow by at most a
+literal per concatenation and integers are only multiplied by literals,
+so values stay small however many iterations run.
+
+differential_check runs programs through evaluate and through other
+backends and reports every program on which a backend's value, type,
+printed output, error class or final state differs from evaluate's.
+"""
+
+_TYPES = (UNIT, INTEGER, FLOATING_POINT, STRING, BOOLEAN)
+
+_INTEGERS = (0, 1, 2, 3, -1, -7, 10, 255, 2 ** 40, -2 ** 70)
+_FLOATS = (0.0, -0.0, 0.5, 1.5, -2.25, 3.0, 1e-300, 1e300, float("inf"))
+_STRINGS = ("", "a", "b", "ab", " ", "héllo", "0")
+
+_COMPARISONS = (Lt, Lte, Gt, Gte, Eq, Ne)
+
+
+class ProgramGenerator(object):
+    '''
+    Generates random programs. max_depth bounds the nesting of
+    expressions, max_statements the number of expressions in a Program or
+    Sequence, max_trips the number of iterations of each loop and
+    max_loop_nesting how deeply loops nest. With ill_typed=True every
+    program contains at least one type fault.
+    '''
+    def __init__(self, seed: Any = None, max_depth: int = 4, max_statements: int = 6,
+                 max_trips: int = 8, max_loop_nesting: int = 2, ill_typed: bool = False) -> None:
+        self.random = random.Random(seed)
+        self.max_depth = max_depth
+        self.max_statements = max_statements
+        self.max_trips = max_trips
+        self.max_loop_nesting = max_loop_nesting
+        self.ill_typed = ill_typed
+
+    def program(self) -> Program:
+        # The type of every variable created so far, the variables that
+        # are certainly assigned at this point, and the counters of the
+        # loops being generated, which nothing else may assign.
+        self.types: Dict[str, Type] = {}
+        self.defined: Set[str] = set()
+        self.counters: Set[str] = set()
+        self.loops = 0
+        self.faults = 0
+
+        exprs = [self.statement(self.max_depth)
+                 for _ in range(self.random.randint(1, self.max_statements))]
+        if self.ill_typed and self.faults == 0:
+            exprs.insert(self.random.randint(0, len(exprs)), self.fault(self.pick_type(), 1))
+        exprs.append(self.expression(self.pick_type(), self.max_depth))
+        return Program(*exprs)
+
+    def programs(self, count: int) -> List[Program]:
+        return [self.program() for _ in range(count)]
+
+    def pick_type(self) -> Type:
+        return self.random.choice(_TYPES)
+
+    def fresh_name(self) -> str:
+        return f"v{len(self.types)}"
+
+    def statement(self, depth: int) -> Expr:
+        return self.expression(self.pick_type(), depth)
+
+    def expression(self, expression_type: Type, depth: int) -> Expr:
+        if self.ill_typed and self.random.random() < 0.02:
+            return self.fault(expression_type, depth)
+        if depth <= 0 or self.random.random() < 0.2:
+            return self.leaf(expression_type)
+
+        choices = [self.assign, self.print, self.sequence, self.conditional]
+        if expression_type is INTEGER or expression_type is FLOATING_POINT:
+            choices += [self.arithmetic] * 4
+        elif expression_type is STRING:
+            choices += [self.concatenation] * 2
+        elif expression_type is BOOLEAN:
+            choices += [self.logical, self.logical, self.comparison, self.comparison]
+            if self.loops < self.max_loop_nesting:
+                choices.append(self.loop)
+        return self.random.choice(choices)(expression_type, depth - 1)
+
+    def leaf(self, expression_type: Type) -> Expr:
+        variables = [name for name in self.defined if self.types[name] is expression_type]
+        if variables and self.random.random() < 0.5:
+            return Variable(self.random.choice(sorted(variables)))
+        return self.literal(expression_type)
+
+    def literal(self, expression_type: Type) -> Expr:
+        if expression_type is INTEGER:
+            return IntLiteral(self.random.choice(_INTEGERS))
+        if expression_type is FLOATING_POINT:
+            return FloatingPointLiteral(self.random.choice(_FLOATS))
+        if expression_type is STRING:
+            return StringLiteral(self.random.choice(_STRINGS))
+        if expression_type is BOOLEAN:
+            return BooleanLiteral(self.random.random() < 0.5)
+        return Ren()
+
+    def assign(self, expression_type: Type, depth: int) -> Expr:
+        candidates = sorted(name for name, name_type in self.types.items()
+                            if name_type is expression_type and name not in self.counters)
+        if candidates and self.random.random() < 0.6:
+            name = self.random.choice(candidates)
+        else:
+            name = self.fresh_name()
+            self.types[name] = expression_type
+        # The variable is assigned only after its value is evaluated.
+        value = self.expression(expression_type, depth)
+        self.defined.add(name)
+        return Assign(Variable(name), value)
+
+    def print(self, expression_type: Type, depth: int) -> Expr:
+        return Print(self.expression(expression_type, depth))
+
+    def sequence(self, expression_type: Type, depth: int) -> Expr:
+        node_class = Sequence if self.random.random() < 0.8 else Program
+        if expression_type is UNIT and self.random.random() < 0.2:
+            # An empty Sequence is Unit.
+            return node_class()
+        exprs = [self.statement(depth) for _ in range(self.random.randint(0, self.max_statements // 2))]
+        exprs.append(self.expression(expression_type, depth))
+        return node_class(*exprs)
+
+    def conditional(self, expression_type: Type, depth: int) -> Expr:
+        condition = self.expression(BOOLEAN, depth)
+        before = set(self.defined)
+        true = self.expression(expression_type, depth)
+        after_true, self.defined = self.defined, set(before)
+        false = self.expression(expression_type, depth)
+        self.defined &= after_true
+        return If(condition, true, false)
+
+    def arithmetic(self, expression_type: Type, depth: int) -> Expr:
+        operator_class = self.random.choice((Add, Subtract, Multiply, Divide))
+        if operator_class is Multiply or (operator_class is Divide and self.random.random() < 0.7):
+            # Multiplying by literals only keeps integers from squaring
+            # themselves in loops; most divisors are literals so that not
+            # every division by a variable fails.
+            if operator_class is Multiply and self.random.random() < 0.5:
+                return Multiply(self.literal(expression_type), self.expression(expression_type, depth))
+            return operator_class(self.expression(expression_type, depth), self.literal(expression_type))
+        # Operands are generated in the order they run, so that a
+        # variable assigned in the left one can be read in the right one.
+        left = self.expression(expression_type, depth)
+        return operator_class(left, self.expression(expression_type, depth))
+
+    def concatenation(self, expression_type: Type, depth: int) -> Expr:
+        # One operand is a literal so no string more than a literal longer
+        # than an existing one is ever built.
+        if self.random.random() < 0.5:
+            return Add(self.expression(STRING, depth), self.literal(STRING))
+        return Add(self.literal(STRING), self.expression(STRING, depth))
+
+    def logical(self, expression_type: Type, depth: int) -> Expr:
+        operator_class = self.random.choice((And, Or, Not))
+        if operator_class is Not:
+            return Not(self.expression(BOOLEAN, depth))
+        return operator_class(self.expression(BOOLEAN, depth), self.expression(BOOLEAN, depth))
+
+    def comparison(self, expression_type: Type, depth: int) -> Expr:
+        operand_type = self.pick_type()
+        return self.random.choice(_COMPARISONS)(self.expression(operand_type, depth),
+                                                self.expression(operand_type, depth))
+
+    def loop(self, expression_type: Type, depth: int) -> Expr:
+        counter = self.fresh_name()
+        self.types[counter] = INTEGER
+        self.defined.add(counter)
+        self.counters.add(counter)
+        self.loops += 1
+        before = set(self.defined)
+        body = [self.statement(depth) for _ in range(self.random.randint(1, 3))]
+        # The body may not run at all.
+        self.defined = before
+        self.loops -= 1
+        self.counters.remove(counter)
+
+        variable = Variable(counter)
+        trips = self.random.randint(0, self.max_trips)
+        if self.random.random() < 0.5:
+            start, condition, step = 0, Lt(variable, IntLiteral(trips)), Add(variable, IntLiteral(1))
+        else:
+            start, condition, step = trips, Gt(variable, IntLiteral(0)), Subtract(variable, IntLiteral(1))
+        return Sequence(Assign(variable, IntLiteral(start)),
+                        While(condition, Sequence(*body, Assign(variable, step))))
+
+    def fault(self, expression_type: Type, depth: int) -> Expr:
+        '''
+        Returns an expression that raises a type or syntax error if it runs,
+        standing in for an expression of expression_type.
+        '''
+        self.faults += 1
+        kind = self.random.randrange(4)
+        if kind == 0:
+            # A read of a variable that is never assigned.
+            return Variable(f"undefined{self.faults}")
+        if kind == 1:
+            # An assignment that changes the type of a variable.
+            mismatched = sorted(name for name in self.defined
+                                if self.types[name] is not expression_type
+                                and name not in self.counters)
+            if mismatched:
+                return Assign(Variable(self.random.choice(mismatched)),
+                              self.expression(expression_type, depth - 1))
+        if kind == 2:
+            # A non-Boolean condition.
+            wrong = self.random.choice([t for t in _TYPES if t is not BOOLEAN])
+            if expression_type is BOOLEAN and self.random.random() < 0.5:
+                return While(self.literal(wrong), Ren())
+            return If(self.literal(wrong), self.literal(expression_type),
+                      self.literal(expression_type))
+        # An operator applied to operands of the wrong or mismatched types.
+        left_type = self.pick_type()
+        right_type = self.random.choice([t for t in _TYPES if t is not left_type])
+        operator_class = self.random.choice((Add, Subtract, Multiply, Divide, And, Or,
+                                             Lt, Lte, Gt, Gte, Eq))
+        return operator_class(self.expression(left_type, depth - 1),
+                              self.expression(right_type, depth - 1))
+
+
+def default_backends(ill_typed: bool = False) -> Dict[str, Callable]:
+    '''
+    The backends to check against evaluate. The checked backend rejects
+    ill-typed programs before they run, so it is left out for them.
+    '''
+    from stimpl.compiler import run_checked, run_compiled
+    from stimpl.iterative import evaluate_iterative
+    from stimpl.optimizer import run_optimized
+    from stimpl.vm import run_vm
+    backends = {"iterative": evaluate_iterative, "vm": run_vm, "compiled": run_compiled,
+                "optimized": run_optimized}
+    if not ill_typed:
+        backends["checked"] = run_checked
+    return backends
+
+
+def observe(program: Expr, backend: Optional[Callable] = None) -> Tuple[Any, ...]:
+    '''
+    Runs program and returns what differential_check compares: the repr
+    of its value (so that NaN equals itself), its type, the printed lines,
+    the class of the error it raised and its final state, as (name, value
+    repr, Python class of the value, type) for every variable, by name.
+    '''
+    lines = []
+    try:
+        value, value_type, state = run_stimpl(program, backend=backend, output=lines)
+    except Exception as e:
+        return (None, None, lines, type(e), None)
+    variables = [(variable_name, repr(variable_value), type(variable_value), variable_type)
+                 for variable_name, (variable_value, variable_type) in sorted(state.items())]
+    return (repr(value), value_type, lines, None, variables)
+
+
+class DifferentialReport(object):
+    def __init__(self, programs: int) -> None:
+        self.programs = programs
+        # (program, backend name, evaluate's observation, the backend's)
+        self.mismatches: List[Tuple[Expr, str, Tuple[Any, ...], Tuple[Any, ...]]] = []
+        # Seconds spent running all of the programs, per backend.
+        self.seconds: Dict[str, float] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.mismatches
+
+    def throughput(self) -> Dict[str, float]:
+        return {name: self.programs / seconds if seconds else float("inf")
+                for name, seconds in self.seconds.items()}
+
+    def summary(self) -> str:
+        lines = [f"{self.programs} programs, {len(self.mismatches)} mismatches"]
+        for name, programs_per_second in self.throughput().items():
+            lines.append(f"  {name:10} {self.seconds[name]:8.3f} s  "
+                         f"{programs_per_second:10,.0f} programs/s")
+        for program, name, expected, actual in self.mismatches[:10]:
+            lines.append(f"  {name}: expected {expected}, got {actual} for {program!r}")
+        return "\n".join(lines)
+
+
+'''
+Runs every program through evaluate and through each of backends (a
+dict of names to run_stimpl backends) and returns a DifferentialReport.
+'''
+def differential_check(programs: List[Expr], backends: Dict[str, Callable]) -> DifferentialReport:
+    report = DifferentialReport(len(programs))
+    expected = []
+    start = time.perf_counter()
+    for program in programs:
+        expected.append(observe(program, evaluate))
+    report.seconds["evaluate"] = time.perf_counter() - start
+
+    for name, backend in backends.items():
+        seconds = 0.0
+        for program, reference in zip(programs, expected):
+            start = time.perf_counter()
+            actual = observe(program, backend)
+            seconds += time.perf_counter() - start
+            if actual != reference:
+                report.mismatches.append((program, name, reference, actual))
+        report.seconds[name] = seconds
+    return report
@@ -0,0 +1,206 @@
+from typing import Any, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.runtime import State
+from stimpl import operators
+from stimpl.output import write_output
+from stimpl.limits import current_budget
+
+"""
+Iterative evaluator.
+
+A Machine evaluates a program with an explicit work stack instead of
+Python recursion, so neither the depth of the program nor the length of
+its loops is limited by the interpreter's recursion limit. Values are kept
+on an operand stack (a value followed by its type) and the state is
+threaded through the machine.
+
+Every work item is an (action, node) pair: EVAL expands node into more
+work, the other actions finish a node once its operands are on the stack.
+The machine can be run a bounded number of steps at a time.
+"""
+
+EVAL = 0
+APPLY_BINARY = 1
+APPLY_NOT = 2
+PRINT = 3
+ASSIGN = 4
+DISCARD = 5
+IF_BRANCH = 6
+WHILE_TEST = 7
+
+_LITERAL_TYPES = {
+    IntLiteral: INTEGER,
+    FloatingPointLiteral: FLOATING_POINT,
+    StringLiteral: STRING,
+    BooleanLiteral: BOOLEAN,
+}
+
+_NODE_CLASSES = (Ren, IntLiteral, FloatingPointLiteral, StringLiteral, BooleanLiteral,
+                 Print, Sequence, Program, Variable, Assign, Not, If, While,
+                 *operators.BINARY_OPERATORS)
+
+
+def _node_class(cls: type) -> Optional[type]:
+    """
+    Returns the node class evaluate would treat an instance of cls as.
+    """
+    for base in cls.__mro__:
+        if base in _NODE_CLASSES:
+            return base
+    return None
+
+
+class Machine(object):
+    def __init__(self, program: Expr, state: State) -> None:
+        self.program = program
+        self.state = state
+        self.work = [(EVAL, program)]
+        self.stack = []
+        self.steps = 0
+        self.node_classes = {}
+
+    @property
+    def finished(self) -> bool:
+        return not self.work
+
+    def result(self) -> Tuple[Optional[Any], Type, State]:
+        return (self.stack[-2], self.stack[-1], self.state)
+
+    '''
+    Runs at most max_steps work items (all of them if max_steps is None)
+    and returns whether the program has finished.
+    '''
+    def run(self, max_steps: Optional[int] = None) -> bool:
+        work = self.work
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        schedule = work.append
+        node_classes = self.node_classes
+        binary_operators = operators.BINARY_OPERATORS
+        fast_binary = operators.FAST_BINARY_OPERATORS
+        budget = current_budget()
+        state = self.state
+        remaining = start = -1 if max_steps is None else max_steps
+
+        try:
+            while work and remaining != 0:
+                remaining -= 1
+                action, node = work.pop()
+
+                if action == EVAL:
+                    cls = type(node)
+                    node_class = node_classes.get(cls)
+                    if node_class is None:
+                        node_class = node_classes[cls] = _node_class(cls)
+
+                    if node_class is Variable:
+                        value = state.get_value(node.variable_name)
+                        if value is None:
+                            raise operators.read_error(node.variable_name)
+                        push(value[0])
+                        push(value[1])
+                    elif node_class in _LITERAL_TYPES:
+                        push(node.literal)
+                        push(_LITERAL_TYPES[node_class])
+                    elif node_class in binary_operators:
+                        schedule((APPLY_BINARY, node_class))
+                        schedule((EVAL, node.right))
+                        schedule((EVAL, node.left))
+                    elif node_class is Assign:
+                        schedule((ASSIGN, node))
+                        schedule((EVAL, node.value))
+                    elif node_class is Sequence or node_class is Program:
+                        exprs = node.exprs
+                        if not exprs:
+                            push(None)
+                            push(UNIT)
+                        else:
+                            schedule((EVAL, exprs[-1]))
+                            for expr in reversed(exprs[:-1]):
+                                schedule((DISCARD, None))
+                                schedule((EVAL, expr))
+                    elif node_class is While:
+                        schedule((WHILE_TEST, node))
+                        schedule((EVAL, node.condition))
+                    elif node_class is If:
+                        schedule((IF_BRANCH, node))
+                        schedule((EVAL, node.condition))
+                    elif node_class is Print:
+                        schedule((PRINT, None))
+                        schedule((EVAL, node.to_print))
+                    elif node_class is Not:
+                        schedule((APPLY_NOT, None))
+                        schedule((EVAL, node.expr))
+                    elif node_class is Ren:
+                        push(None)
+                        push(UNIT)
+                    else:
+                        raise InterpSyntaxError("Unhandled!")
+
+                elif action == APPLY_BINARY:
+                    right_type = pop()
+                    right_value = pop()
+                    left_type = stack[-1]
+                    fast = None
+                    if left_type is right_type:
+                        fast = fast_binary.get((node, left_type.__class__))
+                    if fast is not None:
+                        compute, result_type = fast
+                        stack[-2] = compute(stack[-2], right_value)
+                        if result_type is not None:
+                            stack[-1] = result_type
+                    else:
+                        stack[-2], stack[-1] = binary_operators[node](
+                            stack[-2], left_type, right_value, right_type)
+
+                elif action == DISCARD:
+                    del stack[-2:]
+
+                elif action == ASSIGN:
+                    value_type = stack[-1]
+                    variable_name = node.variable.variable_name
+                    previous = state.get_value(variable_name)
+                    if previous is not None and previous[1] is not value_type:
+                        operators.check_assignment(previous[1], value_type)
+                    state = state.set_value(variable_name, stack[-2], value_type)
+
+                elif action == WHILE_TEST:
+                    operators.check_while_condition(stack[-1])
+                    if stack[-2]:
+                        del stack[-2:]
+                        if budget is not None:
+                            budget.charge()
+                        schedule((WHILE_TEST, node))
+                        schedule((EVAL, node.condition))
+                        schedule((DISCARD, None))
+                        schedule((EVAL, node.body))
+
+                elif action == IF_BRANCH:
+                    condition_type = pop()
+                    condition_value = pop()
+                    operators.check_if_condition(condition_type)
+                    schedule((EVAL, node.true if condition_value else node.false))
+
+                elif action == PRINT:
+                    write_output(operators.printable(stack[-2], stack[-1]))
+
+                elif action == APPLY_NOT:
+                    stack[-2], stack[-1] = operators.logical_not(stack[-2], stack[-1])
+        finally:
+            self.state = state
+            self.steps += start - remaining
+        return not work
+
+
+'''
+Backend for run_stimpl with the same contract as evaluate, but without
+recursing on the shape of the program.
+'''
+def evaluate_iterative(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State]:
+    machine = Machine(expression, state)
+    machine.run()
+    return machine.result()
@@ -0,0 +1,150 @@
+import time
+from contextvars import ContextVar
+from typing import Any, FrozenSet, Optional
+
+from stimpl.errors import InterpLimitError
+from stimpl.rope import concat
+
+"""
+Execution limits.
+
+A program run with Limits has a budget of loop iterations (steps), a
+wall-clock timeout, a maximum number of variables in its state and a
+maximum length for string values. Exceeding any of them raises an
+InterpLimitError that records how many steps ran and for how long.
+
+Loops are the only construct that can make a program run for longer than
+its size, so every backend charges one step per While iteration and
+nothing else; a program without loops pays only for reading the budget.
+The clock is read every _CLOCK_INTERVAL steps rather than on every one.
+Variable counts are checked only when a new variable is created and
+string lengths only when strings are concatenated. A backend that adds
+variables of its own for the run, such as the optimizer's temporaries,
+names them in uncounted_variables; those that are in the state are not
+counted, so the program's own variables get exactly max_variables.
+
+run_stimpl installs the Budget for the run in a context variable, the way
+it installs the output sink; backends fetch it with current_budget once
+per loop, not once per iteration.
+"""
+
+_CLOCK_INTERVAL = 64
+
+
+class Limits(object):
+    '''
+    Limits for a run; None means unlimited. timeout is in seconds from
+    the start of the run.
+    '''
+    def __init__(self, max_steps: Optional[int] = None, timeout: Optional[float] = None,
+                 max_variables: Optional[int] = None,
+                 max_string_length: Optional[int] = None) -> None:
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_variables = max_variables
+        self.max_string_length = max_string_length
+
+    def __repr__(self) -> str:
+        return (f"Limits(max_steps={self.max_steps}, timeout={self.timeout}, "
+                f"max_variables={self.max_variables}, "
+                f"max_string_length={self.max_string_length})")
+
+
+class Budget(object):
+    '''
+    What is left of the Limits of one run.
+    '''
+    def __init__(self, limits: Limits) -> None:
+        self.limits = limits
+        self.steps = 0
+        self.start = time.monotonic()
+        self.deadline = None if limits.timeout is None else self.start + limits.timeout
+        self.next_check = 0
+        self.uncounted_variables: FrozenSet[str] = frozenset()
+        self.schedule_check()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def schedule_check(self) -> None:
+        next_check = float("inf")
+        if self.limits.max_steps is not None:
+            next_check = self.limits.max_steps + 1
+        if self.deadline is not None:
+            next_check = min(next_check, self.steps + _CLOCK_INTERVAL)
+        self.next_check = next_check
+
+    def charge(self, steps: int = 1) -> None:
+        '''
+        Accounts for steps more loop iterations, before they run.
+        '''
+        self.steps += steps
+        if self.steps >= self.next_check:
+            self.check(steps)
+
+    def allows(self, steps: int) -> bool:
+        '''
+        Returns whether steps more loop iterations stay within max_steps.
+        '''
+        max_steps = self.limits.max_steps
+        return max_steps is None or self.steps + steps <= max_steps
+
+    def check(self, steps: int) -> None:
+        max_steps = self.limits.max_steps
+        if max_steps is not None and self.steps > max_steps:
+            self.steps -= steps
+            raise self.error(f"Exceeded the limit of {max_steps} steps")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.steps -= steps
+            raise self.error(f"Exceeded the timeout of {self.limits.timeout} seconds")
+        self.schedule_check()
+
+    def error(self, message: str) -> InterpLimitError:
+        elapsed = self.elapsed
+        return InterpLimitError(f"{message} after {self.steps} steps in {elapsed:.3f} seconds",
+                                self.steps, elapsed)
+
+
+_current_budget = ContextVar("stimpl_budget", default=None)
+
+
+def current_budget() -> Optional[Budget]:
+    return _current_budget.get()
+
+
+def set_budget(budget: Optional[Budget]):
+    """
+    Makes budget the budget of the current context; returns a token for
+    reset_budget.
+    """
+    return _current_budget.set(budget)
+
+
+def reset_budget(token) -> None:
+    _current_budget.reset(token)
+
+
+def check_variable_count(count: int, state: Any = None) -> None:
+    '''
+    Raises if count variables exceed the limit. When state is given, the
+    budget's uncounted variables that state holds are left out of count.
+    '''
+    budget = _current_budget.get()
+    if budget is not None and budget.limits.max_variables is not None and \
+            count > budget.limits.max_variables:
+        if state is not None:
+            count -= sum(1 for variable_name in budget.uncounted_variables
+                         if state.get_value(variable_name) is not None)
+        if count > budget.limits.max_variables:
+            raise budget.error(f"Exceeded the limit of {budget.limits.max_variables} variables")
+
+
+def concatenate(left: Any, right: Any) -> Any:
+    result = concat(left, right)
+    budget = _current_budget.get()
+    if budget is not None and budget.limits.max_string_length is not None and \
+            len(result) > budget.limits.max_string_length:
+        raise budget.error(
+            f"Exceeded the limit of {budget.limits.max_string_length} characters in a string")
+    return result
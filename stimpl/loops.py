@@ -0,0 +1,201 @@
+import math
+from typing import List, Optional, Tuple
+
+from stimpl.expression import *
+
+"""
+Counting loops.
+
+A counting loop is a While loop of the form
+
+    while (i < bound) { ...; i = i + step }
+
+where bound is an integer literal or a variable, step is a non-zero
+integer literal, the condition is one of <, <=, >, >= with the counter on
+the left (< and <= counting up, > and >= counting down) and nothing else
+in the loop assigns i or bound. Once i and bound are known to be integers
+the loop runs once for every element of a range, so it can be executed as
+a Python range loop without evaluating the condition or the increment.
+
+When every other statement of the body is an accumulation such as
+
+    total = total + (2 * i + 1)        product = product * i
+
+over integers, the whole loop reduces to one update per accumulator:
+sums of a linear function of i have a closed form and products are
+computed in bulk over a range.
+
+evaluate and the closure compiler run counting loops this way. The
+iterative evaluator, the VM and the profiler run every iteration, so the
+shortcuts are checked against them.
+"""
+
+
+class Accumulation(object):
+    '''
+    variable = variable <operator> (scale * i + offset), where operator is
+    Add, Subtract or Multiply.
+    '''
+    def __init__(self, variable_name: str, operator_class: type, scale: int, offset: int) -> None:
+        self.variable_name = variable_name
+        self.operator_class = operator_class
+        self.scale = scale
+        self.offset = offset
+
+    def apply(self, value: int, first: int, step: int, count: int) -> int:
+        '''
+        Returns the value of the accumulator after count iterations that
+        start from value with the counter at first.
+        '''
+        if self.operator_class is Multiply:
+            if self.scale == 0:
+                return value * self.offset ** count
+            start = self.scale * first + self.offset
+            return value * math.prod(range(start, start + self.scale * step * count,
+                                           self.scale * step))
+        # The sum of first, first + step, ... over count iterations.
+        counters = count * first + step * (count * (count - 1) // 2)
+        total = self.scale * counters + self.offset * count
+        return value + total if self.operator_class is Add else value - total
+
+
+class CountingLoop(object):
+    def __init__(self, counter: str, bound: Expr, stop_offset: int, step: int,
+                 rest: Optional[Expr], accumulations: Optional[List[Accumulation]]) -> None:
+        self.counter = counter
+        # An IntLiteral or a Variable.
+        self.bound = bound
+        # Added to the bound to get the (exclusive) end of the range.
+        self.stop_offset = stop_offset
+        self.step = step
+        # The body without the increment, or None if there is nothing else.
+        self.rest = rest
+        # The body as accumulations, or None if it is not only those.
+        self.accumulations = accumulations
+
+    def counter_range(self, start: int, bound: int) -> range:
+        return range(start, bound + self.stop_offset, self.step)
+
+    def trip_count(self, start: int, bound: int) -> int:
+        '''
+        Returns how many iterations the loop runs from start. Unlike
+        len(counter_range(...)) it works for any number of them.
+        '''
+        return max(0, -((start - bound - self.stop_offset) // self.step))
+
+
+# The offset from the bound to the end of the range, and the sign the step
+# must have, for each comparison.
+_COMPARISONS = {Lt: (0, 1), Lte: (1, 1), Gt: (0, -1), Gte: (-1, -1)}
+
+
+def _increment(expression: Expr, counter: str) -> Optional[int]:
+    '''
+    Returns step if expression is counter = counter + step (or
+    counter - step, giving -step) with a literal step, and None otherwise.
+    '''
+    match expression:
+        case Assign(variable=Variable(variable_name=name), value=value) if name == counter:
+            pass
+        case _:
+            return None
+    match value:
+        case Add(left=Variable(variable_name=name), right=IntLiteral(literal=step)) if name == counter:
+            return step
+        case Add(left=IntLiteral(literal=step), right=Variable(variable_name=name)) if name == counter:
+            return step
+        case Subtract(left=Variable(variable_name=name), right=IntLiteral(literal=step)) if name == counter:
+            return -step
+    return None
+
+
+def _linear(expression: Expr, counter: str) -> Optional[Tuple[int, int]]:
+    '''
+    Returns (scale, offset) if expression is scale * counter + offset built
+    from integer literals and the counter, and None otherwise.
+    '''
+    match expression:
+        case IntLiteral(literal=literal):
+            return (0, literal)
+        case Variable(variable_name=name) if name == counter:
+            return (1, 0)
+        case Add(left=left, right=right) | Subtract(left=left, right=right) | \
+                Multiply(left=left, right=right):
+            left = _linear(left, counter)
+            right = _linear(right, counter)
+            if left is None or right is None:
+                return None
+            if isinstance(expression, Add):
+                return (left[0] + right[0], left[1] + right[1])
+            if isinstance(expression, Subtract):
+                return (left[0] - right[0], left[1] - right[1])
+            if left[0] == 0:
+                return (left[1] * right[0], left[1] * right[1])
+            if right[0] == 0:
+                return (left[0] * right[1], left[1] * right[1])
+    return None
+
+
+def _accumulation(expression: Expr, counter: str) -> Optional[Accumulation]:
+    match expression:
+        case Assign(variable=Variable(variable_name=name), value=value) if name != counter:
+            pass
+        case _:
+            return None
+    if type(value) not in (Add, Subtract, Multiply):
+        return None
+    operands = [(value.left, value.right)]
+    if type(value) is not Subtract:
+        operands.append((value.right, value.left))
+    for accumulator, term in operands:
+        if type(accumulator) is Variable and accumulator.variable_name == name:
+            linear = _linear(term, counter)
+            if linear is not None:
+                return Accumulation(name, type(value), *linear)
+    return None
+
+
+'''
+Returns the CountingLoop that expression is, or None if it is not one.
+'''
+def counting_loop(expression: While) -> Optional[CountingLoop]:
+    condition = expression.condition
+    comparison = _COMPARISONS.get(type(condition))
+    if comparison is None or type(condition.left) is not Variable:
+        return None
+    counter = condition.left.variable_name
+    bound = condition.right
+    if type(bound) is Variable:
+        if bound.variable_name == counter:
+            return None
+    elif type(bound) is not IntLiteral:
+        return None
+
+    body = expression.body
+    statements = body.exprs if type(body) is Sequence else (body,)
+    if not statements:
+        return None
+    step = _increment(statements[-1], counter)
+    stop_offset, direction = comparison
+    if step is None or step * direction <= 0:
+        return None
+
+    others = statements[:-1]
+    assigned = set()
+    for statement in others:
+        assigned |= assigned_variables(statement)
+    if counter in assigned or (type(bound) is Variable and bound.variable_name in assigned):
+        return None
+
+    accumulations = [_accumulation(statement, counter) for statement in others]
+    names = [accumulation.variable_name for accumulation in accumulations if accumulation is not None]
+    if None in accumulations or len(set(names)) != len(names) or \
+            (type(bound) is Variable and bound.variable_name in names):
+        accumulations = None
+
+    rest = None
+    if len(others) == 1:
+        rest = others[0]
+    elif others:
+        rest = Sequence(*others)
+    return CountingLoop(counter, bound, stop_offset, step, rest, accumulations)
@@ -0,0 +1,230 @@
+import operator
+from typing import Any, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.limits import concatenate
+
+"""
+Operator semantics shared by the execution backends.
+
+Every function takes already-evaluated operands as value/type pairs and
+returns the (value, type) of the result. They raise the same errors, with
+the same messages, as the matching arm of runtime.evaluate so that every
+backend behaves identically.
+"""
+
+
+def add(left_value, left_type, right_value, right_type) -> Tuple[Any, Type]:
+    if left_type != right_type:
+        raise InterpTypeError(f"""Mismatched types for Add:
+            Cannot add {left_type} to {right_type}""")
+
+    match left_type:
+        case Integer() | FloatingPoint():
+            return (left_value + right_value, left_type)
+        case String():
+            return (concatenate(left_value, right_value), left_type)
+        case _:
+            raise InterpTypeError(f"""Cannot add {left_type}s""")
+
+
+def subtract(left_value, left_type, right_value, right_type) -> Tuple[Any, Type]:
+    if left_type != right_type:
+        raise InterpTypeError(f"""Mismatched types for Subtract:
+            Cannot subtract {left_type} to {right_type}""")
+
+    match left_type:
+        case Integer() | FloatingPoint():
+            return (left_value - right_value, left_type)
+        case _:
+            raise InterpTypeError(f"""Cannot subtract {left_type}s""")
+
+
+def multiply(left_value, left_type, right_value, right_type) -> Tuple[Any, Type]:
+    if left_type != right_type:
+        raise InterpTypeError(f"""Mismatched types for Multiply:
+            Cannot multiply {left_type} to {right_type}""")
+
+    match left_type:
+        case Integer() | FloatingPoint():
+            return (left_value * right_value, left_type)
+        case _:
+            raise InterpTypeError(f"""Cannot multiply {left_type}s""")
+
+
+def divide(left_value, left_type, right_value, right_type) -> Tuple[Any, Type]:
+    if left_type != right_type:
+        raise InterpTypeError(f"""Mismatched types for Divide:
+            Cannot divide {left_type} to {right_type}""")
+
+    if right_value == 0:
+        raise InterpMathError(f"""Cannot Divide by 0""")
+
+    match left_type:
+        case Integer():
+            return (left_value // right_value, left_type)
+        case FloatingPoint():
+            return (left_value / right_value, left_type)
+        case _:
+            raise InterpTypeError(f"""Cannot divide {left_type}s""")
+
+
+def logical_and(left_value, left_type, right_value, right_type) -> Tuple[Any, Type]:
+    if left_type != right_type:
+        raise InterpTypeError(f"""Mismatched types for And:
+            Cannot evaluate {left_type} and {right_type}""")
+
+    match left_type:
+        case Boolean():
+            return (left_value and right_value, left_type)
+        case _:
+            raise InterpTypeError(
+                "Cannot perform logical and on non-boolean operands.")
+
+
+def logical_or(left_value, left_type, right_value, right_type) -> Tuple[Any, Type]:
+    if left_type != right_type:
+        raise InterpTypeError(f"""Mismatched types for Or:
+            Cannot evaluate {left_type} or {right_type}""")
+
+    match left_type:
+        case Boolean():
+            return (left_value or right_value, left_type)
+        case _:
+            raise InterpTypeError(
+                "Cannot perform logical or on non-boolean operands.")
+
+
+def logical_not(value, value_type) -> Tuple[Any, Type]:
+    match value_type:
+        case Boolean():
+            return (not value, value_type)
+        case _:
+            raise InterpTypeError(
+                "Cannot perform logical not on non-boolean operands.")
+
+
+def _comparison(name, symbol, compare, unit_result):
+    def apply(left_value, left_type, right_value, right_type) -> Tuple[Any, Type]:
+        if left_type != right_type:
+            raise InterpTypeError(f"""Mismatched types for {name}:
+            Cannot compare {left_type} and {right_type}""")
+
+        match left_type:
+            case Integer() | Boolean() | String() | FloatingPoint():
+                return (compare(left_value, right_value), BOOLEAN)
+            case Unit():
+                return (unit_result, BOOLEAN)
+            case _:
+                raise InterpTypeError(
+                    f"Cannot perform {symbol} on {left_type} type.")
+    return apply
+
+
+less_than = _comparison("Lt", "<", lambda l, r: l < r, False)
+less_than_or_equal = _comparison("Lte", "<=", lambda l, r: l <= r, True)
+greater_than = _comparison("Gt", ">", lambda l, r: l > r, False)
+greater_than_or_equal = _comparison("Gte", ">=", lambda l, r: l >= r, True)
+# evaluate reports a mismatched Eq as Gte; keep the message identical.
+equal = _comparison("Gte", "==", lambda l, r: l == r, True)
+
+
+def not_equal(left_value, left_type, right_value, right_type) -> Tuple[Any, Type]:
+    # Unlike the other comparisons, Ne does not reject mismatched operands.
+    match left_type:
+        case Integer() | Boolean() | String() | FloatingPoint():
+            return (left_value != right_value, BOOLEAN)
+        case Unit():
+            return (False, BOOLEAN)
+        case _:
+            raise InterpTypeError(
+                f"Cannot perform != on {left_type} type.")
+
+
+def check_if_condition(condition_type) -> None:
+    match condition_type:
+        case Boolean():
+            pass
+        case _:
+            raise InterpTypeError(
+                "Cannot perform logical if on non-boolean operands.")
+
+
+def check_while_condition(condition_type) -> None:
+    match condition_type:
+        case Boolean():
+            pass
+        case _:
+            raise InterpTypeError("While loop requires a boolean condition.")
+
+
+def check_assignment(variable_type, value_type) -> None:
+    if value_type != variable_type and variable_type != None:
+        raise InterpTypeError(f"""Mismatched types for Assignment:
+            Cannot assign {value_type} to {variable_type}""")
+
+
+def read_error(variable_name) -> InterpSyntaxError:
+    return InterpSyntaxError(
+        f"Cannot read from {variable_name} before assignment.")
+
+
+def printable(value, value_type) -> str:
+    match value_type:
+        case Unit():
+            return "Unit"
+        case _:
+            return f"{value}"
+
+
+BINARY_OPERATORS = {
+    Add: add,
+    Subtract: subtract,
+    Multiply: multiply,
+    Divide: divide,
+    And: logical_and,
+    Or: logical_or,
+    Lt: less_than,
+    Lte: less_than_or_equal,
+    Gt: greater_than,
+    Gte: greater_than_or_equal,
+    Eq: equal,
+    Ne: not_equal,
+}
+
+
+def binary_operator_class(expression: BinaryOperator) -> Optional[type]:
+    """
+    Returns the operator class in BINARY_OPERATORS that expression is an
+    instance of, or None for an unknown binary operator.
+    """
+    for cls in type(expression).__mro__:
+        if cls in BINARY_OPERATORS:
+            return cls
+    return None
+
+
+"""
+Operators that can run without any checks once the (equal) type of both
+operands is known, keyed by operator class and operand type class. The
+value is the Python operator and the type of the result; None as a type
+means the result has the operand type.
+"""
+FAST_BINARY_OPERATORS = {
+    (Add, Integer): (operator.add, None),
+    (Add, FloatingPoint): (operator.add, None),
+    (Add, String): (concatenate, None),
+    (Subtract, Integer): (operator.sub, None),
+    (Subtract, FloatingPoint): (operator.sub, None),
+    (Multiply, Integer): (operator.mul, None),
+    (Multiply, FloatingPoint): (operator.mul, None),
+    (And, Boolean): (lambda l, r: l and r, None),
+    (Or, Boolean): (lambda l, r: l or r, None),
+}
+for _operator_class, _compare in ((Lt, operator.lt), (Lte, operator.le),
+                                  (Gt, operator.gt), (Gte, operator.ge),
+                                  (Eq, operator.eq), (Ne, operator.ne)):
+    for _type_class in (Integer, Boolean, String, FloatingPoint):
+        FAST_BINARY_OPERATORS[(_operator_class, _type_class)] = (_compare, BOOLEAN)
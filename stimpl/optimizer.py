@@ -0,0 +1,448 @@
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.runtime import EmptyState, State, evaluate
+from stimpl.limits import current_budget
+from stimpl.rope import flatten
+
+"""
+Program optimizer.
+
+optimize rewrites a program into an equivalent one that does less work at
+run time. Every pass preserves the value, type, printed output and errors
+of the original program, including where those errors are raised.
+
+Some passes keep values in temporary variables whose names start with $
+and that the program does not use. run_optimized runs the optimized
+program as a backend: the temporaries do not count against a
+max_variables limit and are removed from the final state, so only the
+speed of the run differs from evaluate's. Hoisting peels the first
+iteration off a loop, where no step is charged for it, so under Limits
+run_optimized leaves loops unpeeled.
+"""
+
+_LITERALS = (IntLiteral, FloatingPointLiteral, StringLiteral, BooleanLiteral)
+_CONSTANTS = _LITERALS + (Ren,)
+
+
+def _literal(value, value_type) -> Expr:
+    match value_type:
+        case Unit():
+            return Ren()
+        case Integer():
+            return IntLiteral(value)
+        case FloatingPoint():
+            return FloatingPointLiteral(value)
+        case String():
+            return StringLiteral(flatten(value))
+        case Boolean():
+            return BooleanLiteral(value)
+
+
+def _fold(expression: Expr) -> Expr:
+    '''
+    Replaces an operator whose operands are all constants by its result.
+    The operator is evaluated by evaluate itself so that folding cannot
+    disagree with the interpreter; operators that raise are kept as they
+    are so the error still happens when the program reaches them.
+    '''
+    try:
+        value, value_type, _ = evaluate(expression, EmptyState())
+    except InterpError:
+        return expression
+    return _literal(value, value_type)
+
+
+def _flatten(exprs) -> List[Expr]:
+    '''
+    Splices nested sequences into exprs and drops constants whose value is
+    thrown away. The value of the last expression is kept, so an empty
+    nested sequence in last position becomes a Ren.
+    '''
+    flattened = []
+    for index, expr in enumerate(exprs):
+        last = index == len(exprs) - 1
+        if isinstance(expr, (Sequence, Program)):
+            if expr.exprs:
+                flattened.extend(expr.exprs)
+            elif last:
+                flattened.append(Ren())
+        elif last or not isinstance(expr, _CONSTANTS):
+            flattened.append(expr)
+    return flattened
+
+
+def fold_constants(expression: Expr) -> Expr:
+    '''
+    Folds operators over literals, prunes If branches and While loops
+    whose conditions are literals and flattens nested sequences.
+    '''
+    match expression:
+        case Print(to_print=to_print):
+            return Print(fold_constants(to_print))
+
+        case Sequence(exprs=exprs) | Program(exprs=exprs):
+            exprs = _flatten([fold_constants(expr) for expr in exprs])
+            return type(expression)(*exprs)
+
+        case Assign(variable=variable, value=value):
+            return Assign(variable, fold_constants(value))
+
+        case Not(expr=expr):
+            expr = fold_constants(expr)
+            folded = Not(expr)
+            return _fold(folded) if isinstance(expr, _CONSTANTS) else folded
+
+        case BinaryOperator(left=left, right=right) if type(expression) is not BinaryOperator:
+            left = fold_constants(left)
+            right = fold_constants(right)
+            folded = type(expression)(left, right)
+            if isinstance(left, _CONSTANTS) and isinstance(right, _CONSTANTS):
+                return _fold(folded)
+            return folded
+
+        case If(condition=condition, true=true, false=false):
+            condition = fold_constants(condition)
+            true = fold_constants(true)
+            false = fold_constants(false)
+            if isinstance(condition, BooleanLiteral):
+                return true if condition.literal else false
+            return If(condition, true, false)
+
+        case While(condition=condition, body=body):
+            condition = fold_constants(condition)
+            if isinstance(condition, BooleanLiteral) and not condition.literal:
+                return BooleanLiteral(False)
+            return While(condition, fold_constants(body))
+
+        case _:
+            return expression
+
+
+def _variable_names(program: Expr) -> Set[str]:
+    return assigned_variables(program) | {node.variable_name for node in subexpressions(program)
+                                          if isinstance(node, Variable)}
+
+
+class _TemporaryPass(object):
+    '''
+    Shared parts of the passes that keep values in temporary variables.
+    '''
+    def __init__(self, program: Expr, prefix: str) -> None:
+        self.used_names = _variable_names(program)
+        self.prefix = prefix
+        self.temporaries: Dict[Expr, str] = {}
+        # Keyed by id; each entry keeps its expression alive so that the id
+        # cannot be reused by another node during the pass.
+        self.reads: Dict[int, Tuple[Expr, Optional[FrozenSet[str]]]] = {}
+
+    def pure_reads(self, expression: Expr) -> Optional[FrozenSet[str]]:
+        '''
+        Returns the variables expression reads if it is pure (built only
+        from literals, variables and operators, so evaluating it twice
+        with the same variables gives the same value or raises the same
+        error), or None if it is not.
+        '''
+        key = id(expression)
+        if key not in self.reads:
+            match expression:
+                case Variable(variable_name=variable_name):
+                    reads = frozenset([variable_name])
+                case Not(expr=expr):
+                    reads = self.pure_reads(expr)
+                case BinaryOperator(left=left, right=right) if type(expression) is not BinaryOperator:
+                    left = self.pure_reads(left)
+                    right = self.pure_reads(right)
+                    reads = None if left is None or right is None else left | right
+                case _:
+                    reads = frozenset() if isinstance(expression, _CONSTANTS) else None
+            self.reads[key] = (expression, reads)
+        return self.reads[key][1]
+
+    def is_pure_operator(self, expression: Expr) -> bool:
+        return isinstance(expression, (Not, BinaryOperator)) and self.pure_reads(expression) is not None
+
+    def temporary(self, expression: Expr) -> Variable:
+        if expression not in self.temporaries:
+            index = len(self.temporaries)
+            while f"{self.prefix}{index}" in self.used_names:
+                index += 1
+            self.used_names.add(f"{self.prefix}{index}")
+            self.temporaries[expression] = f"{self.prefix}{index}"
+        return Variable(self.temporaries[expression])
+
+
+class _CommonSubexpressions(_TemporaryPass):
+    '''
+    Walks a program in evaluation order keeping the pure operator
+    expressions that have certainly been evaluated, with nothing they
+    read assigned since. A later occurrence of one of them reads its
+    value from a temporary variable instead, and the earlier occurrence
+    that computes it is wrapped in an assignment to the temporary.
+
+    Which occurrences are reused is only known once the whole program has
+    been walked, so the program is walked twice: the first walk finds
+    them, the second rewrites the program.
+    '''
+    def __init__(self, program: Expr) -> None:
+        super().__init__(program, "$cse")
+        self.reused: Set[int] = set()
+        self.occurrences = 0
+
+    def run(self, program: Expr) -> Expr:
+        self.rewrite(program, {})
+        if not self.reused:
+            return program
+        self.occurrences = 0
+        return self.rewrite(program, {})
+
+    @staticmethod
+    def kill(available: Dict[Expr, Tuple[int, FrozenSet[str]]], names: Set[str]) -> None:
+        for expression, (_, variables) in list(available.items()):
+            if not variables.isdisjoint(names):
+                del available[expression]
+
+    def rewrite(self, expression: Expr, available: Dict[Expr, Tuple[int, FrozenSet[str]]]) -> Expr:
+        match expression:
+            case Not() | BinaryOperator() if self.is_pure_operator(expression):
+                if expression in available:
+                    occurrence, _ = available[expression]
+                    self.reused.add(occurrence)
+                    return self.temporary(expression)
+                if isinstance(expression, Not):
+                    rewritten = Not(self.rewrite(expression.expr, available))
+                else:
+                    left = self.rewrite(expression.left, available)
+                    right = self.rewrite(expression.right, available)
+                    rewritten = type(expression)(left, right)
+                occurrence = self.occurrences
+                self.occurrences += 1
+                available[expression] = (occurrence, self.pure_reads(expression))
+                if occurrence in self.reused:
+                    return Assign(self.temporary(expression), rewritten)
+                return rewritten
+
+            case Not(expr=expr):
+                return Not(self.rewrite(expr, available))
+
+            case BinaryOperator(left=left, right=right) if type(expression) is not BinaryOperator:
+                left = self.rewrite(left, available)
+                right = self.rewrite(right, available)
+                return type(expression)(left, right)
+
+            case Print(to_print=to_print):
+                return Print(self.rewrite(to_print, available))
+
+            case Assign(variable=variable, value=value):
+                value = self.rewrite(value, available)
+                self.kill(available, {variable.variable_name})
+                return Assign(variable, value)
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                return type(expression)(*[self.rewrite(expr, available) for expr in exprs])
+
+            case If(condition=condition, true=true, false=false):
+                condition = self.rewrite(condition, available)
+                # Only one branch runs, so neither can use what the other
+                # computes, and afterwards nothing either computes is known
+                # to be available.
+                true_rewritten = self.rewrite(true, dict(available))
+                false_rewritten = self.rewrite(false, dict(available))
+                self.kill(available, assigned_variables(true) | assigned_variables(false))
+                return If(condition, true_rewritten, false_rewritten)
+
+            case While(condition=condition, body=body):
+                # What the loop assigns is unknown from its second iteration
+                # on, and it may not run at all.
+                self.kill(available, assigned_variables(expression))
+                inside = dict(available)
+                condition = self.rewrite(condition, inside)
+                return While(condition, self.rewrite(body, inside))
+
+            case _:
+                return expression
+
+
+# Conditions whose root always produces a Boolean or raises, so testing
+# them with If instead of While cannot change the outcome.
+_BOOLEAN_ROOTS = (Lt, Lte, Gt, Gte, Eq, Ne, And, Or, Not, BooleanLiteral)
+
+# Peeling copies the loop, so loops bigger than this are left alone to
+# keep nested loops from growing the program exponentially.
+_MAX_PEELED_NODES = 10000
+
+
+class _LoopInvariants(_TemporaryPass):
+    '''
+    Computes the pure operator expressions that a loop never changes once
+    instead of on every iteration, by peeling off the first iteration:
+
+        while (c) { b }   =>   if (c1) { b1; while (c2) { b2 } } else { false }
+
+    In c1 and b1 each invariant is computed where it first certainly runs
+    and kept in a temporary, so it raises exactly when and where it did
+    before; c2 and b2 read the temporaries instead. Loops are peeled
+    innermost first.
+    '''
+    def __init__(self, program: Expr) -> None:
+        super().__init__(program, "$licm")
+
+    def is_invariant(self, expression: Expr, assigned: Set[str]) -> bool:
+        return self.is_pure_operator(expression) and self.pure_reads(expression).isdisjoint(assigned)
+
+    def hoist(self, expression: Expr) -> Expr:
+        match expression:
+            case Print(to_print=to_print):
+                return Print(self.hoist(to_print))
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                return type(expression)(*[self.hoist(expr) for expr in exprs])
+            case Assign(variable=variable, value=value):
+                return Assign(variable, self.hoist(value))
+            case Not(expr=expr):
+                return Not(self.hoist(expr))
+            case BinaryOperator(left=left, right=right) if type(expression) is not BinaryOperator:
+                return type(expression)(self.hoist(left), self.hoist(right))
+            case If(condition=condition, true=true, false=false):
+                return If(self.hoist(condition), self.hoist(true), self.hoist(false))
+            case While(condition=condition, body=body):
+                return self.peel(While(self.hoist(condition), self.hoist(body)))
+            case _:
+                return expression
+
+    def peel(self, loop: While) -> Expr:
+        if not isinstance(loop.condition, _BOOLEAN_ROOTS):
+            return loop
+        if sum(1 for _ in subexpressions(loop)) > _MAX_PEELED_NODES:
+            return loop
+        assigned = assigned_variables(loop)
+        defined = set()
+        condition = self.first_iteration(loop.condition, assigned, defined, True)
+        body = self.first_iteration(loop.body, assigned, defined, True)
+        if not defined:
+            return loop
+        rest = While(self.later_iterations(loop.condition, defined),
+                     self.later_iterations(loop.body, defined))
+        return If(condition, Sequence(body, rest), BooleanLiteral(False))
+
+    '''
+    Rewrites part of the first iteration of a loop. An invariant met where
+    it is certain to run (unconditional) is computed into its temporary
+    and added to defined; one that was defined earlier is read back.
+    '''
+    def first_iteration(self, expression: Expr, assigned: Set[str], defined: Set[Expr],
+                        unconditional: bool) -> Expr:
+        invariant = self.is_invariant(expression, assigned)
+        if invariant and expression in defined:
+            return self.temporary(expression)
+
+        match expression:
+            case Not(expr=expr):
+                rewritten = Not(self.first_iteration(expr, assigned, defined, unconditional))
+            case BinaryOperator(left=left, right=right) if type(expression) is not BinaryOperator:
+                left = self.first_iteration(left, assigned, defined, unconditional)
+                right = self.first_iteration(right, assigned, defined, unconditional)
+                rewritten = type(expression)(left, right)
+            case Print(to_print=to_print):
+                return Print(self.first_iteration(to_print, assigned, defined, unconditional))
+            case Assign(variable=variable, value=value):
+                return Assign(variable, self.first_iteration(value, assigned, defined, unconditional))
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                return type(expression)(*[self.first_iteration(expr, assigned, defined, unconditional)
+                                          for expr in exprs])
+            case If(condition=condition, true=true, false=false):
+                return If(self.first_iteration(condition, assigned, defined, unconditional),
+                          self.first_iteration(true, assigned, defined, False),
+                          self.first_iteration(false, assigned, defined, False))
+            case While(condition=condition, body=body):
+                return While(self.first_iteration(condition, assigned, defined, False),
+                             self.first_iteration(body, assigned, defined, False))
+            case _:
+                return expression
+
+        if invariant and unconditional:
+            defined.add(expression)
+            return Assign(self.temporary(expression), rewritten)
+        return rewritten
+
+    def later_iterations(self, expression: Expr, defined: Set[Expr]) -> Expr:
+        if expression in defined:
+            return self.temporary(expression)
+        match expression:
+            case Not(expr=expr):
+                return Not(self.later_iterations(expr, defined))
+            case BinaryOperator(left=left, right=right) if type(expression) is not BinaryOperator:
+                return type(expression)(self.later_iterations(left, defined),
+                                        self.later_iterations(right, defined))
+            case Print(to_print=to_print):
+                return Print(self.later_iterations(to_print, defined))
+            case Assign(variable=variable, value=value):
+                return Assign(variable, self.later_iterations(value, defined))
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                return type(expression)(*[self.later_iterations(expr, defined) for expr in exprs])
+            case If(condition=condition, true=true, false=false):
+                return If(self.later_iterations(condition, defined),
+                          self.later_iterations(true, defined),
+                          self.later_iterations(false, defined))
+            case While(condition=condition, body=body):
+                return While(self.later_iterations(condition, defined),
+                             self.later_iterations(body, defined))
+            case _:
+                return expression
+
+
+def hoist_loop_invariants(program: Expr) -> Expr:
+    '''
+    Moves pure operator expressions that do not depend on anything a
+    While loop assigns out of the loop's iterations. Their values are
+    held in variables named $licm0, $licm1, ... (skipping names the
+    program uses), which are left in the final state; run_optimized
+    removes them.
+    '''
+    return _LoopInvariants(program).hoist(program)
+
+
+def eliminate_common_subexpressions(program: Expr) -> Expr:
+    '''
+    Makes repeated pure expressions (operators over literals and
+    variables) compute their value once and reuse it while none of their
+    variables is assigned. Reused values are held in variables named
+    $cse0, $cse1, ... (skipping names the program uses), which are left
+    in the final state; run_optimized removes them.
+    '''
+    return _CommonSubexpressions(program).run(program)
+
+
+def optimize(program: Expr, hoist_invariants: bool = True) -> Expr:
+    program = fold_constants(program)
+    if hoist_invariants:
+        program = hoist_loop_invariants(program)
+    return eliminate_common_subexpressions(program)
+
+
+def run_optimized(program: Expr, state: State) -> Tuple[Optional[Any], Type, State]:
+    # The first iteration of a peeled loop runs outside any While, so it
+    # would not be charged a step; under a budget loops are not peeled.
+    budget = current_budget()
+    optimized = optimize(program, hoist_invariants=budget is None)
+    temporaries = _variable_names(optimized) - _variable_names(program)
+    if not temporaries:
+        return evaluate(optimized, state)
+    if any(state.get_value(variable_name) is not None for variable_name in temporaries):
+        # The optimizer only avoids the names the program uses.
+        return evaluate(program, state)
+
+    if budget is not None:
+        uncounted = budget.uncounted_variables
+        budget.uncounted_variables = uncounted | temporaries
+    try:
+        value, value_type, final_state = evaluate(optimized, state)
+        kept = EmptyState()
+        for variable_name, (variable_value, variable_type) in final_state.items():
+            if variable_name not in temporaries:
+                kept = kept.set_value(variable_name, variable_value, variable_type)
+    finally:
+        if budget is not None:
+            budget.uncounted_variables = uncounted
+    return (value, value_type, kept)
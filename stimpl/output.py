@@ -0,0 +1,116 @@
+import sys
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Any, List, Optional
+
+"""
+Program output.
+
+Print expressions hand their text to the output sink of the program that
+is running. run_stimpl installs the sink for the duration of a run and
+flushes it when the program finishes or raises. Without a sink, output
+goes straight to print() as it always has.
+"""
+
+
+class OutputSink(ABC):
+    '''
+    Where Print output goes. Subclasses receive every printed line, without
+    its newline, through write_line.
+    '''
+    @abstractmethod
+    def write_line(self, text: str) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+
+class StreamSink(OutputSink):
+    '''
+    Buffers lines and writes them to a file-like object in bulk.
+
+    buffer_size is the number of characters held before the buffer is
+    written out; None keeps everything until flush, so the whole output of
+    a program costs a single write. stream defaults to sys.stdout as it is
+    when the buffer is written.
+    '''
+    def __init__(self, stream: Any = None, buffer_size: Optional[int] = None) -> None:
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.lines = []
+        self.buffered = 0
+
+    def write_line(self, text: str) -> None:
+        self.lines.append(text)
+        if self.buffer_size is not None:
+            self.buffered += len(text) + 1
+            if self.buffered >= self.buffer_size:
+                self.flush()
+
+    def flush(self) -> None:
+        stream = self.stream if self.stream is not None else sys.stdout
+        if self.lines:
+            self.lines.append("")
+            stream.write("\n".join(self.lines))
+            self.lines.clear()
+            self.buffered = 0
+        stream.flush()
+
+
+class ListSink(OutputSink):
+    '''
+    Collects every printed line, without its newline, in lines.
+    '''
+    def __init__(self, lines: Optional[List[str]] = None) -> None:
+        self.lines = lines if lines is not None else []
+
+    def write_line(self, text: str) -> None:
+        self.lines.append(text)
+
+
+class NullSink(OutputSink):
+    def write_line(self, text: str) -> None:
+        pass
+
+
+def output_sink(output: Any) -> Optional[OutputSink]:
+    """
+    Turns the output argument of run_stimpl into a sink: a list collects
+    lines, a file-like object gets a fully buffered StreamSink and None
+    means unbuffered printing to stdout.
+    """
+    if output is None or isinstance(output, OutputSink):
+        return output
+    if isinstance(output, list):
+        return ListSink(output)
+    if hasattr(output, "write"):
+        return StreamSink(output)
+    raise TypeError(f"Cannot send program output to {type(output).__name__}")
+
+
+_current_sink = ContextVar("stimpl_output", default=None)
+
+
+def write_output(text: str) -> None:
+    sink = _current_sink.get()
+    if sink is None:
+        print(text)
+    else:
+        sink.write_line(text)
+
+
+def current_output() -> Optional[OutputSink]:
+    return _current_sink.get()
+
+
+def set_output(sink: Optional[OutputSink]):
+    """
+    Makes sink the output of the current context; returns a token for
+    reset_output.
+    """
+    return _current_sink.set(sink)
+
+
+def reset_output(token) -> None:
+    _current_sink.reset(token)
@@ -0,0 +1,166 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.runtime import State
+from stimpl.compiler import Code, CompiledProgram, Compiler
+from stimpl.resolve import Resolution, resolve
+from stimpl.typecheck import infer_types
+
+"""
+Execution profiler.
+
+A Profiler is a run_stimpl backend that runs the program through the
+closure compiler with every node wrapped in a timer:
+
+    profiler = Profiler()
+    run_stimpl(program, backend=profiler)
+    print(profiler.report())
+    profiler.write_collapsed("program.folded")
+
+Nodes are identified by their path from the root, so a node shared by two
+places in the tree is counted separately at each of them. The collapsed
+stack output (one "frame;frame;frame microseconds" line per node, weighted
+by self time) can be fed to flamegraph.pl or speedscope. Results
+accumulate over every run made with the same profiler.
+"""
+
+
+class NodeProfile(object):
+    def __init__(self, path: Tuple[str, ...], expression: Expr) -> None:
+        self.path = path
+        self.node_class = type(expression).__name__
+        self.calls = 0
+        self.total_time = 0.0
+        self.self_time = 0.0
+        # For While nodes, the profile of the loop body.
+        self.body = None
+
+    @property
+    def label(self) -> str:
+        return " > ".join(self.path)
+
+    @property
+    def iterations(self) -> Optional[int]:
+        return self.body.calls if self.body is not None else None
+
+
+def _frame(expression: Expr, index: int) -> str:
+    match expression:
+        case Variable(variable_name=variable_name):
+            name = f"Variable({variable_name})"
+        case Assign(variable=variable):
+            name = f"Assign({variable.variable_name})"
+        case _:
+            name = type(expression).__name__
+    return f"{name}@{index}"
+
+
+class ProfilingCompiler(Compiler):
+    def __init__(self, profiler: 'Profiler', resolution: Resolution) -> None:
+        super().__init__(resolution)
+        self.profiler = profiler
+        self.path = []
+        self.children = [0]
+
+    def compile(self, expression: Expr) -> Code:
+        index = self.children[-1]
+        self.children[-1] += 1
+        self.path.append(_frame(expression, index))
+        self.children.append(0)
+        try:
+            profile = self.profiler.node_profile(tuple(self.path), expression)
+            code = super().compile(expression)
+            if isinstance(expression, While):
+                profile.body = self.profiler.node_profile(
+                    tuple(self.path) + (_frame(expression.body, 1),), expression.body)
+        finally:
+            self.children.pop()
+            self.path.pop()
+        return self.instrument(code, profile)
+
+    def compile_counting_loop(self, loop, general: Code) -> Code:
+        # Profile the loop as written, iteration by iteration.
+        return general
+
+    def instrument(self, code: Code, profile: NodeProfile) -> Code:
+        clock = time.perf_counter
+        child_times = self.profiler.child_times
+
+        def run(frame):
+            child_times.append(0.0)
+            start = clock()
+            try:
+                return code(frame)
+            finally:
+                elapsed = clock() - start
+                profile.calls += 1
+                profile.total_time += elapsed
+                profile.self_time += elapsed - child_times.pop()
+                if child_times:
+                    child_times[-1] += elapsed
+        return run
+
+
+class Profiler(object):
+    def __init__(self) -> None:
+        self.nodes: Dict[Tuple[str, ...], NodeProfile] = {}
+        self.child_times: List[float] = []
+
+    def node_profile(self, path: Tuple[str, ...], expression: Expr) -> NodeProfile:
+        if path not in self.nodes:
+            self.nodes[path] = NodeProfile(path, expression)
+        return self.nodes[path]
+
+    def __call__(self, program: Expr, state: State) -> Tuple[Optional[Any], Type, State]:
+        resolution = resolve(program)
+        if not resolution.admits(state):
+            resolution = resolve(program, infer_types(program, variables=False))
+        code = ProfilingCompiler(self, resolution).compile(program)
+        self.child_times.clear()
+        return CompiledProgram(program, resolution, code)(state)
+
+    def by_class(self) -> Dict[str, Tuple[int, float]]:
+        """
+        Returns the number of evaluations and the total self time spent
+        in nodes of each class.
+        """
+        classes = {}
+        for node in self.nodes.values():
+            calls, self_time = classes.get(node.node_class, (0, 0.0))
+            classes[node.node_class] = (calls + node.calls, self_time + node.self_time)
+        return classes
+
+    def report(self, limit: Optional[int] = 20) -> str:
+        lines = ["Nodes by total time:",
+                 f"{'calls':>10} {'total ms':>10} {'self ms':>10}  node"]
+        nodes = sorted(self.nodes.values(), key=lambda node: node.total_time, reverse=True)
+        for node in nodes[:limit]:
+            lines.append(f"{node.calls:>10} {node.total_time * 1000:>10.3f} "
+                         f"{node.self_time * 1000:>10.3f}  {node.label}")
+
+        lines += ["", "Node classes by self time:",
+                  f"{'calls':>10} {'self ms':>10}  class"]
+        classes = sorted(self.by_class().items(), key=lambda item: item[1][1], reverse=True)
+        for node_class, (calls, self_time) in classes:
+            lines.append(f"{calls:>10} {self_time * 1000:>10.3f}  {node_class}")
+
+        loops = [node for node in self.nodes.values() if node.iterations is not None]
+        if loops:
+            lines += ["", "While loops:", f"{'runs':>10} {'iterations':>10}  node"]
+            for node in sorted(loops, key=lambda node: node.iterations, reverse=True):
+                lines.append(f"{node.calls:>10} {node.iterations:>10}  {node.label}")
+        return "\n".join(lines)
+
+    def collapsed(self) -> str:
+        lines = []
+        for node in self.nodes.values():
+            microseconds = round(node.self_time * 1000000)
+            if node.calls and microseconds > 0:
+                lines.append(f"{';'.join(node.path)} {microseconds}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w") as f:
+            f.write(self.collapsed())
@@ -0,0 +1,102 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.runtime import State
+from stimpl.typecheck import TypeAnnotations, infer_types
+
+"""
+Variable resolution.
+
+resolve gives every distinct variable name of a program a fixed slot
+number, so that a backend can keep variables in flat arrays indexed by
+slot instead of looking names up in the State. A backend loads the slots
+from the initial State, runs, and stores them back into a State at the
+end. Reading an unassigned slot raises the same InterpSyntaxError as
+reading an unassigned variable.
+
+Resolution also records the static type of each slot, where one is
+known. By default the types come from typecheck.infer_types: a slot is
+typed only if every assignment to it anywhere in the program produces the
+same type. The program relies on that only if the initial State agrees,
+which admits checks.
+"""
+
+
+def variable_names(program: Expr) -> List[str]:
+    '''
+    Returns the names of the variables that program reads or assigns, each
+    once, in the order subexpressions reaches them.
+    '''
+    names: Dict[str, None] = {}
+    for node in subexpressions(program):
+        match node:
+            case Variable(variable_name=variable_name):
+                names.setdefault(variable_name)
+            case Assign(variable=variable):
+                names.setdefault(variable.variable_name)
+    return list(names)
+
+
+class Resolution(object):
+    def __init__(self, names: List[str], types: List[Optional[type]],
+                 annotations: Optional[TypeAnnotations]) -> None:
+        # The variable name of each slot and the slot of each name.
+        self.names = names
+        self.slots = {name: slot for slot, name in enumerate(names)}
+        # The static type class of each slot, or None.
+        self.types = types
+        self.annotations = annotations
+
+    def static_type(self, expression: Expr) -> Optional[type]:
+        if self.annotations is None:
+            return None
+        return self.annotations.static_type(expression)
+
+    def admits(self, state: State) -> bool:
+        '''
+        Returns whether every variable of state with a slot holds a value of
+        the slot's static type.
+        '''
+        for variable_name, slot_type in zip(self.names, self.types):
+            if slot_type is not None:
+                initial = state.get_value(variable_name)
+                if initial is not None and initial[1].__class__ is not slot_type:
+                    return False
+        return True
+
+    def load(self, state: State) -> Tuple[List[Any], List[Any]]:
+        '''
+        Returns the value and the type of every slot in state, with None
+        for both where the variable is not assigned.
+        '''
+        values = []
+        types = []
+        for variable_name in self.names:
+            initial = state.get_value(variable_name)
+            values.append(initial[0] if initial is not None else None)
+            types.append(initial[1] if initial is not None else None)
+        return (values, types)
+
+    def store(self, values: List[Any], types: List[Any], state: State) -> State:
+        '''
+        Returns state with every assigned slot written back to it.
+        '''
+        for slot, variable_name in enumerate(self.names):
+            if types[slot] is not None:
+                state = state.set_value(variable_name, values[slot], types[slot])
+        return state
+
+
+'''
+Resolves the variables of program to slots. annotations defaults to
+infer_types(program); with typed=False no types are inferred at all,
+which also keeps resolution from recursing on the shape of the program.
+'''
+def resolve(program: Expr, annotations: Optional[TypeAnnotations] = None,
+            typed: bool = True) -> Resolution:
+    names = variable_names(program)
+    if not typed:
+        return Resolution(names, [None] * len(names), None)
+    if annotations is None:
+        annotations = infer_types(program)
+    return Resolution(names, [annotations.variable_types.get(name) for name in names], annotations)
@@ -0,0 +1,130 @@
+from typing import Any, List, Optional
+
+"""
+Rope string values.
+
+Concatenating two Python strs copies both, so a loop that builds a
+string one piece at a time takes time quadratic in its length. Once a
+concatenation would produce more than _CHUNK characters, concat returns
+a Rope instead: a list of chunks and a short tail. Appending to a Rope
+copies at most the tail and costs amortized O(1).
+
+Ropes stand in for strs wherever a STIMPL value is observed: they
+compare, hash, format and repr like the str they hold, and pickle as it.
+That str is joined the first time it is needed and then kept.
+run_stimpl and the other runners flatten the value of the program and
+the strings in its final State, so callers only ever receive strs.
+
+Only the left operand of a concatenation is cheap to extend. A loop
+that prepends to a string still copies it on every iteration.
+"""
+
+_CHUNK = 256
+
+
+class Rope(object):
+    __slots__ = ("_chunks", "_count", "_tail", "_length", "_flat")
+
+    def __init__(self, chunks: List[str], count: int, tail: str, length: int) -> None:
+        # The string is "".join(chunks[:count]) + tail. Ropes appended
+        # to one another share a chunks list; only a rope that ends at
+        # the end of the list may extend it in place.
+        self._chunks = chunks
+        self._count = count
+        self._tail = tail
+        self._length = length
+        self._flat: Optional[str] = None
+
+    def append(self, text: str) -> 'Rope':
+        length = self._length + len(text)
+        if len(self._tail) + len(text) <= _CHUNK:
+            return Rope(self._chunks, self._count, self._tail + text, length)
+        chunks = self._chunks
+        if len(chunks) != self._count:
+            # Another rope has already extended the list past this one.
+            chunks = chunks[:self._count]
+        chunks.append(self._tail)
+        return Rope(chunks, self._count + 1, text, length)
+
+    def __str__(self) -> str:
+        if self._flat is None:
+            parts = self._chunks[:self._count]
+            parts.append(self._tail)
+            self._flat = "".join(parts)
+            # Later appends start a list of their own.
+            self._chunks, self._count, self._tail = [self._flat], 1, ""
+        return self._flat
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, (str, Rope)):
+            return NotImplemented
+        return len(self) == len(other) and str(self) == str(other)
+
+    def __ne__(self, other: Any) -> bool:
+        if not isinstance(other, (str, Rope)):
+            return NotImplemented
+        return len(self) != len(other) or str(self) != str(other)
+
+    def __lt__(self, other: Any) -> bool:
+        if not isinstance(other, (str, Rope)):
+            return NotImplemented
+        return str(self) < str(other)
+
+    def __le__(self, other: Any) -> bool:
+        if not isinstance(other, (str, Rope)):
+            return NotImplemented
+        return str(self) <= str(other)
+
+    def __gt__(self, other: Any) -> bool:
+        if not isinstance(other, (str, Rope)):
+            return NotImplemented
+        return str(self) > str(other)
+
+    def __ge__(self, other: Any) -> bool:
+        if not isinstance(other, (str, Rope)):
+            return NotImplemented
+        return str(self) >= str(other)
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+    def __format__(self, format_spec: str) -> str:
+        return format(str(self), format_spec)
+
+    def __repr__(self) -> str:
+        return repr(str(self))
+
+    def __reduce__(self):
+        return (str, (str(self),))
+
+
+def concat(left: Any, right: Any) -> Any:
+    '''
+    Returns left followed by right, either of which may be a str or a
+    Rope.
+    '''
+    if type(left) is Rope:
+        return left.append(str(right))
+    if len(left) + len(right) <= _CHUNK:
+        return left + right
+    return Rope([], 0, left, len(left)).append(str(right))
+
+
+def flatten(value: Any) -> Any:
+    '''
+    Returns value, with a Rope replaced by its str.
+    '''
+    return str(value) if type(value) is Rope else value
+
+
+def flatten_state(state: Any) -> Any:
+    '''
+    Returns state with every Rope value replaced by its str.
+    '''
+    for variable_name, (value, value_type) in list(state.items()):
+        if type(value) is Rope:
+            state = state.set_value(variable_name, str(value), value_type)
+    return state
@@ -1,24 +1,138 @@
+import functools
 from typing import Any, Tuple, Optional
 
 
 from stimpl.expression import *
 from stimpl.types import *
 from stimpl.errors import *
+from stimpl.output import output_sink, reset_output, set_output, write_output
+from stimpl.limits import Budget, check_variable_count, concatenate, current_budget, reset_budget, set_budget
+from stimpl.rope import flatten, flatten_state
+from stimpl.loops import CountingLoop, counting_loop
 
 """
 Interpreter State
 """
 
+"""
+A State is a persistent (immutable) map from variable names to (value, type)
+pairs. It is stored as a hash array mapped trie so that reads are O(log32 n)
+and every set_value copies only the path to the changed entry, leaving older
+states untouched. Memory is proportional to the live variables, not to the
+number of assignments ever executed.
+
+The trie is keyed by hash(name), which Python salts per process, so a State
+pickles as its entries and rebuilds the trie when it is unpickled.
+"""
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_MASK = (1 << 64) - 1
+_MAX_SHIFT = 64
+
+
+class _BitmapNode(object):
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap, entries):
+        # Each entry is either a (name, name_hash, value) leaf or a child node.
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+class _CollisionNode(object):
+    __slots__ = ("entries",)
+
+    def __init__(self, entries):
+        # Leaves whose names have identical 64-bit hashes.
+        self.entries = entries
+
+
+_EMPTY_NODE = _BitmapNode(0, ())
+
+
+def _trie_get(node, name, name_hash):
+    shift = 0
+    while True:
+        if type(node) is _CollisionNode:
+            for leaf in node.entries:
+                if leaf[0] == name:
+                    return leaf[2]
+            return None
+        bit = 1 << ((name_hash >> shift) & _MASK)
+        if not node.bitmap & bit:
+            return None
+        entry = node.entries[(node.bitmap & (bit - 1)).bit_count()]
+        if type(entry) is tuple:
+            return entry[2] if entry[0] == name else None
+        node = entry
+        shift += _BITS
+
+
+def _trie_merge(leaf1, leaf2, shift):
+    if shift > _MAX_SHIFT:
+        return _CollisionNode((leaf1, leaf2))
+    index1 = (leaf1[1] >> shift) & _MASK
+    index2 = (leaf2[1] >> shift) & _MASK
+    if index1 == index2:
+        return _BitmapNode(1 << index1, (_trie_merge(leaf1, leaf2, shift + _BITS),))
+    entries = (leaf1, leaf2) if index1 < index2 else (leaf2, leaf1)
+    return _BitmapNode((1 << index1) | (1 << index2), entries)
+
+
+def _trie_set(node, leaf, shift):
+    """
+    Returns a copy of node with leaf inserted and whether the name was new.
+    """
+    name, name_hash, _ = leaf
+    if type(node) is _CollisionNode:
+        entries = tuple(e for e in node.entries if e[0] != name)
+        return (_CollisionNode(entries + (leaf,)), len(entries) == len(node.entries))
+
+    bit = 1 << ((name_hash >> shift) & _MASK)
+    index = (node.bitmap & (bit - 1)).bit_count()
+    if not node.bitmap & bit:
+        entries = node.entries[:index] + (leaf,) + node.entries[index:]
+        return (_BitmapNode(node.bitmap | bit, entries), True)
+
+    entry = node.entries[index]
+    if type(entry) is tuple:
+        if entry[0] == name:
+            new_entry, added = leaf, False
+        else:
+            new_entry, added = _trie_merge(entry, leaf, shift + _BITS), True
+    else:
+        new_entry, added = _trie_set(entry, leaf, shift + _BITS)
+    entries = node.entries[:index] + (new_entry,) + node.entries[index + 1:]
+    return (_BitmapNode(node.bitmap, entries), added)
+
+
+def _trie_leaves(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for entry in node.entries:
+            if type(entry) is tuple:
+                yield entry
+            else:
+                stack.append(entry)
+
 
 class State(object):
     def __init__(self, variable_name: str, variable_value: Expr, variable_type: Type, next_state: 'State') -> None:
-        self.variable_name = variable_name
-        self.value = (variable_value, variable_type)
-        self.next_state = next_state
+        leaf = (variable_name, hash(variable_name) & _HASH_MASK,
+                (variable_value, variable_type))
+        self._root, added = _trie_set(next_state._root, leaf, 0)
+        if added:
+            self._size = next_state._size + 1
+            check_variable_count(self._size, self)
+        else:
+            self._size = next_state._size
 
     def copy(self) -> 'State':
-        variable_value, variable_type = self.value
-        return State(self.variable_name, variable_value, variable_type, self.next_state)
+        state = EmptyState()
+        state._root, state._size = self._root, self._size
+        return state
 
     def set_value(self, variable_name, variable_value, variable_type):
         return State(variable_name, variable_value, variable_type, self)
@@ -28,35 +142,52 @@ class State(object):
 
     The paramater is a variable name
 
-    If the variable name given matches the variable name of the
-    current instance, return its stored value
-    Else call get value on the next state
+    Hashes the variable name and follows the matching branch of
+    the trie until it reaches the leaf for that name
 
-    Returns the value of the variable if found
+    Returns a tuple of the value and type of the variable if found,
+    None otherwise
     '''
     def get_value(self, variable_name) -> Any:
-        """ TODO: Implement. """
-        if variable_name == self.variable_name:
-            return self.value
-        else:
-            return self.next_state.get_value(variable_name)
+        return _trie_get(self._root, variable_name, hash(variable_name) & _HASH_MASK)
+
+    def items(self):
+        """
+        Yields (variable_name, (variable_value, variable_type)) for every
+        variable in the state, in no particular order.
+        """
+        for variable_name, _, value in _trie_leaves(self._root):
+            yield (variable_name, value)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __reduce__(self):
+        return (_restore_state, (list(self.items()),))
 
     def __repr__(self) -> str:
-        return f"{self.variable_name}: {self.value}, " + repr(self.next_state)
+        return "".join(f"{variable_name}: {value}, "
+                       for variable_name, value in sorted(self.items()))
 
 
 class EmptyState(State):
     def __init__(self):
-        pass
+        self._root = _EMPTY_NODE
+        self._size = 0
 
     def copy(self) -> 'EmptyState':
         return EmptyState()
 
-    def get_value(self, variable_name) -> None:
-        return None
- 
-    def __repr__(self) -> str:
-        return ""
+
+def _restore_state(items) -> State:
+    # Unpickling rehashes every name in this process and, like copy,
+    # restores a state without counting it against the variable limit.
+    state = EmptyState()
+    for variable_name, value in items:
+        leaf = (variable_name, hash(variable_name) & _HASH_MASK, value)
+        state._root, _ = _trie_set(state._root, leaf, 0)
+    state._size = len(items)
+    return state
 
 
 """
@@ -67,19 +198,19 @@ Main evaluation logic!
 def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State]:
     match expression:
         case Ren():
-            return (None, Unit(), state)
+            return (None, UNIT, state)
 
         case IntLiteral(literal=l):
-            return (l, Integer(), state)
+            return (l, INTEGER, state)
 
         case FloatingPointLiteral(literal=l):
-            return (l, FloatingPoint(), state)
+            return (l, FLOATING_POINT, state)
 
         case StringLiteral(literal=l):
-            return (l, String(), state)
+            return (l, STRING, state)
 
         case BooleanLiteral(literal=l):
-            return (l, Boolean(), state)
+            return (l, BOOLEAN, state)
 
         case Print(to_print=to_print):
             printable_value, printable_type, new_state = evaluate(
@@ -87,9 +218,9 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
 
             match printable_type:
                 case Unit():
-                    print("Unit")
+                    write_output("Unit")
                 case _:
-                    print(f"{printable_value}")
+                    write_output(f"{printable_value}")
 
             return (printable_value, printable_type, new_state)
 
@@ -107,7 +238,7 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
         case Sequence(exprs=exprs) | Program(exprs=exprs):
             """ TODO: Implement. """
             current_state = state
-            result_value, result_type = None, Unit()
+            result_value, result_type = None, UNIT
             for expr in exprs:
                 result_value, result_type, current_state = evaluate(expr, current_state)
             return (result_value, result_type, current_state)
@@ -146,8 +277,10 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
             Cannot add {left_type} to {right_type}""")
 
             match left_type:
-                case Integer() | String() | FloatingPoint():
+                case Integer() | FloatingPoint():
                     result = left_result + right_result
+                case String():
+                    result = concatenate(left_result, right_result)
                 case _:
                     raise InterpTypeError(f"""Cannot add {left_type}s""")
 
@@ -375,7 +508,7 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform < on {left_type} type.")
 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
             '''
             The inputs to the lte function are the
@@ -411,7 +544,7 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform <= on {left_type} type.")
                 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
             '''
             The inputs to the gt function are the
@@ -445,7 +578,7 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform > on {left_type} type.")
                 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
             '''
             The inputs to the gte function are the
@@ -479,7 +612,7 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform >= on {left_type} type.")
                 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
             '''
             The inputs to the eq function are the
@@ -513,7 +646,7 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform == on {left_type} type.")
                 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
             '''
             The inputs to the ne function are the
@@ -543,7 +676,7 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform != on {left_type} type.")
                 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
             '''
             The inputs to the while function are the
@@ -563,6 +696,12 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
             '''
         case While(condition=condition, body=body):
             """ TODO: Implement. """
+            loop = _counting_loop(expression)
+            if loop is not None:
+                counted = _run_counting_loop(loop, state)
+                if counted is not None:
+                    return counted
+
             cond_result, cond_type, new_state = evaluate(condition, state)
 
             match cond_type:
@@ -570,8 +709,11 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     result = cond_result
                 case _:
                     raise InterpTypeError("While loop requires a boolean condition.")
-                
+
+            budget = current_budget()
             while result:
+                if budget is not None:
+                    budget.charge()
                 body_result, body_type, new_state = evaluate(body, new_state)
                 cond_result, cond_type, new_state = evaluate(condition, new_state)
 
@@ -588,13 +730,103 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
     pass
 
 
-def run_stimpl(program, debug=False):
+# Loops are analysed once per distinct loop, not every time one starts.
+_counting_loop = functools.lru_cache(maxsize=1024)(counting_loop)
+
+
+'''
+Runs a counting loop (see stimpl.loops) as a range loop over its body
+without the increment, or with its accumulations in closed form.
+
+Returns None, leaving the loop to the ordinary path, unless the counter
+and bound hold integers when the loop starts; the ordinary path also
+raises whatever errors the loop would.
+'''
+def _run_counting_loop(loop: CountingLoop, state: State) -> Optional[Tuple[Any, Type, State]]:
+    counter = state.get_value(loop.counter)
+    if type(loop.bound) is IntLiteral:
+        bound = (loop.bound.literal, INTEGER)
+    else:
+        bound = state.get_value(loop.bound.variable_name)
+    if counter is None or bound is None or counter[1] is not INTEGER or bound[1] is not INTEGER:
+        return None
+    start, step = counter[0], loop.step
+    count = loop.trip_count(start, bound[0])
+    if count == 0:
+        return (False, BOOLEAN, state)
+    budget = current_budget()
+
+    # Iterations run in bulk are charged up front. A loop the budget
+    # cannot cover runs one iteration at a time and stops where it would.
+    bulk = budget is None or budget.allows(count)
+
+    if bulk and loop.accumulations is not None:
+        initial = [state.get_value(accumulation.variable_name) for accumulation in loop.accumulations]
+        if all(value is not None and value[1] is INTEGER for value in initial):
+            if budget is not None:
+                budget.charge(count)
+            for accumulation, (value, _) in zip(loop.accumulations, initial):
+                state = state.set_value(accumulation.variable_name,
+                                        accumulation.apply(value, start, step, count), INTEGER)
+            return (False, BOOLEAN, state.set_value(loop.counter, start + step * count, INTEGER))
+
+    if loop.rest is None:
+        if not bulk:
+            return None
+        if budget is not None:
+            budget.charge(count)
+        return (False, BOOLEAN, state.set_value(loop.counter, start + step * count, INTEGER))
+    for value in loop.counter_range(start, bound[0]):
+        if budget is not None:
+            budget.charge()
+        _, _, state = evaluate(loop.rest, state)
+        state = state.set_value(loop.counter, value + step, INTEGER)
+    return (False, BOOLEAN, state)
+
+
+'''
+Runs program from an empty state.
+
+backend is the function used to execute the program; it is called
+with the program and the initial state and must return the same
+(value, type, state) triple as evaluate, which is the default.
+
+output is where Print expressions write: an OutputSink, a list that
+collects the printed lines, or a file-like object that receives all of
+the output in one write. It is flushed when the program finishes or
+raises. By default every line is printed to stdout as it is produced.
+
+cache is an optional stimpl.cache.ResultCache; a program it has already
+run is not run again, its output and result are replayed instead.
+
+limits is an optional stimpl.limits.Limits bounding the loop iterations,
+time, variables and string lengths of the run; exceeding one raises
+InterpLimitError. Runs with limits never use the cache.
+'''
+def run_stimpl(program, debug=False, backend=None, output=None, cache=None, limits=None):
+    if backend is None:
+        backend = evaluate
     state = EmptyState()
-    program_value, program_type, program_state = evaluate(program, state)
+    sink = output_sink(output)
+    token = set_output(sink)
+    budget_token = set_budget(Budget(limits) if limits is not None else None)
+    try:
+        if cache is None or limits is not None:
+            program_value, program_type, program_state = backend(program, state)
+        else:
+            program_value, program_type, program_state = cache.run(program, backend, state)
+    finally:
+        reset_budget(budget_token)
+        reset_output(token)
+        if sink is not None:
+            sink.flush()
+
+    program_value = flatten(program_value)
+    program_state = flatten_state(program_state)
 
     if debug:
         print(f"program: {program}")
         print(f"final_value: ({program_value}, {program_type})")
         print(f"final_state: {program_state}")
 
-    return program_value, program_type, program_state
+    return program_value, program_type, program_state
\ No newline at end of file
@@ -0,0 +1,352 @@
+import mmap
+import struct
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from stimpl.expression import *
+
+"""
+Binary program format.
+
+A serialized program is a flat table of nodes in post-order, so every
+node's children come before it and the root is the last node. Layout,
+all integers little-endian:
+
+    header      magic "STPL", u16 version, u16 reserved,
+                u32 node count, u32 child count, u32 pool count
+    nodes       per node: u8 kind, u32 a, u32 b
+    children    u32 node index per child
+    pool        u32 offset per entry plus one end offset, then the bytes
+
+For literals and variables a is the index of the pool entry holding the
+literal or name (b is unused); for every other node a and b are the
+offset and length of its slice of the children array. Pool entries are
+deduplicated raw bytes: UTF-8 for strings and names, signed
+little-endian for integers, an IEEE double for floats and one byte for
+booleans. Nodes that are shared in the tree are written once and stay
+shared when loaded.
+
+A ProgramImage reads the format in place, from bytes or a memory-mapped
+file, and builds Expr objects only when asked to.
+"""
+
+MAGIC = b"STPL"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIII")
+_NODE = struct.Struct("<BII")
+_OFFSET = struct.Struct("<I")
+_FLOAT = struct.Struct("<d")
+
+# The position of a class in this tuple is its kind in the file; append
+# new node classes at the end and bump VERSION if the meaning changes.
+_NODE_KINDS = (Ren, IntLiteral, FloatingPointLiteral, StringLiteral, BooleanLiteral,
+               Variable, Assign, Print, Not,
+               And, Or, Lt, Lte, Gt, Gte, Eq, Ne, Add, Subtract, Multiply, Divide,
+               Program, Sequence, If, While)
+
+_KINDS = {cls: kind for kind, cls in enumerate(_NODE_KINDS)}
+
+_INT, _FLOATING_POINT, _STRING, _BOOLEAN, _VARIABLE = (
+    _KINDS[IntLiteral], _KINDS[FloatingPointLiteral], _KINDS[StringLiteral],
+    _KINDS[BooleanLiteral], _KINDS[Variable])
+
+_ARITY = {_KINDS[Ren]: 0, _KINDS[Assign]: 2, _KINDS[Print]: 1, _KINDS[Not]: 1,
+          _KINDS[If]: 3, _KINDS[While]: 2}
+for _cls in (And, Or, Lt, Lte, Gt, Gte, Eq, Ne, Add, Subtract, Multiply, Divide):
+    _ARITY[_KINDS[_cls]] = 2
+
+
+def _kind(cls: type) -> int:
+    for base in cls.__mro__:
+        kind = _KINDS.get(base)
+        if kind is not None:
+            return kind
+    raise TypeError(f"Cannot serialize {cls.__name__}")
+
+
+def _children(kind: int, expression: Expr) -> Tuple[Expr, ...]:
+    cls = _NODE_KINDS[kind]
+    if cls is Program or cls is Sequence:
+        return tuple(expression.exprs)
+    if cls is Assign:
+        return (expression.variable, expression.value)
+    if cls is Print:
+        return (expression.to_print,)
+    if cls is Not:
+        return (expression.expr,)
+    if cls is If:
+        return (expression.condition, expression.true, expression.false)
+    if cls is While:
+        return (expression.condition, expression.body)
+    if cls is Ren:
+        return ()
+    return (expression.left, expression.right)
+
+
+def _encode_literal(kind: int, expression: Expr) -> bytes:
+    if kind == _VARIABLE:
+        name = expression.variable_name
+        if type(name) is not str:
+            raise TypeError(f"Cannot serialize variable name {name!r}")
+        return name.encode("utf-8", "surrogatepass")
+    literal = expression.literal
+    if kind == _INT:
+        return literal.to_bytes((literal.bit_length() + 8) // 8, "little", signed=True)
+    if kind == _FLOATING_POINT:
+        return _FLOAT.pack(literal)
+    if kind == _STRING:
+        return literal.encode("utf-8", "surrogatepass")
+    return b"\x01" if literal else b"\x00"
+
+
+def _decode_literal(kind: int, data: bytes) -> Any:
+    if kind == _INT:
+        return int.from_bytes(data, "little", signed=True)
+    if kind == _FLOATING_POINT:
+        return _FLOAT.unpack(data)[0]
+    if kind == _BOOLEAN:
+        return data != b"\x00"
+    return data.decode("utf-8", "surrogatepass")
+
+
+def _encode(program: Expr) -> Tuple[bytes, Dict[int, int]]:
+    '''
+    Encodes program and returns the encoding together with the index of
+    every node in it, keyed by the node's id.
+    '''
+    nodes = []
+    children = []
+    pool = {}
+    indices = {}
+    work = [(program, False)]
+    while work:
+        expression, expanded = work.pop()
+        key = id(expression)
+        if key in indices:
+            continue
+        kind = _kind(type(expression))
+
+        if kind in (_INT, _FLOATING_POINT, _STRING, _BOOLEAN, _VARIABLE):
+            data = _encode_literal(kind, expression)
+            entry = pool.setdefault(data, len(pool))
+            nodes.append(_NODE.pack(kind, entry, 0))
+        elif not expanded:
+            work.append((expression, True))
+            for child in reversed(_children(kind, expression)):
+                if id(child) not in indices:
+                    work.append((child, False))
+            continue
+        else:
+            offset = len(children)
+            children.extend(indices[id(child)] for child in _children(kind, expression))
+            nodes.append(_NODE.pack(kind, offset, len(children) - offset))
+        indices[key] = len(nodes) - 1
+
+    offsets = []
+    position = 0
+    for data in pool:
+        offsets.append(position)
+        position += len(data)
+    offsets.append(position)
+
+    data = b"".join([
+        _HEADER.pack(MAGIC, VERSION, 0, len(nodes), len(children), len(pool)),
+        b"".join(nodes),
+        struct.pack(f"<{len(children)}I", *children),
+        struct.pack(f"<{len(offsets)}I", *offsets),
+        b"".join(pool),
+    ])
+    return data, indices
+
+
+'''
+Encodes program in the binary program format.
+'''
+def dumps(program: Expr) -> bytes:
+    return _encode(program)[0]
+
+
+def dump(program: Expr, file: BinaryIO) -> None:
+    file.write(dumps(program))
+
+
+class ProgramImage(object):
+    '''
+    A serialized program read in place. data is any buffer (bytes, a
+    memoryview or an mmap); nodes are decoded from it on demand.
+    '''
+    def __init__(self, data: Any) -> None:
+        if len(data) < _HEADER.size:
+            raise ValueError("Truncated STIMPL program image")
+        magic, version, _, node_count, child_count, pool_count = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a STIMPL program image")
+        if version != VERSION:
+            raise ValueError(f"Unsupported STIMPL program image version {version}")
+        if node_count == 0:
+            raise ValueError("STIMPL program image has no nodes")
+
+        self.data = data
+        self.node_count = node_count
+        self.child_count = child_count
+        self.pool_count = pool_count
+        self.nodes_offset = _HEADER.size
+        self.children_offset = self.nodes_offset + node_count * _NODE.size
+        self.offsets_offset = self.children_offset + child_count * _OFFSET.size
+        self.pool_offset = self.offsets_offset + (pool_count + 1) * _OFFSET.size
+        if len(data) < self.pool_offset:
+            raise ValueError("Truncated STIMPL program image")
+        self.mmap = None
+        self.program = None
+
+    def __len__(self) -> int:
+        return self.node_count
+
+    @property
+    def root(self) -> int:
+        return self.node_count - 1
+
+    def kind(self, index: int) -> type:
+        return _NODE_KINDS[self.record(index)[0]]
+
+    def record(self, index: int) -> Tuple[int, int, int]:
+        if not 0 <= index < self.node_count:
+            raise IndexError(f"No node {index} in a program of {self.node_count} nodes")
+        kind, a, b = _NODE.unpack_from(self.data, self.nodes_offset + index * _NODE.size)
+        if kind >= len(_NODE_KINDS):
+            raise ValueError(f"Unknown node kind {kind} at node {index}")
+        return kind, a, b
+
+    def children(self, index: int) -> Tuple[int, ...]:
+        kind, offset, count = self.record(index)
+        if kind in (_INT, _FLOATING_POINT, _STRING, _BOOLEAN, _VARIABLE):
+            return ()
+        if offset + count > self.child_count:
+            raise ValueError(f"Children of node {index} are out of range")
+        children = struct.unpack_from(f"<{count}I", self.data,
+                                      self.children_offset + offset * _OFFSET.size)
+        for child in children:
+            if child >= index:
+                raise ValueError(f"Node {index} refers forward to node {child}")
+        return children
+
+    def pool_entry(self, entry: int) -> bytes:
+        if entry >= self.pool_count:
+            raise ValueError(f"No pool entry {entry}")
+        start, end = struct.unpack_from("<II", self.data,
+                                        self.offsets_offset + entry * _OFFSET.size)
+        if start > end or self.pool_offset + end > len(self.data):
+            raise ValueError(f"Pool entry {entry} is out of range")
+        return bytes(self.data[self.pool_offset + start:self.pool_offset + end])
+
+    '''
+    Builds the Expr for node index (the root by default) and everything
+    below it, and nothing else.
+    '''
+    def materialize(self, index: Optional[int] = None) -> Expr:
+        if index is None:
+            if self.program is None:
+                self.program = self.materialize_all()
+            return self.program
+
+        needed = set()
+        work = [index]
+        while work:
+            node = work.pop()
+            if node not in needed:
+                needed.add(node)
+                work.extend(self.children(node))
+
+        built: Dict[int, Expr] = {}
+        # Children always precede their parents, so ascending order builds
+        # every node after the nodes it refers to.
+        for node in sorted(needed):
+            kind, a, _ = self.record(node)
+            cls = _NODE_KINDS[kind]
+            if kind == _VARIABLE:
+                built[node] = Variable(_decode_literal(kind, self.pool_entry(a)))
+            elif kind in (_INT, _FLOATING_POINT, _STRING, _BOOLEAN):
+                built[node] = cls(_decode_literal(kind, self.pool_entry(a)))
+            else:
+                children = [built[child] for child in self.children(node)]
+                arity = _ARITY.get(kind)
+                if arity is not None and arity != len(children):
+                    raise ValueError(f"{cls.__name__} node {node} has {len(children)} children")
+                built[node] = cls(*children)
+        return built[index]
+
+    def materialize_all(self) -> Expr:
+        return self.materialize_nodes()[-1]
+
+    def materialize_nodes(self) -> List[Expr]:
+        """
+        Builds the whole program, decoding each table in one pass, and
+        returns every node in file order (so the root is the last one).
+        """
+        data = self.data
+        records = _NODE.iter_unpack(data[self.nodes_offset:self.children_offset])
+        children = struct.unpack_from(f"<{self.child_count}I", data, self.children_offset)
+        offsets = struct.unpack_from(f"<{self.pool_count + 1}I", data, self.offsets_offset)
+        pool = data[self.pool_offset:]
+        if offsets[-1] > len(pool) or any(a > b for a, b in zip(offsets, offsets[1:])):
+            raise ValueError("Pool offsets are out of range")
+
+        built: List[Expr] = []
+        literals = (_INT, _FLOATING_POINT, _STRING, _BOOLEAN)
+        for node, (kind, a, b) in enumerate(records):
+            if kind >= len(_NODE_KINDS):
+                raise ValueError(f"Unknown node kind {kind} at node {node}")
+            cls = _NODE_KINDS[kind]
+            if kind == _VARIABLE or kind in literals:
+                if a >= self.pool_count:
+                    raise ValueError(f"No pool entry {a}")
+                literal = _decode_literal(kind, bytes(pool[offsets[a]:offsets[a + 1]]))
+                built.append(cls(literal))
+                continue
+            if a + b > self.child_count:
+                raise ValueError(f"Children of node {node} are out of range")
+            arity = _ARITY.get(kind)
+            if arity is not None and arity != b:
+                raise ValueError(f"{cls.__name__} node {node} has {b} children")
+            try:
+                built.append(cls(*[built[child] for child in children[a:a + b]]))
+            except IndexError:
+                raise ValueError(f"Node {node} refers forward to another node") from None
+        return built
+
+    def close(self) -> None:
+        if self.mmap is not None:
+            self.data = None
+            self.mmap.close()
+            self.mmap = None
+
+    def __enter__(self) -> 'ProgramImage':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def loads(data: Any) -> Expr:
+    return ProgramImage(data).materialize()
+
+
+def load(file: BinaryIO) -> Expr:
+    return loads(file.read())
+
+
+'''
+Maps the file at path into memory and returns a ProgramImage over it.
+Nothing is decoded until materialize is called; close the image (or use
+it as a context manager) to unmap the file.
+'''
+def open_image(path: str) -> ProgramImage:
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        image = ProgramImage(mapped)
+    except Exception:
+        mapped.close()
+        raise
+    image.mmap = mapped
+    return image
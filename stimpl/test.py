@@ -1,3 +1,6 @@
+import contextlib
+import io
+
 from stimpl.runtime import run_stimpl
 from stimpl.expression import *
 from stimpl.types import *
@@ -23,9 +26,9 @@ def check_equal(expected, actual):
         raise TestingError(expected, actual)
 
 
-def check_program_raises(raise_type, program):
+def check_program_raises(raise_type, program, backend=None):
     try:
-        run_stimpl(program)
+        run_stimpl(program, backend=backend)
     except Exception as e:
         # This is supposed to raise something
         # with the same type as `raise_type`.
@@ -47,247 +50,269 @@ def check_run_result(expected, actual):
                            (actual_value, actual_type))
 
 
-def run_stimpl_sanity_tests():
+def observe_run(program, backend=None):
+    """
+    Runs program and returns its value, type, printed output and the
+    class and message of the error it raised (or None).
+    """
+    output = io.StringIO()
+    value, value_type, error = None, None, None
+    with contextlib.redirect_stdout(output):
+        try:
+            value, value_type, _ = run_stimpl(program, backend=backend)
+        except InterpError as e:
+            error = (type(e), str(e))
+    return (value, value_type, output.getvalue(), error)
+
+
+def check_same_behavior(program, backend, reference=None):
+    check_equal(observe_run(program, reference), observe_run(program, backend))
+
+
+def run_stimpl_sanity_tests(backend=None):
+    def run(program):
+        return run_stimpl(program, backend=backend)
+
     try:
         # Mathematical Expressions (5 pts)
         program = Add(IntLiteral(10), IntLiteral(10))
-        check_run_result((20, Integer(), None), run_stimpl(program))
+        check_run_result((20, Integer(), None), run(program))
 
         program = Add(IntLiteral(20), IntLiteral(-10))
-        check_run_result((10, Integer(), None), run_stimpl(program))
+        check_run_result((10, Integer(), None), run(program))
 
         program = Add(FloatingPointLiteral(5.5), FloatingPointLiteral(2.0))
-        check_run_result((7.5, FloatingPoint(), None), run_stimpl(program))
+        check_run_result((7.5, FloatingPoint(), None), run(program))
 
         program = Subtract(IntLiteral(10), IntLiteral(10))
-        check_run_result((0, Integer(), None), run_stimpl(program))
+        check_run_result((0, Integer(), None), run(program))
 
         program = Subtract(IntLiteral(10), IntLiteral(20))
-        check_run_result((-10, Integer(), None), run_stimpl(program))
+        check_run_result((-10, Integer(), None), run(program))
 
         program = Subtract(FloatingPointLiteral(5.5),
                            FloatingPointLiteral(2.0))
-        check_run_result((3.5, FloatingPoint(), None), run_stimpl(program))
+        check_run_result((3.5, FloatingPoint(), None), run(program))
 
         program = Multiply(IntLiteral(10), IntLiteral(10))
-        check_run_result((100, Integer(), None), run_stimpl(program))
+        check_run_result((100, Integer(), None), run(program))
 
         program = Multiply(FloatingPointLiteral(5.5),
                            FloatingPointLiteral(2.0))
-        check_run_result((11.0, FloatingPoint(), None), run_stimpl(program))
+        check_run_result((11.0, FloatingPoint(), None), run(program))
 
         program = Divide(IntLiteral(10), IntLiteral(10))
-        check_run_result((1, Integer(), None), run_stimpl(program))
+        check_run_result((1, Integer(), None), run(program))
 
         program = Divide(FloatingPointLiteral(
             10.0), FloatingPointLiteral(20.0))
-        check_run_result((0.5, FloatingPoint(), None), run_stimpl(program))
+        check_run_result((0.5, FloatingPoint(), None), run(program))
 
         # Mathematical Expression Errors (5 pts)
         program = Add(FloatingPointLiteral(1.0), IntLiteral(1))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Add(IntLiteral(1), FloatingPointLiteral(1.0))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Add(BooleanLiteral(True), BooleanLiteral(True))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Add(Ren(), Ren())
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         program = Subtract(FloatingPointLiteral(1.0), IntLiteral(1))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Subtract(IntLiteral(1), FloatingPointLiteral(1.0))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Subtract(BooleanLiteral(True), BooleanLiteral(True))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Subtract(Ren(), Ren())
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         program = Multiply(FloatingPointLiteral(1.0), IntLiteral(1))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Multiply(IntLiteral(1), FloatingPointLiteral(1.0))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Multiply(BooleanLiteral(True), BooleanLiteral(True))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Multiply(Ren(), Ren())
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         program = Divide(FloatingPointLiteral(1.0), IntLiteral(1))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Divide(IntLiteral(1), FloatingPointLiteral(1.0))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Divide(BooleanLiteral(True), BooleanLiteral(True))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Divide(Ren(), Ren())
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         program = Divide(IntLiteral(1), IntLiteral(0))
-        check_program_raises(InterpMathError(), program)
+        check_program_raises(InterpMathError(), program, backend)
         program = Divide(FloatingPointLiteral(1.0), FloatingPointLiteral(0.0))
-        check_program_raises(InterpMathError(), program)
+        check_program_raises(InterpMathError(), program, backend)
 
         # String concatenation (5 pts)
         program = Add(StringLiteral("Hello"), StringLiteral(", World"))
-        check_run_result(("Hello, World", String(), None), run_stimpl(program))
+        check_run_result(("Hello, World", String(), None), run(program))
 
         # String concatenation errors (5 pts)
         program = Subtract(StringLiteral("Hello"), StringLiteral(", World"))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         program = Multiply(StringLiteral("Hello"), StringLiteral(", World"))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         program = Divide(StringLiteral("Hello"), StringLiteral(", World"))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         # Boolean/Relational Expressions (5 pts)
         program = And(BooleanLiteral(True), BooleanLiteral(True))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = And(BooleanLiteral(True), BooleanLiteral(False))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = And(BooleanLiteral(False), BooleanLiteral(False))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = And(BooleanLiteral(False), BooleanLiteral(True))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
 
         program = Or(BooleanLiteral(True), BooleanLiteral(True))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Or(BooleanLiteral(True), BooleanLiteral(False))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Or(BooleanLiteral(False), BooleanLiteral(False))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Or(BooleanLiteral(False), BooleanLiteral(True))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
 
         program = Not(BooleanLiteral(True))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Not(BooleanLiteral(False))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
 
         program = Lt(Ren(), Ren())
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Lt(BooleanLiteral(False), BooleanLiteral(True))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Lt(IntLiteral(10), IntLiteral(12))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Lt(FloatingPointLiteral(10.0), FloatingPointLiteral(12.0))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Lt(StringLiteral("alpha"), StringLiteral("beta"))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
 
         program = Lte(Ren(), Ren())
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Lte(BooleanLiteral(True), BooleanLiteral(True))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Lte(IntLiteral(12), IntLiteral(12))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Lte(FloatingPointLiteral(12.0), FloatingPointLiteral(12.0))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Lte(StringLiteral("beta"), StringLiteral("beta"))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
 
         program = Eq(Ren(), Ren())
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Eq(BooleanLiteral(True), BooleanLiteral(True))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Eq(IntLiteral(12), IntLiteral(12))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Eq(FloatingPointLiteral(12.0), FloatingPointLiteral(12.0))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Eq(StringLiteral("beta"), StringLiteral("beta"))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
 
         program = Ne(Ren(), Ren())
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Ne(BooleanLiteral(True), BooleanLiteral(True))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Ne(IntLiteral(12), IntLiteral(12))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Ne(FloatingPointLiteral(12.0), FloatingPointLiteral(12.0))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Ne(StringLiteral("beta"), StringLiteral("beta"))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
 
         program = Gt(Ren(), Ren())
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Gt(BooleanLiteral(False), BooleanLiteral(True))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Gt(IntLiteral(10), IntLiteral(12))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Gt(FloatingPointLiteral(10.0), FloatingPointLiteral(12.0))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
         program = Gt(StringLiteral("alpha"), StringLiteral("beta"))
-        check_run_result((False, Boolean(), None), run_stimpl(program))
+        check_run_result((False, Boolean(), None), run(program))
 
         program = Gte(Ren(), Ren())
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Gte(BooleanLiteral(True), BooleanLiteral(True))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Gte(IntLiteral(12), IntLiteral(12))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Gte(FloatingPointLiteral(12.0), FloatingPointLiteral(12.0))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
         program = Gte(StringLiteral("beta"), StringLiteral("beta"))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
 
         # Boolean Expression errors (5 pts)
         program = And(BooleanLiteral(True), IntLiteral(10))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = And(IntLiteral(10), BooleanLiteral(True))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = And(IntLiteral(10), IntLiteral(10))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = And(Ren(), Ren())
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         program = Or(BooleanLiteral(True), IntLiteral(10))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Or(IntLiteral(10), BooleanLiteral(True))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Or(IntLiteral(10), IntLiteral(10))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Or(Ren(), Ren())
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         program = Not(IntLiteral(10))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Not(FloatingPointLiteral(10.0))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Not(StringLiteral("string"))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
         program = Not(Ren())
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         # Basic expression/sequence evaluation
         program = Program(IntLiteral(1), IntLiteral(2), IntLiteral(3))
-        check_run_result((3, Integer(), None), run_stimpl(program))
+        check_run_result((3, Integer(), None), run(program))
 
         program = Program()
-        check_run_result((None, Unit(), None), run_stimpl(program))
+        check_run_result((None, Unit(), None), run(program))
 
         # Basic variable read/write
         program = Program(Assign(Variable("i"), Ren()), Variable("i"))
-        check_run_result((None, Unit(), None), run_stimpl(program))
+        check_run_result((None, Unit(), None), run(program))
 
         program = Program(Assign(Variable("i"), IntLiteral(1)), Variable("i"))
-        check_run_result((1, Integer(), None), run_stimpl(program))
+        check_run_result((1, Integer(), None), run(program))
 
         program = Program(
             Assign(Variable("i"), FloatingPointLiteral(1.0)), Variable("i"))
-        check_run_result((1, FloatingPoint(), None), run_stimpl(program))
+        check_run_result((1, FloatingPoint(), None), run(program))
 
         program = Program(
             Assign(Variable("i"), StringLiteral("test")), Variable("i"))
-        check_run_result(("test", String(), None), run_stimpl(program))
+        check_run_result(("test", String(), None), run(program))
 
         program = Program(
             Assign(Variable("i"), BooleanLiteral(True)), Variable("i"))
-        check_run_result((True, Boolean(), None), run_stimpl(program))
+        check_run_result((True, Boolean(), None), run(program))
 
         # Syntax error handling (5 pts)
 
         # Runtime syntax error to read from a variable before assignment
         program = Program(Variable("i"))
-        check_program_raises(InterpSyntaxError(), program)
+        check_program_raises(InterpSyntaxError(), program, backend)
 
         # Assigning to something that is not a variable is a compile-
         # time syntax error.
@@ -310,7 +335,7 @@ def run_stimpl_sanity_tests():
             Assign(Variable("l"), Assign(Variable("i"),
                    Add(Variable("i"), IntLiteral(1)))),
         )
-        run_value, run_type, run_state = run_stimpl(program)
+        run_value, run_type, run_state = run(program)
         check_equal((1, Integer()), run_state.get_value("j"))
         check_equal((2, Integer()), run_state.get_value("k"))
         check_equal((3, Integer()), run_state.get_value("l"))
@@ -321,34 +346,34 @@ def run_stimpl_sanity_tests():
         program = If(BooleanLiteral(False),
                      StringLiteral("Then"),
                      StringLiteral("Else"))
-        check_run_result(("Else", String(), None), run_stimpl(program))
+        check_run_result(("Else", String(), None), run(program))
 
         program = If(BooleanLiteral(True),
                      StringLiteral("Then"),
                      StringLiteral("Else"))
-        check_run_result(("Then", String(), None), run_stimpl(program))
+        check_run_result(("Then", String(), None), run(program))
 
         program = If(BooleanLiteral(False),
                      StringLiteral("Then"),
                      Ren())
-        check_run_result((None, Unit(), None), run_stimpl(program))
+        check_run_result((None, Unit(), None), run(program))
 
         # Check whether If expression condition must be a Boolean.
         program = If(IntLiteral(1),
                      Variable("i"),
                      Variable("i"))
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         # Check whether If expression condition can have side-effects.
         program = If(Ne(IntLiteral(0), Assign(Variable("i"), IntLiteral(10))),
                      Variable("i"),
                      Variable("i"))
-        check_run_result((10, Integer(), None), run_stimpl(program))
+        check_run_result((10, Integer(), None), run(program))
 
         program = If(Eq(IntLiteral(0), Assign(Variable("i"), IntLiteral(10))),
                      Variable("i"),
                      Variable("i"))
-        check_run_result((10, Integer(), None), run_stimpl(program))
+        check_run_result((10, Integer(), None), run(program))
 
         # Check to make sure that If bodies can have side effects.
         program = Assign(Variable("i"),
@@ -356,8 +381,8 @@ def run_stimpl_sanity_tests():
                             Assign(Variable("j"), StringLiteral("Then")),
                             Assign(Variable("j"), StringLiteral("Else"))),
                          )
-        check_run_result(("Else", String(), None), run_stimpl(program))
-        run_value, run_type, run_state = run_stimpl(program)
+        check_run_result(("Else", String(), None), run(program))
+        run_value, run_type, run_state = run(program)
         check_equal(("Else", String()), run_state.get_value("j"))
         check_equal(("Else", String()), run_state.get_value("i"))
 
@@ -371,7 +396,7 @@ def run_stimpl_sanity_tests():
             )
             )
         )
-        run_value, run_type, run_state = run_stimpl(program)
+        run_value, run_type, run_state = run(program)
         check_equal((10, Integer()), run_state.get_value("j"))
 
         # While loop with non-Boolean condition should raise InterpTypeError
@@ -383,7 +408,7 @@ def run_stimpl_sanity_tests():
             )
             )
         )
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         # Once a variable is assigned, its type is fixed. Check
         # to make sure that reassigning to a value with a different
@@ -392,19 +417,19 @@ def run_stimpl_sanity_tests():
             Assign(Variable("i"), IntLiteral(10)),
             Assign(Variable("i"), FloatingPointLiteral(10.0))
         )
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         program = Program(
             Assign(Variable("i"), Ren()),
             Assign(Variable("i"), FloatingPointLiteral(10.0))
         )
-        check_program_raises(InterpTypeError(), program)
+        check_program_raises(InterpTypeError(), program, backend)
 
         # Check to make sure that you can use assignments as expressions
         # and that they propagate! (5 pts)
         # i = j = 10
         program = Assign(Variable("i"), Assign(Variable("j"), IntLiteral(10)))
-        run_value, run_type, run_state = run_stimpl(program)
+        run_value, run_type, run_state = run(program)
         check_equal((10, Integer()), run_state.get_value("i"))
         check_equal((10, Integer()), run_state.get_value("j"))
 
@@ -416,7 +441,7 @@ def run_stimpl_sanity_tests():
         # result = 10 + (10 + 11) = 31
         program = Add(Assign(Variable("i"), IntLiteral(10)), Add(
             Variable("i"), Assign(Variable("j"), IntLiteral(11))))
-        run_value, run_type, run_state = run_stimpl(program)
+        run_value, run_type, run_state = run(program)
         check_equal((31, Integer()), (run_value, run_type))
         check_equal((10, Integer()), run_state.get_value("i"))
         check_equal((11, Integer()), run_state.get_value("j"))
@@ -427,7 +452,7 @@ def run_stimpl_sanity_tests():
         # result = 10 - (10 + 11) = -11
         program = Subtract(Assign(Variable("i"), IntLiteral(10)), Add(
             Variable("i"), Assign(Variable("j"), IntLiteral(11))))
-        run_value, run_type, run_state = run_stimpl(program)
+        run_value, run_type, run_state = run(program)
         check_equal((-11, Integer()), (run_value, run_type))
         check_equal((10, Integer()), run_state.get_value("i"))
         check_equal((11, Integer()), run_state.get_value("j"))
@@ -438,7 +463,7 @@ def run_stimpl_sanity_tests():
         # result = 10 * (10 + 11) = 210
         program = Multiply(Assign(Variable("i"), IntLiteral(10)), Add(
             Variable("i"), Assign(Variable("j"), IntLiteral(11))))
-        run_value, run_type, run_state = run_stimpl(program)
+        run_value, run_type, run_state = run(program)
         check_equal((210, Integer()), (run_value, run_type))
         check_equal((10, Integer()), run_state.get_value("i"))
         check_equal((11, Integer()), run_state.get_value("j"))
@@ -449,7 +474,7 @@ def run_stimpl_sanity_tests():
         # result = 10 / (10 + 10) = 0
         program = Divide(Assign(Variable("i"), IntLiteral(10)), Add(
             Variable("i"), Assign(Variable("j"), IntLiteral(10))))
-        run_value, run_type, run_state = run_stimpl(program)
+        run_value, run_type, run_state = run(program)
         check_equal((0, Integer()), (run_value, run_type))
         check_equal((10, Integer()), run_state.get_value("i"))
         check_equal((10, Integer()), run_state.get_value("j"))
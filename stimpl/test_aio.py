@@ -0,0 +1,84 @@
+import asyncio
+
+from stimpl.aio import run_stimpl_async
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.limits import Limits
+from stimpl.runtime import run_stimpl
+from stimpl.test import check_equal
+from stimpl.test_compiler import BACKEND_EDGE_CASES
+from stimpl.types import *
+
+
+def counter(name, iterations):
+    i = Variable("i")
+    return Program(Assign(i, IntLiteral(0)),
+                   While(Lt(i, IntLiteral(iterations)), Assign(i, Add(i, IntLiteral(1)))),
+                   Print(StringLiteral(name)),
+                   i)
+
+
+def test_async_matches_run_stimpl():
+    async def run(program):
+        lines = []
+        try:
+            value, value_type, _ = await run_stimpl_async(program, output=lines, slice_steps=7)
+        except InterpError as e:
+            return (None, None, lines, type(e), str(e))
+        return (value, value_type, lines, None, None)
+
+    for program in BACKEND_EDGE_CASES:
+        lines = []
+        try:
+            value, value_type, _ = run_stimpl(program, output=lines)
+            expected = (value, value_type, lines, None, None)
+        except InterpError as e:
+            expected = (None, None, lines, type(e), str(e))
+        check_equal(expected, asyncio.run(run(program)))
+
+
+def test_async_interleaves_programs():
+    finished = []
+
+    async def run(name, iterations, lines):
+        result = await run_stimpl_async(counter(name, iterations), output=lines, slice_steps=100)
+        finished.append(name)
+        return result[:2]
+
+    async def main():
+        outputs = [[] for _ in range(3)]
+        results = await asyncio.gather(run("long", 20000, outputs[0]),
+                                       run("short", 10, outputs[1]),
+                                       run("medium", 1000, outputs[2]))
+        return results, outputs
+
+    results, outputs = asyncio.run(main())
+    check_equal([(20000, Integer()), (10, Integer()), (1000, Integer())], results)
+    check_equal([["long"], ["short"], ["medium"]], outputs)
+    check_equal(["short", "medium", "long"], finished)
+
+
+def test_async_cancellation_and_limits():
+    forever = Program(While(BooleanLiteral(True), Print(IntLiteral(1))))
+
+    async def cancel():
+        lines = []
+        task = asyncio.create_task(run_stimpl_async(forever, output=lines, slice_steps=50))
+        while len(lines) < 100:
+            await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return task.cancelled()
+        return False
+
+    check_equal(True, asyncio.run(cancel()))
+
+    async def limited():
+        try:
+            await run_stimpl_async(forever, output=[], limits=Limits(max_steps=30), slice_steps=10)
+        except InterpLimitError as e:
+            return e.steps
+
+    check_equal(30, asyncio.run(limited()))
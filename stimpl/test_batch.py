@@ -0,0 +1,40 @@
+from stimpl.batch import run_many
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.test import check_equal
+from stimpl.types import *
+from stimpl.vm import run_vm
+
+
+def batch_programs(count):
+    programs = []
+    for i in range(count):
+        if i % 5 == 4:
+            programs.append(Program(Print(IntLiteral(i)), Divide(IntLiteral(i), IntLiteral(0))))
+        else:
+            programs.append(Program(Assign(Variable("x"), IntLiteral(i)),
+                                    Print(Variable("x")),
+                                    Multiply(Variable("x"), IntLiteral(2))))
+    return programs
+
+
+def check_batch_results(results, count):
+    check_equal(count, len(results))
+    for i, result in enumerate(results):
+        check_equal([str(i)], result.output)
+        if i % 5 == 4:
+            check_equal(InterpMathError, type(result.error))
+            check_equal(False, result.ok)
+        else:
+            check_equal(None, result.error)
+            check_equal((i * 2, Integer()), (result.value, result.type))
+            check_equal((i, Integer()), result.state.get_value("x"))
+
+
+def test_run_many_in_process():
+    check_batch_results(run_many(batch_programs(50)), 50)
+
+
+def test_run_many_process_pool():
+    check_batch_results(run_many(batch_programs(200), workers=2), 200)
+    check_batch_results(run_many(batch_programs(30), workers=3, backend=run_vm, chunksize=7), 30)
@@ -0,0 +1,50 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+from stimpl.bench import WORKLOADS, compare, run_benchmarks
+from stimpl.bench.runner import main
+from stimpl.test import check_equal, check_same_behavior
+from stimpl.vm import run_vm
+
+
+def test_bench_workloads():
+    for workload in WORKLOADS.values():
+        check_same_behavior(workload.program(0.01), run_vm)
+
+    results = run_benchmarks(backend="vm", repeats=3, scale=0.01)
+    check_equal(sorted(WORKLOADS), sorted(results["workloads"]))
+    for result in results["workloads"].values():
+        check_equal(True, result["nodes"] > 0)
+        check_equal(True, 0 < result["best"] <= result["p50"] <= result["p90"] <= result["p99"])
+        check_equal(True, result["peak_bytes"] > 0)
+
+
+def test_bench_regressions():
+    results = run_benchmarks(["counting_loop", "print_loop"], repeats=2, scale=0.01)
+    check_equal([], compare(results, results))
+
+    faster = json.loads(json.dumps(results))
+    faster["workloads"]["print_loop"]["best"] /= 2
+    del faster["workloads"]["counting_loop"]
+    regressions = compare(results, faster, threshold=0.5)
+    check_equal(1, len(regressions))
+    check_equal(True, regressions[0].startswith("print_loop: "))
+    check_equal([], compare(results, faster, threshold=1.5))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "baseline.json")
+        arguments = ["counting_loop", "--repeats", "2", "--scale", "0.01"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_equal(0, main(arguments + ["--save", path, "--baseline", path]))
+        with open(path) as f:
+            baseline = json.load(f)
+        baseline["workloads"]["counting_loop"]["best"] /= 100
+        with open(path, "w") as f:
+            json.dump(baseline, f)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            check_equal(1, main(arguments + ["--baseline", path]))
+        check_equal(True, "REGRESSION counting_loop" in output.getvalue())
@@ -0,0 +1,88 @@
+import contextlib
+import io
+
+from stimpl.cache import ResultCache
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.runtime import run_stimpl
+from stimpl.test import check_equal
+from stimpl.types import *
+from stimpl.vm import run_vm
+
+
+def greeting(name):
+    return Program(Assign(Variable("name"), StringLiteral(name)),
+                   Print(Add(StringLiteral("hello "), Variable("name"))),
+                   Variable("name"))
+
+
+def test_cache_replays_results():
+    cache = ResultCache(max_size=2)
+    for _ in range(3):
+        lines = []
+        value, value_type, state = run_stimpl(greeting("a"), output=lines, cache=cache)
+        check_equal(("a", String(), ["hello a"]), (value, value_type, lines))
+        check_equal(("a", String()), state.get_value("name"))
+    check_equal((2, 1, 0, 0, 1), cache.cache_info()[:4] + (len(cache),))
+
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        run_stimpl(greeting("a"), cache=cache)
+    check_equal("hello a\n", stdout.getvalue())
+
+    # A different backend has its own entry.
+    run_stimpl(greeting("a"), backend=run_vm, output=[], cache=cache)
+    check_equal((3, 2), cache.cache_info()[:2])
+
+    # Least recently used entries are evicted first.
+    run_stimpl(greeting("a"), output=[], cache=cache)
+    run_stimpl(greeting("b"), output=[], cache=cache)
+    check_equal(1, cache.cache_info().evictions)
+    run_stimpl(greeting("a"), output=[], cache=cache)
+    run_stimpl(greeting("a"), backend=run_vm, output=[], cache=cache)
+    check_equal((5, 4), cache.cache_info()[:2])
+
+    cache.cache_clear()
+    check_equal((0, 0, 0, 0, 2, 0), tuple(cache.cache_info()))
+
+
+def test_cache_replays_errors():
+    cache = ResultCache()
+    program = Program(Print(IntLiteral(1)), Divide(IntLiteral(1), IntLiteral(0)))
+    errors = []
+    for _ in range(2):
+        lines = []
+        try:
+            run_stimpl(program, output=lines, cache=cache)
+        except InterpMathError as e:
+            errors.append(e)
+        check_equal(["1"], lines)
+    check_equal(2, len(errors))
+    check_equal(True, errors[0] is not errors[1])
+    check_equal(str(errors[0]), str(errors[1]))
+    check_equal((1, 1), cache.cache_info()[:2])
+
+
+class Custom(Expr):
+    pass
+
+
+def test_cache_skips_uncacheable_programs():
+    cache = ResultCache()
+    program = Program(Print(IntLiteral(1)), Custom())
+    for _ in range(2):
+        try:
+            run_stimpl(program, output=[], cache=cache)
+        except InterpSyntaxError:
+            pass
+    check_equal((0, 0, 2), cache.cache_info()[:3])
+
+    def crashing(program, state):
+        raise RecursionError("too deep")
+
+    for _ in range(2):
+        try:
+            run_stimpl(greeting("a"), backend=crashing, cache=cache)
+        except RecursionError:
+            pass
+    check_equal((0, 2, 2), cache.cache_info()[:3])
@@ -0,0 +1,132 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+from stimpl.checkpoint import load_checkpoint, restore, run_resumable, save_checkpoint, snapshot
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.iterative import Machine
+from stimpl.output import ListSink, OutputSink, reset_output, set_output
+from stimpl.runtime import EmptyState, run_stimpl
+from stimpl.test import check_equal
+from stimpl.types import *
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def long_job(rows):
+    i, j, total = Variable("i"), Variable("j"), Variable("total")
+    return Program(
+        Assign(i, IntLiteral(0)),
+        Assign(total, FloatingPointLiteral(0.5)),
+        Assign(Variable("name"), StringLiteral("résumé ")),
+        While(Lt(i, IntLiteral(rows)),
+              Sequence(Assign(j, IntLiteral(0)),
+                       While(Lt(j, i),
+                             Sequence(Assign(total, Add(total, Divide(FloatingPointLiteral(1.0),
+                                                                      FloatingPointLiteral(3.0)))),
+                                      Assign(j, Add(j, IntLiteral(1))))),
+                       If(Eq(Subtract(i, Multiply(Divide(i, IntLiteral(3)), IntLiteral(3))), IntLiteral(0)),
+                          Print(Add(Variable("name"), StringLiteral("row"))),
+                          Print(Multiply(i, IntLiteral(-2 ** 70)))),
+                       Assign(i, Add(i, IntLiteral(1))))),
+        Print(total),
+        Sequence(Not(Lt(i, j)), Ren()))
+
+
+def finish(machine):
+    sink = ListSink()
+    token = set_output(sink)
+    try:
+        machine.run()
+    finally:
+        reset_output(token)
+    value, value_type, state = machine.result()
+    return (value, value_type, repr(state), sink.lines)
+
+
+def test_checkpoint_round_trip():
+    program = long_job(12)
+    expected = finish(Machine(program, EmptyState()))
+    for slice_steps in (1, 7, 100):
+        # Restore the machine from a snapshot after every slice.
+        machine = Machine(program, EmptyState())
+        sink = ListSink()
+        token = set_output(sink)
+        try:
+            while not machine.run(slice_steps):
+                data = snapshot(machine)
+                machine = restore(data)
+                check_equal(data, snapshot(machine))
+        finally:
+            reset_output(token)
+        value, value_type, state = machine.result()
+        check_equal(expected, (value, value_type, repr(state), sink.lines))
+
+    # data is the last snapshot of the loop above.
+    for damaged in (data[:-1], data + b"\x00", b"STCX" + data[4:], data[:10]):
+        try:
+            restore(damaged)
+        except ValueError:
+            continue
+        raise AssertionError("Damaged checkpoint was accepted")
+
+
+class CrashingSink(OutputSink):
+    def __init__(self, lines, limit):
+        self.lines = lines
+        self.limit = limit
+
+    def write_line(self, text):
+        if len(self.lines) == self.limit:
+            raise KeyboardInterrupt
+        self.lines.append(text)
+
+
+def test_resume_in_another_process():
+    program = long_job(40)
+    expected = []
+    value, value_type, _ = run_stimpl(program, output=expected)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "job.checkpoint")
+        before = []
+        try:
+            run_resumable(program, path, checkpoint_steps=300, output=CrashingSink(before, 20))
+        except KeyboardInterrupt:
+            pass
+        check_equal(True, os.path.exists(path))
+        check_equal(expected[:20], before)
+
+        script = ("import sys\n"
+                  "from stimpl.checkpoint import run_resumable\n"
+                  "from stimpl.test_checkpoint import long_job\n"
+                  "result = run_resumable(long_job(40), sys.argv[1], checkpoint_steps=300)\n"
+                  "print(result[:2])\n")
+        child = subprocess.run([sys.executable, "-c", script, path], cwd=ROOT,
+                               env=dict(os.environ, PYTHONIOENCODING="utf-8"),
+                               capture_output=True, encoding="utf-8", check=True)
+        after = child.stdout.splitlines()
+        check_equal(str((value, value_type)), after.pop())
+        # The resumed run repeats at most the lines since the checkpoint.
+        check_equal(expected[len(expected) - len(after):], after)
+        check_equal(True, len(expected) - 20 <= len(after) < len(expected))
+        check_equal(False, os.path.exists(path))
+
+        save_checkpoint(Machine(long_job(3), EmptyState()), path)
+        try:
+            run_resumable(program, path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Resumed a checkpoint of another program")
+
+        save_checkpoint(Machine(Divide(IntLiteral(1), IntLiteral(0)), EmptyState()), path)
+        check_equal(Divide, type(load_checkpoint(path).program))
+        try:
+            run_resumable(Divide(IntLiteral(1), IntLiteral(0)), path)
+        except InterpMathError:
+            check_equal(False, os.path.exists(path))
+        else:
+            raise AssertionError("Expected InterpMathError")
@@ -0,0 +1,140 @@
+from stimpl.compiler import compile_stimpl, run_compiled
+from stimpl.expression import *
+from stimpl.errors import *
+from stimpl.iterative import evaluate_iterative
+from stimpl.limits import Limits
+from stimpl.runtime import EmptyState, evaluate, run_stimpl
+from stimpl.test import check_equal, check_same_behavior, run_stimpl_sanity_tests
+from stimpl.types import *
+
+
+def test_compiled_sanity():
+    run_stimpl_sanity_tests(backend=run_compiled)
+
+
+BACKEND_EDGE_CASES = [
+    Program(Print(Ren()), Print(IntLiteral(3)), Print(StringLiteral("x"))),
+    Program(Assign(Variable("i"), IntLiteral(0)),
+            Assign(Variable("s"), StringLiteral("")),
+            While(Lt(Variable("i"), IntLiteral(5)),
+                  Sequence(Assign(Variable("s"), Add(Variable("s"), StringLiteral("a"))),
+                           Print(Variable("s")),
+                           Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))),
+            Variable("s")),
+    Program(Assign(Variable("i"), IntLiteral(1)),
+            Add(Variable("i"), FloatingPointLiteral(1.0))),
+    Program(Assign(Variable("i"), IntLiteral(0)),
+            Divide(IntLiteral(1), Variable("i"))),
+    Program(Assign(Variable("b"), BooleanLiteral(False)),
+            Divide(Variable("b"), Variable("b"))),
+    Program(Assign(Variable("b"), BooleanLiteral(True)),
+            Divide(Variable("b"), Variable("b"))),
+    Eq(IntLiteral(1), StringLiteral("1")),
+    Ne(IntLiteral(1), StringLiteral("1")),
+    Ne(Ren(), IntLiteral(1)),
+    Lt(Ren(), IntLiteral(1)),
+    Program(Assign(Variable("x"), FloatingPointLiteral(2.0)),
+            Multiply(Variable("x"), Variable("x")),
+            Gte(Variable("x"), FloatingPointLiteral(2.0))),
+    Program(Assign(Variable("i"), IntLiteral(0)),
+            While(Variable("i"), Ren())),
+    Program(If(Variable("missing"), Ren(), Ren())),
+    Program(Print(Assign(Variable("i"), Ren())), Assign(Variable("i"), IntLiteral(1))),
+    Literal(1),
+]
+
+
+def test_compiled_matches_evaluate():
+    for program in BACKEND_EDGE_CASES:
+        check_same_behavior(program, run_compiled)
+
+
+def test_compiled_program_is_reusable():
+    program = Program(Assign(Variable("i"), IntLiteral(0)),
+                      While(Lt(Variable("i"), IntLiteral(10)),
+                            Assign(Variable("i"), Add(Variable("i"), IntLiteral(1)))))
+    compiled = compile_stimpl(program)
+    for _ in range(2):
+        value, value_type, state = compiled(EmptyState())
+        check_equal((False, Boolean()), (value, value_type))
+        check_equal((10, Integer()), state.get_value("i"))
+
+
+def counting(condition, statements, setup=()):
+    i = Variable("i")
+    return Program(*setup, While(condition, Sequence(*statements)), i)
+
+
+def test_compiled_counting_loops():
+    i, total, product = Variable("i"), Variable("total"), Variable("product")
+    zero = [Assign(i, IntLiteral(0)), Assign(total, IntLiteral(0)), Assign(product, IntLiteral(1))]
+    increment = Assign(i, Add(i, IntLiteral(1)))
+    programs = [
+        counting(Lt(i, IntLiteral(100)), [Assign(total, Add(total, i)), increment], zero),
+        counting(Lte(i, IntLiteral(37)),
+                 [Assign(total, Subtract(total, Add(Multiply(IntLiteral(3), i), IntLiteral(-2)))),
+                  Assign(product, Multiply(Add(i, IntLiteral(1)), product)),
+                  Assign(i, Add(IntLiteral(3), i))], zero),
+        counting(Lt(i, IntLiteral(20)),
+                 [Assign(product, Multiply(product, IntLiteral(3))),
+                  Assign(total, Add(total, Multiply(Subtract(i, IntLiteral(5)), IntLiteral(2)))),
+                  increment], zero),
+        counting(Gte(i, Variable("low")), [Assign(total, Add(total, i)),
+                                           Assign(i, Subtract(i, IntLiteral(2)))],
+                 [Assign(Variable("low"), IntLiteral(-7)), Assign(i, IntLiteral(10)),
+                  Assign(total, IntLiteral(0))]),
+        counting(Gt(i, IntLiteral(0)), [Print(i), Assign(i, Add(i, IntLiteral(-1)))],
+                 [Assign(i, IntLiteral(5))]),
+        counting(Lt(i, IntLiteral(0)), [Assign(total, Add(total, i)), increment], zero),
+        counting(Lt(i, IntLiteral(10)), [increment], zero),
+        # Ranges that do not fit the closed form.
+        counting(Lt(i, IntLiteral(10)), [Assign(total, Add(total, Multiply(i, i))), increment], zero),
+        counting(Lt(i, IntLiteral(10)),
+                 [Assign(Variable("f"), Add(Variable("f"), FloatingPointLiteral(0.1))), increment],
+                 zero + [Assign(Variable("f"), FloatingPointLiteral(0.0))]),
+        counting(Lt(i, IntLiteral(10)), [Assign(total, Add(total, i)),
+                                         Assign(product, Multiply(product, total)), increment], zero),
+        # Loops that must raise, or run as written.
+        counting(Lt(i, IntLiteral(10)), [Assign(Variable("missing"), Add(Variable("missing"), i)),
+                                         increment], zero),
+        counting(Lt(i, IntLiteral(10)), [Assign(total, Add(total, i)), increment],
+                 [Assign(i, IntLiteral(0)), Assign(total, StringLiteral("s"))]),
+        counting(Lt(i, FloatingPointLiteral(3.5)), [increment], [Assign(i, IntLiteral(0))]),
+        counting(Lt(i, FloatingPointLiteral(3.5)), [Assign(i, Add(i, FloatingPointLiteral(1.0)))],
+                 [Assign(i, FloatingPointLiteral(0.0))]),
+        counting(Lt(i, Variable("n")), [increment], [Assign(i, IntLiteral(0))]),
+        counting(Lt(i, IntLiteral(10)), [Print(Divide(IntLiteral(10), Subtract(IntLiteral(5), i))),
+                                         increment], [Assign(i, IntLiteral(0))]),
+    ]
+    # evaluate runs counting loops the same way, so both are checked
+    # against the iterative evaluator, which runs every iteration.
+    for program in programs:
+        for backend in (evaluate, run_compiled):
+            check_same_behavior(program, backend, reference=evaluate_iterative)
+        try:
+            expected = evaluate_iterative(program, EmptyState())
+        except InterpError:
+            continue
+        for backend in (evaluate, run_compiled):
+            check_equal(repr(expected[2]), repr(backend(program, EmptyState())[2]))
+
+    # Far too many iterations to run one at a time, more than a range can
+    # count.
+    for n in (10 ** 12, 10 ** 20):
+        sums = counting(Lt(i, IntLiteral(n)), [Assign(total, Add(total, i)), increment], zero)
+        empty = counting(Lt(i, IntLiteral(n)), [increment], zero)
+        printing = counting(Lt(i, IntLiteral(n)), [Print(i), increment], zero)
+        for backend in (evaluate, run_compiled):
+            _, _, state = backend(sums, EmptyState())
+            check_equal(((n * (n - 1) // 2), Integer()), state.get_value("total"))
+            check_equal((n, Integer()), state.get_value("i"))
+            check_equal((n, Integer()), backend(empty, EmptyState())[2].get_value("i"))
+            for program in (sums, empty, printing):
+                lines = []
+                try:
+                    run_stimpl(program, backend=backend, output=lines, limits=Limits(max_steps=1000))
+                except InterpLimitError as e:
+                    check_equal(1000, e.steps)
+                    check_equal(1000 if program is printing else 0, len(lines))
+                    continue
+                raise AssertionError("Expected InterpLimitError")
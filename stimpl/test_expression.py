@@ -0,0 +1,58 @@
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.test import check_equal
+
+
+def test_expressions_are_slotted():
+    x = Variable("x")
+    nodes = [Ren(), IntLiteral(1), FloatingPointLiteral(1.0), StringLiteral("s"),
+             BooleanLiteral(True), x, Assign(x, x), Print(x), Not(x), Add(x, x),
+             Divide(x, x), Ne(x, x), Program(x), Sequence(), If(x, x, x), While(x, x)]
+    for node in nodes:
+        check_equal(False, hasattr(node, "__dict__"))
+
+    for literal_class, bad in ((IntLiteral, True), (IntLiteral, 1.0), (FloatingPointLiteral, 1),
+                               (StringLiteral, b"s"), (BooleanLiteral, 0)):
+        try:
+            literal_class(bad)
+        except InterpTypeError:
+            pass
+        else:
+            raise AssertionError(f"{literal_class.__name__} accepted {bad!r}")
+
+
+def test_expressions_compare_by_structure():
+    check_equal(Add(Variable("x"), IntLiteral(1)), Add(Variable("x"), IntLiteral(1)))
+    check_equal(hash(Program(Print(StringLiteral("a")))), hash(Program(Print(StringLiteral("a")))))
+    check_equal(FloatingPointLiteral(float("nan")), FloatingPointLiteral(float("nan")))
+    for left, right in ((Add(Variable("x"), IntLiteral(1)), Subtract(Variable("x"), IntLiteral(1))),
+                        (IntLiteral(1), FloatingPointLiteral(1.0)),
+                        (FloatingPointLiteral(0.0), FloatingPointLiteral(-0.0)),
+                        (Sequence(Ren()), Sequence(Ren(), Ren())),
+                        (Sequence(Ren()), Program(Ren())),
+                        (Variable("x"), Variable("y"))):
+        check_equal(True, left != right)
+    check_equal(2, len({Variable("x"), Variable("x"), Variable("y")}))
+
+    deep = IntLiteral(0)
+    other = IntLiteral(0)
+    for i in range(100000):
+        deep = Add(deep, IntLiteral(i))
+        other = Add(other, IntLiteral(i))
+    check_equal(True, deep == other and hash(deep) == hash(other))
+
+
+def test_hash_consing():
+    nodes = HashConsing()
+    square = nodes(Multiply, nodes(Variable, "x"), nodes(Variable, "x"))
+    check_equal(True, square.left is square.right)
+    check_equal(True, square is nodes(Multiply, nodes(Variable, "x"), nodes(Variable, "x")))
+
+    program = Program(Assign(Variable("y"), Multiply(Variable("x"), Variable("x"))),
+                      Print(Multiply(Variable("x"), Variable("x"))),
+                      Sequence(Variable("y"), Variable("x")))
+    shared = intern(program)
+    check_equal(program, shared)
+    check_equal(True, shared.exprs[0].value is shared.exprs[1].to_print)
+    check_equal(True, shared.exprs[0].variable is shared.exprs[2].exprs[0])
+    check_equal(True, nodes.intern(program).exprs[1].to_print is square)
@@ -0,0 +1,57 @@
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.fuzz import ProgramGenerator, default_backends, differential_check, observe
+from stimpl.runtime import evaluate
+from stimpl.test import check_equal
+from stimpl.typecheck import typecheck
+from stimpl.types import *
+
+NODE_CLASSES = {Ren, IntLiteral, FloatingPointLiteral, StringLiteral, BooleanLiteral, Variable,
+                Assign, Print, Not, And, Or, Lt, Lte, Gt, Gte, Eq, Ne, Add, Subtract, Multiply,
+                Divide, Program, Sequence, If, While}
+
+
+def test_generator():
+    programs = ProgramGenerator(seed=7).programs(50)
+    check_equal(programs, ProgramGenerator(seed=7).programs(50))
+    check_equal(False, programs == ProgramGenerator(seed=8).programs(50))
+
+    seen = set()
+    for program in programs:
+        seen.update(type(expression) for expression in subexpressions(program))
+        # Well-typed programs pass the type checker and can only fail by
+        # dividing by zero.
+        typecheck(program)
+        check_equal(True, observe(program)[3] in (None, InterpMathError))
+    check_equal(NODE_CLASSES, seen)
+
+    failures = [observe(program)[3] for program in ProgramGenerator(seed=7, ill_typed=True).programs(50)]
+    check_equal(True, failures.count(InterpTypeError) + failures.count(InterpSyntaxError) > 25)
+
+
+def test_differential_check():
+    for ill_typed in (False, True):
+        generator = ProgramGenerator(seed=2024, max_depth=5, max_trips=12, ill_typed=ill_typed)
+        backends = default_backends(ill_typed)
+        report = differential_check(generator.programs(150), backends)
+        check_equal([], report.mismatches)
+        check_equal(["evaluate"] + list(backends), list(report.throughput()))
+
+    # A backend that disagrees with evaluate is reported.
+    def broken(program, state):
+        raise InterpMathError("Broken")
+    report = differential_check([Program(Print(IntLiteral(1)), IntLiteral(2))], {"broken": broken})
+    check_equal(False, report.ok)
+    program, name, expected, actual = report.mismatches[0]
+    check_equal(("broken", ("2", Integer(), ["1"], None, [])), (name, expected))
+    check_equal((None, None, [], InterpMathError, None), actual)
+
+    # So is one that leaves a different final state.
+    def leaky(program, state):
+        value, value_type, state = evaluate(program, state)
+        return (value, value_type, state.set_value("$leaked", 0, INTEGER))
+    program = Program(Assign(Variable("x"), FloatingPointLiteral(0.5)), Variable("x"))
+    report = differential_check([program], {"leaky": leaky})
+    program, name, expected, actual = report.mismatches[0]
+    check_equal([("x", "0.5", float, FloatingPoint())], expected[4])
+    check_equal([("$leaked", "0", int, Integer()), ("x", "0.5", float, FloatingPoint())], actual[4])
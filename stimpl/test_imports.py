@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+from stimpl.test import check_equal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_modules(statement):
+    script = (f"{statement}\n"
+              "import sys\n"
+              "print(' '.join(sorted(m for m in sys.modules if m.startswith('stimpl'))))\n")
+    child = subprocess.run([sys.executable, "-c", script], cwd=ROOT,
+                           capture_output=True, text=True, check=True)
+    return child.stdout.split()
+
+
+def test_lazy_imports():
+    check_equal(["stimpl"], loaded_modules("import stimpl"))
+    modules = loaded_modules("import stimpl.runtime")
+    check_equal(True, "stimpl.runtime" in modules)
+    check_equal([], [module for module in modules
+                     if module.split(".")[-1].startswith("test") or module == "stimpl.robustness"])
+
+    script = ("import stimpl\n"
+              "from stimpl import *\n"
+              "print(run_stimpl(Add(IntLiteral(1), IntLiteral(2)))[:2], UNIT, check_equal.__module__)\n"
+              "print(stimpl.vm.__name__, 'vm' in dir(stimpl), 'Program' in dir(stimpl))\n"
+              "try:\n"
+              "    stimpl.missing\n"
+              "except AttributeError as e:\n"
+              "    print(e)\n")
+    child = subprocess.run([sys.executable, "-c", script], cwd=ROOT,
+                           capture_output=True, text=True, check=True)
+    check_equal(["(3, Integer) Unit stimpl.test",
+                 "stimpl.vm True True",
+                 "module 'stimpl' has no attribute 'missing'"],
+                child.stdout.splitlines())
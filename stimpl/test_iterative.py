@@ -0,0 +1,61 @@
+import os
+
+from stimpl.expression import *
+from stimpl.iterative import Machine, evaluate_iterative
+from stimpl.runtime import EmptyState, run_stimpl
+from stimpl.test import check_equal, check_same_behavior, run_stimpl_sanity_tests
+from stimpl.test_compiler import BACKEND_EDGE_CASES
+from stimpl.types import *
+
+# Set STIMPL_STRESS=1 to run the full-size stress tests.
+STRESS = bool(os.environ.get("STIMPL_STRESS"))
+
+
+def test_iterative_sanity():
+    run_stimpl_sanity_tests(backend=evaluate_iterative)
+
+
+def test_iterative_matches_evaluate():
+    for program in BACKEND_EDGE_CASES:
+        check_same_behavior(program, evaluate_iterative)
+
+
+def test_iterative_runs_in_slices():
+    program = Program(Assign(Variable("i"), IntLiteral(0)),
+                      While(Lt(Variable("i"), IntLiteral(100)),
+                            Assign(Variable("i"), Add(Variable("i"), IntLiteral(1)))),
+                      Variable("i"))
+    machine = Machine(program, EmptyState())
+    slices = 0
+    while not machine.run(max_steps=50):
+        slices += 1
+    check_equal(True, slices > 10)
+    check_equal((100, Integer()), machine.result()[:2])
+
+
+def test_iterative_deep_expression():
+    depth = 100000
+    program = StringLiteral("")
+    for _ in range(depth):
+        program = Add(program, StringLiteral("a"))
+    program = Program(Assign(Variable("s"), program), Print(IntLiteral(depth)))
+    for _ in range(depth):
+        program = Sequence(program)
+    lines = []
+    value, value_type, state = run_stimpl(program, backend=evaluate_iterative, output=lines)
+    check_equal([str(depth)], lines)
+    check_equal((depth, Integer()), (value, value_type))
+    check_equal("a" * depth, state.get_value("s")[0])
+
+
+def test_iterative_long_loop():
+    iterations = 10000000 if STRESS else 100000
+    program = Program(
+        Assign(Variable("i"), IntLiteral(0)),
+        Assign(Variable("total"), IntLiteral(0)),
+        While(Lt(Variable("i"), IntLiteral(iterations)),
+              Sequence(Assign(Variable("total"), Add(Variable("total"), Variable("i"))),
+                       Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))))
+    _, _, state = evaluate_iterative(program, EmptyState())
+    check_equal((iterations, Integer()), state.get_value("i"))
+    check_equal((iterations * (iterations - 1) // 2, Integer()), state.get_value("total"))
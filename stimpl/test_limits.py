@@ -0,0 +1,89 @@
+import pickle
+
+from stimpl.batch import run_many
+from stimpl.cache import ResultCache
+from stimpl.compiler import run_checked, run_compiled
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.iterative import evaluate_iterative
+from stimpl.limits import Limits
+from stimpl.profiler import Profiler
+from stimpl.runtime import evaluate, run_stimpl
+from stimpl.test import check_equal
+from stimpl.types import *
+from stimpl.vm import run_vm
+
+BACKENDS = (evaluate, evaluate_iterative, run_vm, run_compiled, run_checked, Profiler())
+
+
+def run_limited(program, backend, limits):
+    lines = []
+    try:
+        run_stimpl(program, backend=backend, output=lines, limits=limits)
+    except InterpLimitError as e:
+        return (e, lines)
+    raise AssertionError(f"Expected InterpLimitError from {backend}")
+
+
+def forever(statement):
+    return Program(Assign(Variable("i"), IntLiteral(0)),
+                   While(BooleanLiteral(True),
+                         Sequence(statement, Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))))
+
+
+def test_step_limits():
+    counting = Program(Assign(Variable("i"), IntLiteral(0)),
+                       Assign(Variable("total"), IntLiteral(0)),
+                       While(Lt(Variable("i"), IntLiteral(100)),
+                             Sequence(Assign(Variable("total"), Add(Variable("total"), Variable("i"))),
+                                      Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))),
+                       Variable("total"))
+    for backend in BACKENDS:
+        error, lines = run_limited(forever(Print(Variable("i"))), backend, Limits(max_steps=5))
+        check_equal((5, ["0", "1", "2", "3", "4"]), (error.steps, lines))
+        check_equal(True, str(error).startswith("Exceeded the limit of 5 steps after 5 steps"))
+
+        # Counting loops run in bulk are charged for every iteration, and
+        # stop where the loop would once they do not fit the budget.
+        error, _ = run_limited(counting, backend, Limits(max_steps=99))
+        check_equal(99, error.steps)
+        check_equal(True, str(error).startswith("Exceeded the limit of 99 steps after 99 steps"))
+        check_equal((4950, Integer()),
+                    run_stimpl(counting, backend=backend, limits=Limits(max_steps=100))[:2])
+
+        error, _ = run_limited(forever(Ren()), backend, Limits(timeout=0.05))
+        check_equal(True, error.elapsed >= 0.05 and error.elapsed < 5 and error.steps > 0)
+
+
+def test_size_limits():
+    grow = Program(Assign(Variable("s"), StringLiteral("ab")),
+                   While(BooleanLiteral(True), Assign(Variable("s"), Add(Variable("s"), Variable("s")))))
+    variables = Program(*[Assign(Variable(f"v{i}"), IntLiteral(i)) for i in range(10)])
+    for backend in BACKENDS:
+        error, _ = run_limited(grow, backend, Limits(max_string_length=1000))
+        check_equal(9, error.steps)
+        check_equal(True, "1000 characters" in str(error))
+
+        error, _ = run_limited(variables, backend, Limits(max_variables=9))
+        check_equal(True, "9 variables" in str(error))
+        check_equal((9, Integer()), run_stimpl(variables, backend=backend,
+                                               limits=Limits(max_variables=10))[:2])
+
+
+def test_limited_runs():
+    error, _ = run_limited(forever(Ren()), None, Limits(max_steps=3))
+    copy = pickle.loads(pickle.dumps(error))
+    check_equal((InterpLimitError, str(error), 3, error.elapsed),
+                (type(copy), str(copy), copy.steps, copy.elapsed))
+
+    # A limited run neither reads nor fills the cache.
+    cache = ResultCache()
+    program = Program(Print(StringLiteral("x")), Add(StringLiteral("ab"), StringLiteral("cd")))
+    run_stimpl(program, output=[], cache=cache)
+    check_equal(True, isinstance(run_limited(program, None, Limits(max_string_length=3))[0],
+                                 InterpLimitError))
+    check_equal((0, 1), cache.cache_info()[:2])
+
+    results = run_many([forever(Ren()), program] * 2, workers=2, limits=Limits(max_steps=10))
+    check_equal([InterpLimitError, type(None)] * 2, [type(result.error) for result in results])
+    check_equal(10, results[2].error.steps)
@@ -0,0 +1,205 @@
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.limits import Limits
+from stimpl.optimizer import optimize, run_optimized
+from stimpl.runtime import EmptyState, evaluate, run_stimpl
+from stimpl.test import check_equal, check_same_behavior, run_stimpl_sanity_tests
+from stimpl.test_compiler import BACKEND_EDGE_CASES
+from stimpl.types import *
+
+
+def test_optimized_sanity():
+    run_stimpl_sanity_tests(backend=run_optimized)
+
+
+def test_optimized_matches_evaluate():
+    programs = BACKEND_EDGE_CASES + [
+        Program(Print(StringLiteral("before")), Divide(IntLiteral(1), IntLiteral(0))),
+        Program(Print(StringLiteral("before")),
+                Add(Multiply(IntLiteral(2), IntLiteral(3)), FloatingPointLiteral(1.0))),
+        Program(Sequence(), Sequence(Print(IntLiteral(1)), Sequence())),
+        Program(IntLiteral(1), Sequence(Ren(), StringLiteral("x")), Sequence()),
+        Program(Assign(Variable("i"), IntLiteral(0)),
+                While(And(BooleanLiteral(True), BooleanLiteral(False)),
+                      Assign(Variable("i"), StringLiteral("never")))),
+        If(Not(BooleanLiteral(True)), Print(Ren()), Print(Subtract(IntLiteral(1), IntLiteral(2)))),
+        If(Add(IntLiteral(1), IntLiteral(1)), Ren(), Ren()),
+        Program(Print(FloatingPointLiteral(-0.0)), Multiply(FloatingPointLiteral(-1.0), FloatingPointLiteral(0.0))),
+    ]
+    for program in programs:
+        check_same_behavior(program, run_optimized)
+
+
+def test_optimize_folds_literals():
+    program = optimize(Program(
+        Assign(Variable("x"), Add(IntLiteral(3), IntLiteral(4))),
+        If(Lt(IntLiteral(1), IntLiteral(2)),
+           Sequence(Print(Variable("x")), Sequence(IntLiteral(5), Variable("x"))),
+           Print(StringLiteral("unreachable"))),
+        While(BooleanLiteral(False), Print(Ren())),
+    ))
+    check_equal(4, len(program.exprs))
+    assignment, printed, read, loop = program.exprs
+    check_equal(IntLiteral, type(assignment.value))
+    check_equal(7, assignment.value.literal)
+    check_equal(Print, type(printed))
+    check_equal(Variable, type(read))
+    check_equal(BooleanLiteral, type(loop))
+
+    kept = optimize(Divide(IntLiteral(1), IntLiteral(0)))
+    check_equal(Divide, type(kept))
+
+
+def test_optimize_eliminates_common_subexpressions():
+    x = Variable("x")
+    square = Multiply(x, x)
+    program = Program(Assign(x, IntLiteral(3)),
+                      Assign(Variable("a"), Add(square, IntLiteral(1))),
+                      Print(Multiply(x, x)),
+                      Assign(x, IntLiteral(4)),
+                      Print(Multiply(x, x)),
+                      Multiply(x, x))
+    optimized = optimize(program)
+    check_equal(Assign(Variable("$cse0"), square), optimized.exprs[1].value.left)
+    check_equal(Print(Variable("$cse0")), optimized.exprs[2])
+    check_equal(Assign(Variable("$cse0"), square), optimized.exprs[4].to_print)
+    check_equal(Variable("$cse0"), optimized.exprs[5])
+    check_equal((16, Integer()), run_optimized(program, EmptyState())[:2])
+
+    # Nothing is shared with a branch that may not run, or across a
+    # loop that assigns the variables involved.
+    unchanged = Program(Assign(x, IntLiteral(2)),
+                        If(Lt(x, IntLiteral(5)), Print(square), Ren()),
+                        Print(square),
+                        While(Lt(x, IntLiteral(5)), Assign(x, Add(x, IntLiteral(1)))),
+                        Print(Add(x, IntLiteral(1))),
+                        Print(square))
+    check_equal(unchanged, optimize(unchanged))
+
+    programs = [
+        program,
+        unchanged,
+        Program(Print(Add(Variable("u"), IntLiteral(1))), Print(Add(Variable("u"), IntLiteral(1)))),
+        Program(Assign(x, IntLiteral(0)), Print(Divide(IntLiteral(1), x)), Divide(IntLiteral(1), x)),
+        Program(Assign(Variable("$cse0"), StringLiteral("taken")), Assign(x, IntLiteral(1)),
+                Print(Add(x, x)), Add(x, x), Variable("$cse0")),
+        Program(Assign(x, IntLiteral(0)),
+                While(Lt(Multiply(x, x), IntLiteral(50)),
+                      Sequence(Print(Multiply(x, x)), Assign(x, Add(x, IntLiteral(1))),
+                               Print(Multiply(x, x)))),
+                Multiply(x, x)),
+        Program(Assign(x, BooleanLiteral(True)),
+                Add(And(x, Not(x)), Sequence(Assign(x, BooleanLiteral(False)), And(x, Not(x))))),
+    ]
+    for program in programs:
+        check_same_behavior(program, run_optimized)
+
+
+def test_optimize_hoists_loop_invariants():
+    i, n, total = Variable("i"), Variable("n"), Variable("total")
+    loop = While(Lt(i, Multiply(n, IntLiteral(4))),
+                 Sequence(Assign(total, Add(total, Multiply(n, IntLiteral(4)))),
+                          Assign(i, Add(i, IntLiteral(1)))))
+    program = Program(Assign(n, IntLiteral(3)), Assign(i, IntLiteral(0)),
+                      Assign(total, IntLiteral(0)), loop, total)
+    optimized = optimize(program)
+    peeled = optimized.exprs[3]
+    check_equal(If, type(peeled))
+    check_equal(Lt(i, Assign(Variable("$licm0"), Multiply(n, IntLiteral(4)))), peeled.condition)
+    rest = peeled.true.exprs[1]
+    check_equal(While(Lt(i, Variable("$licm0")),
+                      Sequence(Assign(total, Add(total, Variable("$licm0"))),
+                               Assign(i, Add(i, IntLiteral(1))))), rest)
+    check_equal((144, Integer()), run_optimized(program, EmptyState())[:2])
+
+    # Loops whose condition might not be Boolean are not peeled.
+    flag = Program(Assign(Variable("f"), BooleanLiteral(False)),
+                   While(Variable("f"), Print(Multiply(n, IntLiteral(4)))))
+    check_equal(flag, optimize(flag))
+
+    zero = Variable("zero")
+    programs = [
+        program,
+        flag,
+        # An invariant that raises only fails if the loop runs, and only
+        # after what comes before it in the body.
+        Program(Assign(zero, IntLiteral(0)), Assign(i, IntLiteral(0)),
+                While(Lt(i, IntLiteral(0)), Print(Divide(IntLiteral(1), zero))), Print(i)),
+        Program(Assign(zero, IntLiteral(0)), Assign(i, IntLiteral(0)),
+                While(Lt(i, IntLiteral(3)),
+                      Sequence(Print(i), Assign(i, Add(i, IntLiteral(1))),
+                               Print(Divide(IntLiteral(1), zero))))),
+        Program(Assign(zero, IntLiteral(0)), Assign(i, IntLiteral(0)),
+                While(Lt(i, IntLiteral(3)),
+                      Sequence(Assign(i, Add(i, IntLiteral(1))),
+                               If(Lt(i, IntLiteral(3)), Ren(), Print(Divide(IntLiteral(1), zero)))))),
+        Program(Assign(n, StringLiteral("s")), Assign(i, IntLiteral(0)),
+                While(Lt(i, IntLiteral(2)),
+                      Sequence(Assign(i, Add(i, IntLiteral(1))), Print(Subtract(n, n))))),
+        # Nested loops.
+        Program(Assign(n, IntLiteral(2)), Assign(i, IntLiteral(0)), Assign(total, IntLiteral(0)),
+                While(Lt(i, Add(n, IntLiteral(1))),
+                      Sequence(Assign(Variable("j"), IntLiteral(0)),
+                               While(Lt(Variable("j"), Multiply(n, n)),
+                                     Sequence(Assign(total, Add(total, Multiply(i, Multiply(n, n)))),
+                                              Assign(Variable("j"), Add(Variable("j"), IntLiteral(1))))),
+                               Assign(i, Add(i, IntLiteral(1))))),
+                total),
+        Program(Assign(i, IntLiteral(0)),
+                While(And(Lt(i, IntLiteral(2)), Eq(Variable("undefined"), IntLiteral(1))),
+                      Assign(i, Add(i, IntLiteral(1))))),
+    ]
+    for program in programs:
+        check_same_behavior(program, run_optimized)
+
+    # A step limit stops the optimized program after the same iterations.
+    printing = Program(Assign(n, IntLiteral(3)), Assign(i, IntLiteral(0)),
+                       While(Lt(i, Multiply(n, IntLiteral(100))),
+                             Sequence(Print(Add(i, Multiply(n, IntLiteral(4)))),
+                                      Assign(i, Add(i, IntLiteral(1))))))
+    check_equal(If, type(optimize(printing).exprs[2]))
+    runs = []
+    for backend in (None, run_optimized):
+        lines = []
+        try:
+            run_stimpl(printing, backend=backend, output=lines, limits=Limits(max_steps=5))
+        except InterpLimitError as e:
+            runs.append((e.steps, lines))
+            continue
+        raise AssertionError("Expected InterpLimitError")
+    check_equal((5, ["12", "13", "14", "15", "16"]), runs[0])
+    check_equal(runs[0], runs[1])
+
+
+def test_optimized_final_state():
+    i, n, x = Variable("i"), Variable("n"), Variable("x")
+    program = Program(Assign(x, IntLiteral(3)), Assign(n, IntLiteral(2)), Assign(i, IntLiteral(0)),
+                      Print(Multiply(x, x)),
+                      While(Lt(i, Multiply(n, IntLiteral(4))), Assign(i, Add(i, IntLiteral(1)))),
+                      Multiply(x, x))
+    optimized = optimize(program)
+    check_equal(True, "$cse0" in assigned_variables(optimized) and "$licm0" in assigned_variables(optimized))
+    expected = run_stimpl(program, output=[])
+    for limits in (None, Limits(max_variables=3)):
+        check_equal(repr(expected), repr(run_stimpl(program, backend=run_optimized, output=[], limits=limits)))
+    # Temporaries in a branch that does not run never exist, so they do
+    # not make room for more of the program's own variables.
+    f = Variable("f")
+    skipped = Program(Assign(x, IntLiteral(3)), Assign(f, BooleanLiteral(False)),
+                      If(f, Sequence(Print(Multiply(x, x)), Multiply(x, x)), Ren()),
+                      Assign(n, IntLiteral(1)))
+    check_equal(True, "$cse0" in assigned_variables(optimize(skipped)))
+    for limited in (program, skipped):
+        for backend in (None, run_optimized):
+            try:
+                run_stimpl(limited, backend=backend, output=[], limits=Limits(max_variables=2))
+            except InterpLimitError:
+                continue
+            raise AssertionError("Expected InterpLimitError")
+
+    # A temporary is never named after a variable the program only
+    # reads, or after one the initial state holds.
+    reads = Program(Assign(n, Multiply(x, x)), Multiply(x, x), Variable("$cse0"))
+    initial = EmptyState().set_value("x", 2, INTEGER).set_value("$cse0", "s", STRING)
+    for program in (reads, Program(Assign(n, Multiply(x, x)), Multiply(x, x))):
+        check_equal(repr(evaluate(program, initial)), repr(run_optimized(program, initial)))
@@ -0,0 +1,77 @@
+import io
+
+from stimpl.compiler import run_compiled
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.iterative import evaluate_iterative
+from stimpl.output import ListSink, NullSink, OutputSink, StreamSink
+from stimpl.runtime import run_stimpl
+from stimpl.test import check_equal
+from stimpl.vm import run_vm
+
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+def printing_loop(count):
+    return Program(
+        Assign(Variable("i"), IntLiteral(0)),
+        While(Lt(Variable("i"), IntLiteral(count)),
+              Sequence(Print(Variable("i")),
+                       Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))),
+        Print(Ren()))
+
+
+def test_output_sinks():
+    expected = [str(i) for i in range(1000)] + ["Unit"]
+    for backend in (None, run_compiled, run_vm, evaluate_iterative):
+        lines = []
+        run_stimpl(printing_loop(1000), backend=backend, output=lines)
+        check_equal(expected, lines)
+
+        stream = CountingStream()
+        run_stimpl(printing_loop(1000), backend=backend, output=stream)
+        check_equal(1, stream.writes)
+        check_equal("\n".join(expected) + "\n", stream.getvalue())
+
+        run_stimpl(printing_loop(1000), backend=backend, output=NullSink())
+
+    stream = CountingStream()
+    run_stimpl(printing_loop(1000), output=StreamSink(stream, buffer_size=1000))
+    check_equal("\n".join(expected) + "\n", stream.getvalue())
+    check_equal(True, 1 < stream.writes < 10)
+
+
+def test_output_flushed_on_error():
+    stream = io.StringIO()
+    program = Program(Print(StringLiteral("before")), Divide(IntLiteral(1), IntLiteral(0)))
+    try:
+        run_stimpl(program, output=stream)
+    except InterpMathError:
+        pass
+    else:
+        raise AssertionError("Expected InterpMathError")
+    check_equal("before\n", stream.getvalue())
+
+    sink = ListSink()
+    try:
+        run_stimpl(program, output=sink)
+    except InterpMathError:
+        pass
+    else:
+        raise AssertionError("Expected InterpMathError")
+    check_equal(["before"], sink.lines)
+
+    try:
+        OutputSink()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("OutputSink without write_line was instantiated")
@@ -0,0 +1,67 @@
+import os
+import tempfile
+
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.profiler import Profiler
+from stimpl.runtime import run_stimpl
+from stimpl.test import check_equal, check_program_raises
+from stimpl.types import *
+
+
+def counting_program(n):
+    return Program(Assign(Variable("i"), IntLiteral(0)),
+                   Assign(Variable("total"), IntLiteral(0)),
+                   While(Lt(Variable("i"), IntLiteral(n)),
+                         Sequence(Assign(Variable("total"), Add(Variable("total"), Variable("i"))),
+                                  Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))),
+                   Variable("total"))
+
+
+def test_profiler_counts():
+    profiler = Profiler()
+    check_equal((45, Integer()), run_stimpl(counting_program(10), backend=profiler)[:2])
+
+    loop = profiler.nodes[("Program@0", "While@2")]
+    check_equal(1, loop.calls)
+    check_equal(10, loop.iterations)
+    check_equal(11, profiler.nodes[("Program@0", "While@2", "Lt@0")].calls)
+    check_equal(10, profiler.nodes[("Program@0", "While@2", "Sequence@1", "Assign(i)@1")].calls)
+    check_equal((11, 10), (profiler.by_class()["Lt"][0], profiler.by_class()["Sequence"][0]))
+    check_equal(True, loop.total_time >= loop.self_time >= 0)
+
+    # Runs accumulate.
+    run_stimpl(counting_program(5), backend=profiler)
+    check_equal((2, 15), (loop.calls, loop.iterations))
+
+    report = profiler.report()
+    check_equal(True, "Program@0 > While@2" in report)
+    check_equal(True, "Node classes by self time:" in report)
+    check_equal(True, "While loops:" in report)
+
+
+def test_profiler_collapsed_stacks():
+    profiler = Profiler()
+    run_stimpl(counting_program(200), backend=profiler)
+    lines = profiler.collapsed().splitlines()
+    check_equal(True, len(lines) > 0)
+    for line in lines:
+        stack, weight = line.rsplit(" ", 1)
+        check_equal(True, stack.startswith("Program@0"))
+        check_equal(True, int(weight) > 0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.folded")
+        profiler.write_collapsed(path)
+        with open(path) as f:
+            check_equal(profiler.collapsed(), f.read())
+
+
+def test_profiler_errors():
+    profiler = Profiler()
+    check_program_raises(InterpMathError(),
+                         Program(Print(IntLiteral(1)), Divide(IntLiteral(1), IntLiteral(0))),
+                         backend=profiler)
+    check_equal(1, profiler.nodes[("Program@0", "Divide@1")].calls)
+    check_equal(1, profiler.nodes[("Program@0",)].calls)
+    check_equal([], profiler.child_times)
@@ -0,0 +1,75 @@
+from stimpl.compiler import compile_stimpl, run_compiled
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.resolve import resolve, variable_names
+from stimpl.runtime import EmptyState
+from stimpl.test import check_equal, check_same_behavior
+from stimpl.types import *
+from stimpl.vm import run_vm
+
+
+def test_resolution():
+    i, s, x = Variable("i"), Variable("s"), Variable("x")
+    program = Program(
+        Assign(i, IntLiteral(0)),
+        Assign(s, StringLiteral("")),
+        While(Lt(i, IntLiteral(3)),
+              Sequence(Assign(s, Add(s, StringLiteral("a"))),
+                       Assign(i, Add(i, IntLiteral(1))))),
+        # x is assigned two types, one of them only if a branch is taken.
+        If(Eq(s, StringLiteral("aaa")), Assign(x, IntLiteral(1)), Assign(x, StringLiteral("one"))),
+        Print(Variable("y")),
+        x)
+    check_equal(["x", "y", "s", "i"], variable_names(program))
+
+    resolution = resolve(program)
+    check_equal([None, None, String, Integer], resolution.types)
+    check_equal([None] * 4, resolve(program, typed=False).types)
+    check_equal(True, resolution.admits(EmptyState()))
+    check_equal(True, resolution.admits(EmptyState().set_value("i", 7, INTEGER).set_value("x", 1.5, FLOATING_POINT)))
+    check_equal(False, resolution.admits(EmptyState().set_value("s", 7, INTEGER)))
+
+    # y is read before it is ever assigned.
+    for backend in (run_compiled, run_vm):
+        check_same_behavior(program, backend)
+    values, types = resolution.load(EmptyState().set_value("y", 2, INTEGER))
+    check_equal([None, 2, None, None], values)
+    check_equal([None, INTEGER, None, None], types)
+    values[2], types[2] = "aaa", STRING
+    check_equal(repr(EmptyState().set_value("x", 1.5, FLOATING_POINT).set_value("y", 2, INTEGER)
+                     .set_value("s", "aaa", STRING)),
+                repr(resolution.store(values, types, EmptyState().set_value("x", 1.5, FLOATING_POINT))))
+
+
+def test_compiled_slots():
+    i, total = Variable("i"), Variable("total")
+    program = Program(
+        Assign(total, Add(total, IntLiteral(1))),
+        Assign(i, IntLiteral(0)),
+        While(Lt(i, Variable("n")),
+              Sequence(Assign(total, Add(total, Multiply(i, i))),
+                       Assign(i, Add(i, IntLiteral(1))))),
+        total)
+    compiled = compile_stimpl(program)
+    initial = EmptyState().set_value("total", 10, INTEGER).set_value("n", 5, INTEGER) \
+        .set_value("other", "kept", STRING)
+    value, value_type, state = compiled(initial)
+    check_equal((41, INTEGER), (value, value_type))
+    check_equal("i: (5, Integer), n: (5, Integer), other: ('kept', String), total: (41, Integer), ",
+                repr(state))
+
+    # An initial state that contradicts the static type of total runs
+    # through the untyped version, which raises where evaluate does.
+    for state in (EmptyState().set_value("total", 1.5, FLOATING_POINT),
+                  EmptyState().set_value("total", "s", STRING).set_value("n", 0, INTEGER)):
+        try:
+            compiled(state)
+        except InterpTypeError:
+            continue
+        raise AssertionError("Expected InterpTypeError")
+    try:
+        compiled(EmptyState())
+    except InterpSyntaxError:
+        pass
+    else:
+        raise AssertionError("Expected InterpSyntaxError")
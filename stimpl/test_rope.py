@@ -0,0 +1,94 @@
+import asyncio
+import os
+import pickle
+import tempfile
+
+from stimpl.aio import run_stimpl_async
+from stimpl.checkpoint import run_resumable
+from stimpl.compiler import run_checked, run_compiled
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.iterative import evaluate_iterative
+from stimpl.limits import Limits
+from stimpl.rope import Rope, concat, flatten
+from stimpl.runtime import run_stimpl
+from stimpl.test import check_equal, check_same_behavior
+from stimpl.types import *
+from stimpl.vm import run_vm
+
+
+def test_rope_values():
+    base = concat("x" * 300, "y")
+    check_equal(Rope, type(base))
+    # Appending to the same rope twice must not let the second append
+    # see the first.
+    left = base
+    right = base
+    for k in range(100):
+        left = concat(left, "l" * (k % 7))
+        right = concat(right, "r" * (k % 300))
+    check_equal("x" * 300 + "y", str(base))
+    check_equal("x" * 300 + "y" + "".join("l" * (k % 7) for k in range(100)), str(left))
+    check_equal("x" * 300 + "y" + "".join("r" * (k % 300) for k in range(100)), str(right))
+    check_equal(len(str(right)), len(right))
+
+    flat = str(left)
+    check_equal(True, left == flat and flat == left and not left != flat)
+    check_equal(hash(flat), hash(left))
+    check_equal(True, base < left and flat > base and left >= flat and base <= "y")
+    check_equal(repr(flat), repr(left))
+    check_equal(f"<{flat}>", f"<{left}>")
+    check_equal(flat, pickle.loads(pickle.dumps(left)))
+    check_equal(str, type(flatten(left)))
+    check_equal(7, flatten(7))
+    check_equal("ab", concat("a", "b"))
+    check_equal(str(concat(left, "!")), flat + "!")
+
+
+def building(iterations):
+    i, s, t = Variable("i"), Variable("s"), Variable("t")
+    return Program(
+        Assign(s, StringLiteral("")),
+        Assign(t, StringLiteral("é")),
+        Assign(i, IntLiteral(0)),
+        While(Lt(i, IntLiteral(iterations)),
+              Sequence(Assign(s, Add(s, StringLiteral("ab"))),
+                       Assign(t, Add(StringLiteral("<"), t)),
+                       If(Eq(Subtract(i, Multiply(Divide(i, IntLiteral(50)), IntLiteral(50))), IntLiteral(0)),
+                          Print(Sequence(Print(Lt(s, t)), Print(Ne(s, t)), Add(s, t))),
+                          Ren()),
+                       Assign(i, Add(i, IntLiteral(1))))),
+        Print(Eq(s, Add(StringLiteral(""), s))),
+        Add(s, t))
+
+
+def test_rope_programs():
+    program = building(400)
+    for backend in (evaluate_iterative, run_vm, run_compiled, run_checked):
+        check_same_behavior(program, backend)
+    lines = []
+    value, value_type, state = run_stimpl(program, output=lines)
+    check_equal(8 * 3 + 1, len(lines))
+    check_equal(STRING, value_type)
+    check_equal(str, type(value))
+    check_equal("ab" * 400 + "<" * 400 + "é", value)
+    check_equal("ab" * 400, state.get_value("s")[0])
+
+    # Strings left in the final State are flattened as well.
+    with tempfile.TemporaryDirectory() as directory:
+        runs = [run_stimpl(program, backend=backend, output=[])
+                for backend in (None, evaluate_iterative, run_vm, run_compiled)]
+        runs.append(asyncio.run(run_stimpl_async(program, output=[])))
+        runs.append(run_resumable(program, os.path.join(directory, "job"), output=[]))
+    for value, value_type, state in runs:
+        check_equal(str, type(value))
+        for variable_name in ("s", "t"):
+            check_equal(str, type(state.get_value(variable_name)[0]))
+
+    limited = Limits(max_string_length=1000)
+    for backend in (None, evaluate_iterative, run_vm, run_compiled):
+        try:
+            run_stimpl(building(1000), backend=backend, output=[], limits=limited)
+        except InterpLimitError:
+            continue
+        raise AssertionError("Expected InterpLimitError")
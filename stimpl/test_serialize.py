@@ -0,0 +1,79 @@
+import io
+import math
+import os
+import tempfile
+
+from stimpl.expression import *
+from stimpl.iterative import evaluate_iterative
+from stimpl.runtime import EmptyState
+from stimpl.serialize import ProgramImage, dump, dumps, load, loads, open_image
+from stimpl.test import check_equal
+from stimpl.types import *
+
+
+def every_node_program():
+    x = Variable("x")
+    return Program(
+        Ren(),
+        Assign(x, IntLiteral(-2 ** 70)),
+        Assign(Variable("y"), FloatingPointLiteral(-0.0)),
+        Print(StringLiteral("héllo \ud800 world")),
+        Not(BooleanLiteral(True)),
+        And(BooleanLiteral(False), Or(BooleanLiteral(True), BooleanLiteral(False))),
+        Lt(IntLiteral(0), IntLiteral(255)), Lte(IntLiteral(-1), IntLiteral(256)),
+        Gt(FloatingPointLiteral(math.inf), FloatingPointLiteral(1e-300)),
+        Gte(StringLiteral(""), StringLiteral("a")),
+        Eq(x, x), Ne(Ren(), Ren()),
+        Add(x, IntLiteral(1)), Subtract(x, IntLiteral(1)),
+        Multiply(x, IntLiteral(2)), Divide(x, IntLiteral(3)),
+        Sequence(),
+        Sequence(Print(x), x),
+        If(BooleanLiteral(True), Ren(), Sequence(Ren())),
+        While(BooleanLiteral(False), Assign(x, IntLiteral(0))),
+        FloatingPointLiteral(math.nan))
+
+
+def test_serialize_round_trip():
+    program = every_node_program()
+    data = dumps(program)
+    check_equal(b"STPL", data[:4])
+    check_equal(program, loads(data))
+
+    buffer = io.BytesIO()
+    dump(program, buffer)
+    buffer.seek(0)
+    check_equal(program, load(buffer))
+
+    # Shared nodes are written once and stay shared.
+    shared = Add(IntLiteral(1), IntLiteral(2))
+    loaded = loads(dumps(Program(shared, Multiply(shared, shared))))
+    check_equal(True, loaded.exprs[0] is loaded.exprs[1].left is loaded.exprs[1].right)
+
+    # Deep trees do not recurse.
+    deep = IntLiteral(0)
+    for i in range(100000):
+        deep = Add(deep, IntLiteral(1))
+    check_equal((100000, Integer()), evaluate_iterative(loads(dumps(Program(deep))), EmptyState())[:2])
+
+
+def test_serialize_image():
+    program = every_node_program()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.stpl")
+        with open(path, "wb") as f:
+            dump(program, f)
+        with open_image(path) as image:
+            check_equal(Program, image.kind(image.root))
+            assignment = image.children(image.root)[1]
+            check_equal(Assign, image.kind(assignment))
+            check_equal(program.exprs[1], image.materialize(assignment))
+            check_equal(None, image.program)
+            check_equal(program, image.materialize())
+
+    for data in (b"", b"NOPE" + dumps(program)[4:], dumps(program)[:30]):
+        try:
+            ProgramImage(data).materialize()
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Loaded a damaged image {data[:8]!r}")
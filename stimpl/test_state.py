@@ -1,7 +1,14 @@
+import os
+import pickle
+import subprocess
+import sys
+
 from stimpl.runtime import EmptyState
 from stimpl.types import Boolean, Integer
 from stimpl.test import check_equal
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 def test_state_implementation():
     state = EmptyState()
     check_equal(None, state.get_value("x")) 
@@ -12,4 +19,44 @@ def test_state_implementation():
     state4 = state3.set_value("x", 7, Integer())
     check_equal((7, Integer()),state4.get_value("x"))
     check_equal((5, Integer()), state2.get_value("x"))
-    check_equal(None,state4.get_value("y"))
\ No newline at end of file
+    check_equal(None,state4.get_value("y"))
+
+def test_state_many_updates():
+    state = EmptyState()
+    for i in range(100000):
+        state = state.set_value("counter", i, Integer())
+    check_equal((99999, Integer()), state.get_value("counter"))
+    check_equal(1, len(state))
+
+    states = [state]
+    for i in range(2000):
+        states.append(states[-1].set_value(f"v{i}", i, Integer()))
+    final_state = states[-1]
+    check_equal(2001, len(final_state))
+    for i in range(2000):
+        check_equal((i, Integer()), final_state.get_value(f"v{i}"))
+        check_equal(None, states[i].get_value(f"v{i}"))
+        check_equal((i, Integer()), states[i + 1].get_value(f"v{i}"))
+    check_equal((99999, Integer()), final_state.get_value("counter"))
+    check_equal(2001, len(list(final_state.items())))
+
+def test_state_pickles_across_processes():
+    state = EmptyState()
+    for i in range(100):
+        state = state.set_value(f"v{i}", i, Integer())
+    state = state.set_value("x", 5, Integer()).set_value("k", True, Boolean())
+    copy = pickle.loads(pickle.dumps(state))
+    check_equal(repr(state), repr(copy))
+    check_equal((True, Boolean()), copy.get_value("k"))
+    check_equal(None, copy.get_value("y"))
+    check_equal((6, Integer()), copy.set_value("x", 6, Integer()).get_value("x"))
+
+    # Names hash differently in a process with another hash seed.
+    script = ("import pickle, sys\n"
+              "state = pickle.load(sys.stdin.buffer)\n"
+              "print(len(state), state.get_value('x'), state.get_value('v99'), state.get_value('y'))\n")
+    for seed in ("1", "2"):
+        child = subprocess.run([sys.executable, "-c", script], cwd=ROOT, input=pickle.dumps(state),
+                               capture_output=True, check=True,
+                               env=dict(os.environ, PYTHONHASHSEED=seed))
+        check_equal("102 (5, Integer) (99, Integer) None", child.stdout.decode().strip())
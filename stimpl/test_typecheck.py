@@ -0,0 +1,74 @@
+from stimpl.compiler import run_checked
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.test import check_equal, check_same_behavior, run_stimpl_sanity_tests
+from stimpl.typecheck import typecheck
+from stimpl.types import *
+
+
+def check_typecheck_raises(program):
+    try:
+        typecheck(program)
+    except InterpTypeError:
+        return
+    raise AssertionError(f"typecheck should have rejected {program}")
+
+
+def test_typecheck_infers_types():
+    counter = Assign(Variable("i"), Add(Variable("i"), IntLiteral(1)))
+    mixed = If(Variable("flag"), IntLiteral(1), StringLiteral("one"))
+    program = Program(
+        Assign(Variable("i"), IntLiteral(0)),
+        Assign(Variable("flag"), Lt(Variable("i"), IntLiteral(3))),
+        While(Variable("flag"),
+              Sequence(counter,
+                       Assign(Variable("flag"), Lt(Variable("i"), IntLiteral(3))))),
+        Assign(Variable("m"), mixed),
+        Assign(Variable("x"), FloatingPointLiteral(1.5)),
+    )
+    annotations = typecheck(program)
+    check_equal(Integer(), annotations.variable_type("i"))
+    check_equal(Boolean(), annotations.variable_type("flag"))
+    check_equal(FloatingPoint(), annotations.variable_type("x"))
+    check_equal(None, annotations.variable_type("m"))
+    check_equal(Integer(), annotations.type_of(counter))
+    check_equal(None, annotations.type_of(mixed))
+    check_equal(FloatingPoint(), annotations.type_of(program))
+
+
+def test_typecheck_rejects_ill_typed_programs():
+    check_typecheck_raises(Add(IntLiteral(1), FloatingPointLiteral(1.0)))
+    check_typecheck_raises(Program(Assign(Variable("i"), IntLiteral(1)),
+                                   Assign(Variable("i"), StringLiteral("1"))))
+    check_typecheck_raises(If(IntLiteral(1), Ren(), Ren()))
+    check_typecheck_raises(While(Ren(), Ren()))
+    check_typecheck_raises(Not(StringLiteral("no")))
+    check_typecheck_raises(Program(Assign(Variable("s"), StringLiteral("s")),
+                                   Subtract(Variable("s"), Variable("s"))))
+    # Errors are found even in code that would never run.
+    check_typecheck_raises(If(BooleanLiteral(False),
+                              And(IntLiteral(1), IntLiteral(1)), Ren()))
+
+
+def test_checked_sanity():
+    run_stimpl_sanity_tests(backend=run_checked)
+
+
+def test_checked_matches_evaluate():
+    programs = [
+        Program(Assign(Variable("i"), IntLiteral(0)),
+                Assign(Variable("total"), FloatingPointLiteral(0.0)),
+                While(Lt(Variable("i"), IntLiteral(10)),
+                      Sequence(Assign(Variable("total"),
+                                      Add(Variable("total"), FloatingPointLiteral(0.5))),
+                               Print(Variable("total")),
+                               Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))),
+                Divide(Variable("total"), FloatingPointLiteral(2.0))),
+        Program(Assign(Variable("i"), IntLiteral(0)),
+                Divide(IntLiteral(1), Variable("i"))),
+        Program(Print(Variable("undefined"))),
+        Program(Assign(Variable("m"), If(BooleanLiteral(True), IntLiteral(1), Ren())),
+                Add(Variable("m"), IntLiteral(1))),
+    ]
+    for program in programs:
+        check_same_behavior(program, run_checked)
@@ -0,0 +1,14 @@
+import pickle
+
+from stimpl.test import check_equal
+from stimpl.types import *
+
+
+def test_types_are_interned():
+    for type_class, instance in ((Unit, UNIT), (Integer, INTEGER),
+                                 (FloatingPoint, FLOATING_POINT),
+                                 (String, STRING), (Boolean, BOOLEAN)):
+        check_equal(True, type_class() is instance)
+        check_equal(True, pickle.loads(pickle.dumps(instance)) is instance)
+    check_equal(False, INTEGER == FLOATING_POINT)
+    check_equal({INTEGER: "int", STRING: "str"}, {Integer(): "int", String(): "str"})
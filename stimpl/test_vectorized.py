@@ -0,0 +1,91 @@
+import importlib.util
+from unittest import SkipTest
+
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.runtime import EmptyState, evaluate
+from stimpl.test import check_equal
+from stimpl.types import *
+
+
+def row_by_row(program, inputs, lanes):
+    from stimpl.vectorized import _evaluate_row, _initial_state
+    return [_evaluate_row(program, _initial_state(inputs, lane)) for lane in range(lanes)]
+
+
+def check_vectorized(program, inputs, lanes=None):
+    from stimpl.vectorized import run_vectorized
+    results = run_vectorized(program, inputs, lanes)
+    lanes = len(results)
+    for lane, (result, expected) in enumerate(zip(results, row_by_row(program, inputs, lanes))):
+        check_equal(type(expected.error), type(result.error))
+        check_equal(str(expected.error), str(result.error))
+        check_equal(expected.output, result.output)
+        check_equal((expected.value, expected.type), (result.value, result.type))
+        check_equal(type(expected.value), type(result.value))
+        check_equal(repr(expected.state), repr(result.state))
+    return results
+
+
+def test_vectorized_batches():
+    if importlib.util.find_spec("numpy") is None:
+        raise SkipTest("numpy not installed")
+
+    # Lanes leave the loop after different numbers of iterations.
+    n = Variable("n")
+    steps = Variable("steps")
+    collatz = Program(
+        Assign(steps, IntLiteral(0)),
+        While(Gt(n, IntLiteral(1)),
+              Sequence(If(Eq(Subtract(n, Multiply(Divide(n, IntLiteral(2)), IntLiteral(2))), IntLiteral(0)),
+                          Assign(n, Divide(n, IntLiteral(2))),
+                          Assign(n, Add(Multiply(IntLiteral(3), n), IntLiteral(1)))),
+                       Assign(steps, Add(steps, IntLiteral(1))))),
+        Print(steps),
+        steps)
+    results = check_vectorized(collatz, {"n": list(range(1, 60))})
+    check_equal((111, Integer()), (results[26].value, results[26].type))
+
+    # Division by zero fails only the lanes it happens in.
+    x = Variable("x")
+    y = Variable("y")
+    quotient = Program(Print(x), Assign(Variable("q"), Divide(x, y)), Print(Variable("q")),
+                       Divide(FloatingPointLiteral(1.5), FloatingPointLiteral(float(0))))
+    results = check_vectorized(quotient, {"x": [7, -7, 3, 0, -9], "y": [2, 2, 0, 0, -4]})
+    check_equal([InterpMathError, InterpMathError, InterpMathError, InterpMathError, InterpMathError],
+                [type(result.error) for result in results])
+    check_equal(["7", "3"], results[0].output)
+    check_equal(["3"], results[2].output)
+    check_vectorized(Program(Divide(x, y), Print(Lt(x, y)), And(Gt(x, y), Ne(x, y))),
+                     {"x": [1.0, -2.5, 0.0, 9.0], "y": [3.0, 0.0, -0.0, 1e-300]})
+    check_vectorized(Divide(x, y), {"x": [True, False], "y": [False, True]})
+
+    # Integers that outgrow 64 bits.
+    big = Program(While(Lt(x, IntLiteral(2 ** 70)), Assign(x, Multiply(x, y))), Print(x),
+                  Divide(Subtract(IntLiteral(-2 ** 63), x), IntLiteral(-1)))
+    check_vectorized(big, {"x": [1, 3, 2, 2 ** 63 - 1], "y": [2, 7, 5, 3]})
+    check_vectorized(Add(x, y), {"x": [2 ** 62, -2 ** 63], "y": [2 ** 62, -1]})
+
+    # Strings, booleans, units and printing.
+    s = Variable("s")
+    strings = Program(If(Not(Eq(s, StringLiteral(""))),
+                         Assign(s, Add(s, StringLiteral("!"))),
+                         Print(Ren())),
+                      Print(Or(Lt(s, StringLiteral("b")), BooleanLiteral(False))),
+                      Print(Sequence()),
+                      s)
+    check_vectorized(strings, {"s": ["a", "", "zz", "b"]})
+
+    # Lanes the columns cannot represent are evaluated on their own.
+    z = Variable("z")
+    mixed = Program(If(Lt(x, IntLiteral(2)),
+                       Assign(z, IntLiteral(1)),
+                       Assign(z, StringLiteral("one"))),
+                    Print(z),
+                    If(Lt(x, IntLiteral(1)), Assign(Variable("w"), x), Ren()),
+                    Add(Variable("w"), x))
+    check_vectorized(mixed, {"x": [0, 1, 2, 3]})
+    check_vectorized(Program(Print(x), Add(x, StringLiteral("s"))), {"x": ["a", 1, 2.0, True]})
+    check_vectorized(Program(Ne(x, IntLiteral(1)), While(x, Assign(x, Not(x)))), {"x": [1, True, False]})
+    check_vectorized(Program(Print(IntLiteral(1)), Lt(Ren(), Ren())), {}, lanes=3)
+    check_equal([], check_vectorized(Program(Print(x)), {"x": []}))
@@ -0,0 +1,36 @@
+from stimpl.expression import *
+from stimpl.runtime import EmptyState
+from stimpl.test import check_equal, check_same_behavior, run_stimpl_sanity_tests
+from stimpl.test_compiler import BACKEND_EDGE_CASES
+from stimpl.types import *
+from stimpl.vm import compile_bytecode, execute, run_vm
+
+
+def test_vm_sanity():
+    run_stimpl_sanity_tests(backend=run_vm)
+
+
+def test_vm_matches_evaluate():
+    for program in BACKEND_EDGE_CASES:
+        check_same_behavior(program, run_vm)
+
+
+def test_vm_deep_programs():
+    program = IntLiteral(0)
+    for i in range(100000):
+        program = Add(program, IntLiteral(1))
+    check_equal((100000, Integer()), execute(compile_bytecode(program), EmptyState())[:2])
+
+    program = Sequence(*[Assign(Variable(f"v{i % 100}"), IntLiteral(i)) for i in range(10000)])
+    value, value_type, state = run_vm(program, EmptyState())
+    check_equal((9999, Integer()), (value, value_type))
+    check_equal((9900, Integer()), state.get_value("v0"))
+    check_equal(100, len(state))
+
+
+def test_vm_keeps_initial_state():
+    state = EmptyState().set_value("x", 1, Integer()).set_value("y", "y", String())
+    value, value_type, state = run_vm(
+        Assign(Variable("x"), Add(Variable("x"), IntLiteral(1))), state)
+    check_equal((2, Integer()), state.get_value("x"))
+    check_equal(("y", String()), state.get_value("y"))
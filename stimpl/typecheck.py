@@ -0,0 +1,267 @@
+from typing import Dict, Optional, Set
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+
+"""
+Static type checker.
+
+typecheck infers the type of every expression and every variable of a
+program before it runs. Since a variable's type is fixed by its first
+assignment, every assignment to a variable anywhere in the program must
+produce the same type; a variable only gets a static type when all of its
+assignments do. Expressions whose type depends on the path taken at run
+time (for example an If whose branches have different types) are left
+unannotated and keep their dynamic checks.
+
+Errors that are certain whenever the offending expression runs are raised
+as InterpTypeError ahead of time, even if that expression is never reached.
+infer_types makes the same inference without raising anything, for
+backends that only use the types to skip checks.
+"""
+
+_ARITHMETIC = {
+    Add: ("add", (Integer, String, FloatingPoint)),
+    Subtract: ("subtract", (Integer, FloatingPoint)),
+    Multiply: ("multiply", (Integer, FloatingPoint)),
+    Divide: ("divide", (Integer, FloatingPoint)),
+}
+
+_COMPARISONS = (Lt, Lte, Gt, Gte, Eq)
+
+_MAX_ROUNDS = 64
+
+_LOGICAL = {
+    And: "and",
+    Or: "or",
+}
+
+
+class TypeAnnotations(object):
+    def __init__(self, program: Expr, expression_types: Dict[int, Optional[type]],
+                 variable_types: Dict[str, Optional[type]]) -> None:
+        # Annotations are keyed by node identity; hold on to the program so
+        # that those identities stay valid.
+        self.program = program
+        self.expression_types = expression_types
+        self.variable_types = variable_types
+
+    def static_type(self, expression: Expr) -> Optional[type]:
+        """
+        Returns the type class of expression, or None if it is not known.
+        """
+        return self.expression_types.get(id(expression))
+
+    def type_of(self, expression: Expr) -> Optional[Type]:
+        type_class = self.static_type(expression)
+        return type_class() if type_class is not None else None
+
+    def variable_type(self, variable_name: str) -> Optional[Type]:
+        type_class = self.variable_types.get(variable_name)
+        return type_class() if type_class is not None else None
+
+
+class _StaticTypeError(Exception):
+    pass
+
+
+class TypeChecker(object):
+    def __init__(self, variable_types: Dict[str, Optional[type]], strict: bool) -> None:
+        self.variable_types = variable_types
+        self.strict = strict
+        self.expression_types = {}
+        # The first known type assigned to each variable, and the variables
+        # with an assignment whose type is not known.
+        self.assignment_types = {}
+        self.unknown_assignments = set()
+
+    def fail(self, error_msg: str) -> None:
+        if self.strict:
+            raise InterpTypeError(error_msg)
+        raise _StaticTypeError()
+
+    def check(self, expression: Expr) -> Optional[type]:
+        try:
+            expression_type = self.infer(expression)
+        except _StaticTypeError:
+            expression_type = None
+
+        key = id(expression)
+        if key in self.expression_types and self.expression_types[key] is not expression_type:
+            # A shared node seen with two different types.
+            expression_type = None
+        self.expression_types[key] = expression_type
+        return expression_type
+
+    def infer(self, expression: Expr) -> Optional[type]:
+        match expression:
+            case Ren():
+                return Unit
+
+            case IntLiteral():
+                return Integer
+
+            case FloatingPointLiteral():
+                return FloatingPoint
+
+            case StringLiteral():
+                return String
+
+            case BooleanLiteral():
+                return Boolean
+
+            case Print(to_print=to_print):
+                return self.check(to_print)
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                result_type = Unit
+                for expr in exprs:
+                    result_type = self.check(expr)
+                return result_type
+
+            case Variable(variable_name=variable_name):
+                return self.variable_types.get(variable_name)
+
+            case Assign(variable=variable, value=value):
+                value_type = self.check(value)
+                variable_name = variable.variable_name
+                if value_type is None:
+                    self.unknown_assignments.add(variable_name)
+                    self.assignment_types.setdefault(variable_name, None)
+                    return None
+
+                first_type = self.assignment_types.get(variable_name)
+                if first_type is None:
+                    self.assignment_types[variable_name] = value_type
+                elif first_type is not value_type:
+                    self.fail(f"""Mismatched types for Assignment:
+                        Cannot assign {value_type()} to {first_type()}""")
+                return value_type
+
+            case Not(expr=expr):
+                expr_type = self.check(expr)
+                if expr_type is not None and expr_type is not Boolean:
+                    self.fail("Cannot perform logical not on non-boolean operands.")
+                return Boolean
+
+            case BinaryOperator(left=left, right=right):
+                left_type = self.check(left)
+                right_type = self.check(right)
+                return self.infer_binary(expression, left_type, right_type)
+
+            case If(condition=condition, true=true, false=false):
+                condition_type = self.check(condition)
+                if condition_type is not None and condition_type is not Boolean:
+                    self.fail("Cannot perform logical if on non-boolean operands.")
+                true_type = self.check(true)
+                false_type = self.check(false)
+                return true_type if true_type is false_type else None
+
+            case While(condition=condition, body=body):
+                condition_type = self.check(condition)
+                if condition_type is not None and condition_type is not Boolean:
+                    self.fail("While loop requires a boolean condition.")
+                self.check(body)
+                return Boolean
+
+            case _:
+                # evaluate rejects this node when (and if) it is reached.
+                return None
+
+    def infer_binary(self, expression: BinaryOperator, left_type: Optional[type],
+                     right_type: Optional[type]) -> Optional[type]:
+        operator_name = type(expression).__name__
+        if isinstance(expression, Ne):
+            return Boolean
+
+        known = left_type is not None and right_type is not None
+        if known and left_type is not right_type:
+            self.fail(f"""Mismatched types for {operator_name}:
+                Cannot combine {left_type()} and {right_type()}""")
+        operand_type = left_type or right_type
+
+        for operator_class, (verb, allowed) in _ARITHMETIC.items():
+            if isinstance(expression, operator_class):
+                if operand_type is not None and operand_type not in allowed:
+                    self.fail(f"Cannot {verb} {operand_type()}s")
+                return operand_type if known else None
+
+        for operator_class, name in _LOGICAL.items():
+            if isinstance(expression, operator_class):
+                if operand_type is not None and operand_type is not Boolean:
+                    self.fail(
+                        f"Cannot perform logical {name} on non-boolean operands.")
+                return Boolean
+
+        if isinstance(expression, _COMPARISONS):
+            return Boolean
+        return None
+
+
+def _check_round(program: Expr, variable_types, strict: bool) -> TypeChecker:
+    checker = TypeChecker(variable_types, strict)
+    checker.check(program)
+    return checker
+
+
+def _infer_variable_types(program: Expr, dynamic: Set[str]) -> Dict[str, Optional[type]]:
+    dynamic = set(dynamic)
+    while True:
+        variable_types = {}
+        for _ in range(_MAX_ROUNDS):
+            checker = _check_round(program, variable_types, strict=False)
+            new_types = {name: (None if name in dynamic else assigned)
+                         for name, assigned in checker.assignment_types.items()}
+            if new_types == variable_types:
+                newly_dynamic = checker.unknown_assignments - dynamic
+                break
+            variable_types = new_types
+        else:
+            # The assumptions did not settle; give up on static variable types.
+            newly_dynamic = set(checker.assignment_types) - dynamic
+
+        if not newly_dynamic:
+            return variable_types
+        dynamic |= newly_dynamic
+
+
+'''
+Infers and checks the types of program, raising InterpTypeError for
+any expression that cannot be well typed.
+
+Variable types are found optimistically: each variable is assumed to have
+the type of its assignments whose type is already known, and the program
+is re-checked until the assumptions stop changing. Variables with an
+assignment whose type stays unknown are then made dynamic and the search
+is repeated. A final strict pass reports errors under the settled types.
+'''
+def typecheck(program: Expr) -> TypeAnnotations:
+    variable_types = _infer_variable_types(program, set())
+    checker = _check_round(program, variable_types, strict=True)
+    return TypeAnnotations(program, checker.expression_types, variable_types)
+
+
+'''
+Infers the types of program like typecheck, but never raises. Since
+errors are not reported, a variable keeps its static type only if every
+assignment to it is known to produce that type; the others are made
+dynamic. With variables=False every variable is dynamic.
+'''
+def infer_types(program: Expr, variables: bool = True) -> TypeAnnotations:
+    assigned_values = {}
+    for node in subexpressions(program):
+        if isinstance(node, Assign):
+            assigned_values.setdefault(node.variable.variable_name, []).append(node.value)
+
+    dynamic = set() if variables else set(assigned_values)
+    while True:
+        variable_types = _infer_variable_types(program, dynamic)
+        checker = _check_round(program, variable_types, strict=False)
+        mismatched = {name for name, values in assigned_values.items()
+                      if variable_types.get(name) is not None
+                      and any(checker.expression_types.get(id(value)) is not variable_types[name]
+                              for value in values)}
+        if not mismatched:
+            return TypeAnnotations(program, checker.expression_types, variable_types)
+        dynamic |= mismatched
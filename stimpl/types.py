@@ -1,83 +1,56 @@
 """
 Types
+
+Every type class has exactly one instance: calling Integer() always returns
+the same object. Types therefore compare and hash by identity, and can be
+used as dictionary keys or compared with `is`.
 """
 
 
 class Type(object):
-    def __init__(self):
-        pass
+    def __new__(cls):
+        instance = cls.__dict__.get("_instance")
+        if instance is None:
+            instance = super().__new__(cls)
+            cls._instance = instance
+        return instance
 
+    def __reduce__(self):
+        # Unpickling goes through the constructor and gets the singleton.
+        return (type(self), ())
 
-class Unit(Type):
-    def __init__(self):
-        pass
 
+class Unit(Type):
     def __repr__(self):
         return "Unit"
 
-    def __eq__(self, other):
-        match other:
-            case Unit():
-                return True
-            case _:
-                return False
-
 
 class Integer(Type):
-    def __init__(self):
-        pass
-
     def __repr__(self):
         return "Integer"
 
-    def __eq__(self, other):
-        match other:
-            case Integer():
-                return True
-            case _:
-                return False
-
 
 class FloatingPoint(Type):
-    def __init__(self):
-        pass
-
     def __repr__(self):
         return "FloatingPoint"
 
-    def __eq__(self, other):
-        match other:
-            case FloatingPoint():
-                return True
-            case _:
-                return False
-
 
 class String(Type):
-    def __init__(self):
-        pass
-
     def __repr__(self):
         return "String"
 
-    def __eq__(self, other):
-        match other:
-            case String():
-                return True
-            case _:
-                return False
-
 
 class Boolean(Type):
-    def __init__(self):
-        pass
-
     def __repr__(self):
         return "Boolean"
 
-    def __eq__(self, other):
-        match other:
-            case Boolean():
-                return True
-            case _:
-                return False
+
+"""
+The interned instance of each type, for code on hot paths that should not
+pay for a constructor call.
+"""
+UNIT = Unit()
+INTEGER = Integer()
+FLOATING_POINT = FloatingPoint()
+STRING = String()
+BOOLEAN = Boolean()
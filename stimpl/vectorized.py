@@ -0,0 +1,366 @@
+from typing import Any, Dict, List, Optional, Sequence as SequenceType, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.runtime import EmptyState, State, evaluate
+from stimpl import operators
+from stimpl.batch import ProgramResult
+from stimpl.output import ListSink, reset_output, set_output
+from stimpl.rope import flatten, flatten_state
+
+"""
+Vectorized batch evaluation.
+
+run_vectorized runs one program over many rows of inputs at once. Every
+variable holds a NumPy column with one lane per row, operators act on
+whole columns, and If and While run their branches and bodies under a mask
+of the lanes that take them, until every lane has left the loop.
+
+Each lane ends up with the same value, type, state, printed lines and
+error as evaluating the program on that row alone. Division by zero is
+reported per lane as an InterpMathError. A lane that does anything the
+columns cannot represent (an operation evaluate would reject, reading an
+undefined variable, or a variable or result whose type differs from lane
+to lane) leaves the batch and is evaluated on its own afterwards, so its
+result is exactly evaluate's.
+
+NumPy is only imported when run_vectorized is called.
+"""
+
+_PYTHON_TYPES = {bool: BOOLEAN, int: INTEGER, float: FLOATING_POINT, str: STRING}
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("run_vectorized requires NumPy") from None
+    return numpy
+
+
+class _Column(object):
+    def __init__(self, values: Any, value_type: Type, defined: Any) -> None:
+        # None for Unit, whose only value is None.
+        self.values = values
+        self.type = value_type
+        self.defined = defined
+
+
+class _VectorMachine(object):
+    def __init__(self, np: Any, lanes: int) -> None:
+        self.np = np
+        self.lanes = lanes
+        self.active = np.ones(lanes, dtype=bool)
+        self.fallback = np.zeros(lanes, dtype=bool)
+        self.errors: List[Optional[InterpError]] = [None] * lanes
+        self.output: List[List[str]] = [[] for _ in range(lanes)]
+        self.env: Dict[str, _Column] = {}
+        # Keyed by id; each entry keeps its node alive.
+        self.literals = {}
+        np = self.np
+        self.operations = {
+            Add: np.add, Subtract: np.subtract, Multiply: np.multiply,
+            And: np.logical_and, Or: np.logical_or,
+            Lt: np.less, Lte: np.less_equal, Gt: np.greater, Gte: np.greater_equal,
+            Eq: np.equal, Ne: np.not_equal,
+        }
+
+    def column(self, values: List[Any], value_type: Type) -> Any:
+        np = self.np
+        if value_type is INTEGER:
+            if all(_INT64_MIN <= value <= _INT64_MAX for value in values):
+                return np.array(values, dtype=np.int64)
+            return np.array(values, dtype=object)
+        if value_type is FLOATING_POINT:
+            return np.array(values, dtype=np.float64)
+        if value_type is BOOLEAN:
+            return np.array(values, dtype=bool)
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    def leave(self, lanes: Any) -> None:
+        '''
+        Takes lanes out of the batch to be evaluated on their own.
+        '''
+        self.fallback |= lanes & self.active
+        self.active &= ~lanes
+
+    def fail(self, lanes: Any, message: str) -> None:
+        for lane in self.np.flatnonzero(lanes & self.active):
+            self.errors[lane] = InterpMathError(message)
+        self.active &= ~lanes
+
+    '''
+    Evaluates expression in the lanes of mask and returns its column and
+    type. The type is None when no lane is left to evaluate it in.
+    '''
+    def evaluate(self, expression: Expr, mask: Any) -> Tuple[Any, Optional[Type]]:
+        mask = mask & self.active
+        if not mask.any():
+            return (None, None)
+
+        match expression:
+            case Ren():
+                return (None, UNIT)
+
+            case IntLiteral() | FloatingPointLiteral() | StringLiteral() | BooleanLiteral():
+                key = id(expression)
+                if key not in self.literals:
+                    literal_type = _PYTHON_TYPES[type(expression.literal)]
+                    values = self.column([expression.literal] * self.lanes, literal_type)
+                    self.literals[key] = (expression, values, literal_type)
+                return self.literals[key][1:]
+
+            case Variable(variable_name=variable_name):
+                column = self.env.get(variable_name)
+                if column is None:
+                    self.leave(mask)
+                    return (None, None)
+                self.leave(mask & ~column.defined)
+                return (column.values, column.type)
+
+            case Print(to_print=to_print):
+                values, value_type = self.evaluate(to_print, mask)
+                mask = mask & self.active
+                if value_type is None:
+                    return (None, None)
+                lanes = self.np.flatnonzero(mask)
+                printed = [None] * len(lanes) if values is None else values[lanes].tolist()
+                for lane, value in zip(lanes, printed):
+                    self.output[lane].append(operators.printable(value, value_type))
+                return (values, value_type)
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                result = (None, UNIT)
+                for expr in exprs:
+                    result = self.evaluate(expr, mask)
+                    if result[1] is None:
+                        return result
+                return result
+
+            case Assign(variable=variable, value=value):
+                return self.assign(variable.variable_name, value, mask)
+
+            case Not(expr=expr):
+                values, value_type = self.evaluate(expr, mask)
+                if value_type is None:
+                    return (None, None)
+                if value_type is not BOOLEAN:
+                    self.leave(mask)
+                    return (None, None)
+                return (self.np.logical_not(values), BOOLEAN)
+
+            case BinaryOperator(left=left, right=right):
+                operator_class = operators.binary_operator_class(expression)
+                if operator_class is None:
+                    self.leave(mask)
+                    return (None, None)
+                left_values, left_type = self.evaluate(left, mask)
+                if left_type is None:
+                    return (None, None)
+                right_values, right_type = self.evaluate(right, mask)
+                if right_type is None:
+                    return (None, None)
+                mask = mask & self.active
+                if operator_class is Divide:
+                    return self.divide(left_values, left_type, right_values, right_type, mask)
+                fast = operators.FAST_BINARY_OPERATORS.get((operator_class, left_type.__class__))
+                if left_type is not right_type or fast is None:
+                    self.leave(mask)
+                    return (None, None)
+                result = self.operations[operator_class](left_values, right_values)
+                if left_type is INTEGER and operator_class in (Add, Subtract, Multiply):
+                    result = self.checked(operator_class, left_values, right_values, result, mask)
+                return (result, fast[1] or left_type)
+
+            case If(condition=condition, true=true, false=false):
+                condition_values, condition_type = self.evaluate(condition, mask)
+                if condition_type is None:
+                    return (None, None)
+                mask = mask & self.active
+                if condition_type is not BOOLEAN:
+                    self.leave(mask)
+                    return (None, None)
+                true_mask = mask & condition_values
+                false_mask = mask & ~condition_values
+                true_values, true_type = self.evaluate(true, true_mask)
+                false_values, false_type = self.evaluate(false, false_mask)
+                if true_type is None:
+                    return (false_values, false_type)
+                if false_type is None:
+                    return (true_values, true_type)
+                if true_type is not false_type:
+                    self.leave(mask)
+                    return (None, None)
+                if true_type is UNIT:
+                    return (None, UNIT)
+                return (self.np.where(true_mask, true_values, false_values), true_type)
+
+            case While(condition=condition, body=body):
+                running = mask
+                while True:
+                    condition_values, condition_type = self.evaluate(condition, running)
+                    if condition_type is None:
+                        break
+                    running = running & self.active
+                    if condition_type is not BOOLEAN:
+                        self.leave(running)
+                        break
+                    running = running & condition_values
+                    if not running.any():
+                        break
+                    self.evaluate(body, running)
+                return (self.np.zeros(self.lanes, dtype=bool), BOOLEAN)
+
+            case _:
+                self.leave(mask)
+                return (None, None)
+
+    def assign(self, variable_name: str, value: Expr, mask: Any) -> Tuple[Any, Optional[Type]]:
+        values, value_type = self.evaluate(value, mask)
+        if value_type is None:
+            return (None, None)
+        mask = mask & self.active
+        column = self.env.get(variable_name)
+
+        if column is not None and column.type is not value_type:
+            if (column.defined & self.active).any():
+                # Lanes that hold the variable would raise, and the others
+                # would need a second type in the same column.
+                self.leave(mask)
+                return (None, None)
+            column = None
+
+        if column is None:
+            self.env[variable_name] = _Column(values, value_type, mask)
+        else:
+            if values is not None:
+                column.values = self.np.where(mask, values, column.values)
+            column.defined = column.defined | mask
+        return (values, value_type)
+
+    def checked(self, operator_class: type, left: Any, right: Any, result: Any, mask: Any) -> Any:
+        '''
+        Redoes an int64 operation with Python integers if it overflowed in
+        any lane of mask.
+        '''
+        np = self.np
+        if result.dtype == object:
+            return result
+        if operator_class is Add:
+            overflow = ((left ^ result) & (right ^ result)) < 0
+        elif operator_class is Subtract:
+            overflow = ((left ^ right) & (left ^ result)) < 0
+        else:
+            product = np.abs(left.astype(np.float64) * right.astype(np.float64))
+            overflow = product >= 2.0 ** 62
+        if (overflow & mask).any():
+            return self.operations[operator_class](left.astype(object), right.astype(object))
+        return result
+
+    def divide(self, left: Any, left_type: Type, right: Any, right_type: Type,
+               mask: Any) -> Tuple[Any, Optional[Type]]:
+        np = self.np
+        if left_type is not right_type:
+            self.leave(mask)
+            return (None, None)
+        if right_type in (INTEGER, FLOATING_POINT, BOOLEAN):
+            zero = mask & (right == 0)
+            self.fail(zero, "Cannot Divide by 0")
+            mask = mask & ~zero
+        if right_type not in (INTEGER, FLOATING_POINT):
+            self.leave(mask)
+            return (None, None)
+        if not mask.any():
+            return (None, None)
+
+        divisor = np.where(mask, right, 1)
+        if right_type is FLOATING_POINT:
+            return (np.true_divide(left, divisor), FLOATING_POINT)
+        if divisor.dtype != object and (mask & (left == _INT64_MIN) & (divisor == -1)).any():
+            left = left.astype(object)
+            divisor = divisor.astype(object)
+        return (np.floor_divide(left, divisor), INTEGER)
+
+
+def _initial_state(inputs: Dict[str, List[Any]], lane: int) -> State:
+    state = EmptyState()
+    for name, values in inputs.items():
+        value = values[lane]
+        state = state.set_value(name, value, _PYTHON_TYPES[type(value)])
+    return state
+
+
+def _evaluate_row(program: Expr, state: State) -> ProgramResult:
+    sink = ListSink()
+    token = set_output(sink)
+    try:
+        value, value_type, state = evaluate(program, state)
+    except Exception as e:
+        return ProgramResult(None, None, None, sink.lines, e)
+    finally:
+        reset_output(token)
+    return ProgramResult(flatten(value), value_type, flatten_state(state), sink.lines, None)
+
+
+'''
+Runs program once for every row of inputs and returns a ProgramResult per
+row, in order. inputs maps variable names to equally long sequences of
+ints, floats, bools or strs; row i starts with each variable bound to its
+i-th value. lanes gives the number of rows when there are no inputs.
+'''
+def run_vectorized(program: Expr, inputs: Dict[str, SequenceType[Any]],
+                   lanes: Optional[int] = None) -> List[ProgramResult]:
+    np = _numpy()
+    inputs = {name: list(values) for name, values in inputs.items()}
+    lengths = {len(values) for values in inputs.values()}
+    if lanes is not None:
+        lengths.add(lanes)
+    if len(lengths) != 1:
+        raise ValueError("Every input column must have one value per row")
+    lanes = lengths.pop()
+    for name, values in inputs.items():
+        for value in values:
+            if type(value) not in _PYTHON_TYPES:
+                raise TypeError(f"Cannot pass {type(value).__name__} as {name}")
+
+    machine = _VectorMachine(np, lanes)
+    for name, values in inputs.items():
+        column_type = _PYTHON_TYPES[type(values[0])] if values else INTEGER
+        fits = np.array([_PYTHON_TYPES[type(value)] is column_type for value in values], dtype=bool)
+        machine.leave(~fits)
+        placeholder = values[int(np.argmax(fits))] if fits.any() else 0
+        column = machine.column([value if fit else placeholder for value, fit in zip(values, fits)],
+                                column_type)
+        machine.env[name] = _Column(column, column_type, np.ones(lanes, dtype=bool))
+
+    with np.errstate(all="ignore"):
+        values, value_type = machine.evaluate(program, np.ones(lanes, dtype=bool))
+
+    finished = machine.active
+    results = [None] * lanes
+    if finished.any():
+        values = values.tolist() if values is not None else [None] * lanes
+        columns = [(name, column.values.tolist() if column.values is not None else [None] * lanes,
+                    column.type, column.defined)
+                   for name, column in machine.env.items()]
+        for lane in np.flatnonzero(finished):
+            state = EmptyState()
+            for name, column_values, column_type, defined in columns:
+                if defined[lane]:
+                    state = state.set_value(name, column_values[lane], column_type)
+            results[lane] = ProgramResult(values[lane], value_type, state,
+                                          machine.output[lane], None)
+
+    for lane in range(lanes):
+        if machine.errors[lane] is not None:
+            results[lane] = ProgramResult(None, None, None, machine.output[lane],
+                                          machine.errors[lane])
+        elif machine.fallback[lane]:
+            results[lane] = _evaluate_row(program, _initial_state(inputs, lane))
+    return results
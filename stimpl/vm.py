@@ -0,0 +1,301 @@
+from typing import Any, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.runtime import State
+from stimpl import operators
+from stimpl.output import write_output
+from stimpl.limits import check_variable_count, current_budget
+from stimpl.resolve import Resolution, resolve
+
+"""
+Bytecode compiler and stack-based virtual machine.
+
+compile_bytecode flattens a program into a single instruction array with
+explicit jumps for If and While, and execute runs it in one dispatch loop.
+Variables are resolved to numbered slots at compile time (see
+stimpl.resolve) and live in a flat array while the program runs; the
+final State is rebuilt from the slots at the end. Neither compiling nor
+running recurses on the shape of the program, so arbitrarily deep trees
+are fine.
+
+The operand stack holds values and their types in alternating entries.
+"""
+
+PUSH_CONSTANT = 0
+LOAD = 1
+STORE = 2
+POP = 3
+BINARY = 4
+NOT = 5
+PRINT = 6
+JUMP = 7
+JUMP_UNLESS_IF = 8
+WHILE_TEST = 9
+UNHANDLED = 10
+
+OPCODE_NAMES = {
+    PUSH_CONSTANT: "PUSH_CONSTANT",
+    LOAD: "LOAD",
+    STORE: "STORE",
+    POP: "POP",
+    BINARY: "BINARY",
+    NOT: "NOT",
+    PRINT: "PRINT",
+    JUMP: "JUMP",
+    JUMP_UNLESS_IF: "JUMP_UNLESS_IF",
+    WHILE_TEST: "WHILE_TEST",
+    UNHANDLED: "UNHANDLED",
+}
+
+
+class Label(object):
+    __slots__ = ("position",)
+
+    def __init__(self):
+        self.position = None
+
+
+class Bytecode(object):
+    def __init__(self, code: List[Any], constants: List[Tuple[Any, Type]],
+                 resolution: Resolution) -> None:
+        # code is a flat list of opcode, argument pairs.
+        self.code = code
+        self.constants = constants
+        self.resolution = resolution
+        self.slot_names = resolution.names
+
+    def disassemble(self) -> str:
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            opcode, arg = self.code[pc], self.code[pc + 1]
+            if opcode == PUSH_CONSTANT:
+                arg = self.constants[arg]
+            elif opcode in (LOAD, STORE):
+                arg = self.slot_names[arg]
+            elif opcode == BINARY:
+                arg = arg.__name__
+            lines.append(f"{pc:6} {OPCODE_NAMES[opcode]} {arg}")
+        return "\n".join(lines)
+
+
+class BytecodeCompiler(object):
+    def __init__(self):
+        self.code = []
+        self.constants = []
+        self.constant_index = {}
+        self.resolution = None
+
+    def constant(self, value, value_type) -> int:
+        # repr keeps apart constants that compare equal, like 0.0 and -0.0.
+        key = (type(value), repr(value), type(value_type))
+        if key not in self.constant_index:
+            self.constant_index[key] = len(self.constants)
+            self.constants.append((value, value_type))
+        return self.constant_index[key]
+
+    def slot(self, variable_name: str) -> int:
+        return self.resolution.slots[variable_name]
+
+    '''
+    Expands expression into the items that produce its code, in order.
+    An item is a child expression to expand in turn, an (opcode, argument)
+    instruction, or a Label marking a jump target.
+    '''
+    def expand(self, expression: Expr) -> List[Any]:
+        match expression:
+            case Ren():
+                return [(PUSH_CONSTANT, self.constant(None, UNIT))]
+
+            case IntLiteral(literal=l):
+                return [(PUSH_CONSTANT, self.constant(l, INTEGER))]
+
+            case FloatingPointLiteral(literal=l):
+                return [(PUSH_CONSTANT, self.constant(l, FLOATING_POINT))]
+
+            case StringLiteral(literal=l):
+                return [(PUSH_CONSTANT, self.constant(l, STRING))]
+
+            case BooleanLiteral(literal=l):
+                return [(PUSH_CONSTANT, self.constant(l, BOOLEAN))]
+
+            case Print(to_print=to_print):
+                return [to_print, (PRINT, None)]
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                if len(exprs) == 0:
+                    return [(PUSH_CONSTANT, self.constant(None, UNIT))]
+                items = []
+                for expr in exprs:
+                    items.append(expr)
+                    items.append((POP, None))
+                items.pop()
+                return items
+
+            case Variable(variable_name=variable_name):
+                return [(LOAD, self.slot(variable_name))]
+
+            case Assign(variable=variable, value=value):
+                return [value, (STORE, self.slot(variable.variable_name))]
+
+            case Not(expr=expr):
+                return [expr, (NOT, None)]
+
+            case BinaryOperator(left=left, right=right) if operators.binary_operator_class(expression):
+                return [left, right, (BINARY, operators.binary_operator_class(expression))]
+
+            case If(condition=condition, true=true, false=false):
+                false_label, end_label = Label(), Label()
+                return [condition, (JUMP_UNLESS_IF, false_label),
+                        true, (JUMP, end_label),
+                        false_label, false, end_label]
+
+            case While(condition=condition, body=body):
+                loop_label, exit_label = Label(), Label()
+                return [loop_label, condition, (WHILE_TEST, exit_label),
+                        body, (POP, None), (JUMP, loop_label),
+                        exit_label]
+
+            case _:
+                return [(UNHANDLED, None)]
+
+    def compile(self, program: Expr) -> Bytecode:
+        self.resolution = resolve(program, typed=False)
+        code = self.code
+        work = [program]
+        while work:
+            item = work.pop()
+            if isinstance(item, Expr):
+                work.extend(reversed(self.expand(item)))
+            elif isinstance(item, Label):
+                item.position = len(code)
+            else:
+                code.extend(item)
+
+        for pc in range(1, len(code), 2):
+            if isinstance(code[pc], Label):
+                code[pc] = code[pc].position
+        return Bytecode(code, self.constants, self.resolution)
+
+
+def compile_bytecode(program: Expr) -> Bytecode:
+    return BytecodeCompiler().compile(program)
+
+
+'''
+Runs bytecode starting from state and returns the (value, type, state)
+of the program, exactly as evaluate would.
+'''
+def execute(bytecode: Bytecode, state: State) -> Tuple[Optional[Any], Type, State]:
+    code = bytecode.code
+    constants = bytecode.constants
+    slot_names = bytecode.slot_names
+    binary_operators = operators.BINARY_OPERATORS
+    fast_binary = operators.FAST_BINARY_OPERATORS
+    budget = current_budget()
+    # The number of variables in the state the slots will be written back to.
+    variable_count = len(state)
+
+    values = []
+    types = []
+    for variable_name in slot_names:
+        initial = state.get_value(variable_name)
+        values.append(initial[0] if initial is not None else None)
+        types.append(initial[1] if initial is not None else None)
+
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    pc = 0
+    end = len(code)
+    while pc < end:
+        opcode = code[pc]
+        arg = code[pc + 1]
+        pc += 2
+
+        if opcode == LOAD:
+            value_type = types[arg]
+            if value_type is None:
+                raise operators.read_error(slot_names[arg])
+            push(values[arg])
+            push(value_type)
+
+        elif opcode == PUSH_CONSTANT:
+            value, value_type = constants[arg]
+            push(value)
+            push(value_type)
+
+        elif opcode == BINARY:
+            right_type = pop()
+            right_value = pop()
+            left_type = stack[-1]
+            left_value = stack[-2]
+            fast = None
+            if left_type.__class__ is right_type.__class__:
+                fast = fast_binary.get((arg, left_type.__class__))
+            if fast is not None:
+                compute, result_type = fast
+                stack[-2] = compute(left_value, right_value)
+                if result_type is not None:
+                    stack[-1] = result_type
+            else:
+                stack[-2], stack[-1] = binary_operators[arg](
+                    left_value, left_type, right_value, right_type)
+
+        elif opcode == STORE:
+            value_type = stack[-1]
+            previous_type = types[arg]
+            if previous_type is None:
+                variable_count += 1
+                check_variable_count(variable_count)
+            elif previous_type is not value_type:
+                operators.check_assignment(previous_type, value_type)
+            values[arg] = stack[-2]
+            types[arg] = value_type
+
+        elif opcode == POP:
+            del stack[-2:]
+
+        elif opcode == WHILE_TEST:
+            operators.check_while_condition(stack[-1])
+            if stack[-2]:
+                del stack[-2:]
+                if budget is not None:
+                    budget.charge()
+            else:
+                pc = arg
+
+        elif opcode == JUMP:
+            pc = arg
+
+        elif opcode == JUMP_UNLESS_IF:
+            condition_type = pop()
+            condition_value = pop()
+            operators.check_if_condition(condition_type)
+            if not condition_value:
+                pc = arg
+
+        elif opcode == NOT:
+            stack[-2], stack[-1] = operators.logical_not(stack[-2], stack[-1])
+
+        elif opcode == PRINT:
+            write_output(operators.printable(stack[-2], stack[-1]))
+
+        else:
+            raise InterpSyntaxError("Unhandled!")
+
+    for slot, variable_name in enumerate(slot_names):
+        if types[slot] is not None:
+            state = state.set_value(variable_name, values[slot], types[slot])
+    return (stack[-2], stack[-1], state)
+
+
+'''
+Backend for run_stimpl that compiles program to bytecode and runs it on
+the virtual machine. program may also be already compiled Bytecode.
+'''
+def run_vm(program, state: State) -> Tuple[Optional[Any], Type, State]:
+    if not isinstance(program, Bytecode):
+        program = compile_bytecode(program)
+    return execute(program, state)
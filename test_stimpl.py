@@ -1,9 +1,93 @@
+from unittest import SkipTest
 from stimpl.expression import BooleanLiteral
+from stimpl.test_compiler import test_compiled_sanity, test_compiled_matches_evaluate, test_compiled_program_is_reusable, test_compiled_counting_loops
+from stimpl.test_typecheck import test_typecheck_infers_types, test_typecheck_rejects_ill_typed_programs, test_checked_sanity, test_checked_matches_evaluate
+from stimpl.test_vm import test_vm_sanity, test_vm_matches_evaluate, test_vm_deep_programs, test_vm_keeps_initial_state
+from stimpl.test_optimizer import test_optimized_sanity, test_optimized_matches_evaluate, test_optimize_folds_literals, test_optimize_eliminates_common_subexpressions, test_optimize_hoists_loop_invariants, test_optimized_final_state
+from stimpl.test_types import test_types_are_interned
+from stimpl.test_iterative import test_iterative_sanity, test_iterative_matches_evaluate, test_iterative_runs_in_slices, test_iterative_deep_expression, test_iterative_long_loop
+from stimpl.test_output import test_output_sinks, test_output_flushed_on_error
+from stimpl.test_batch import test_run_many_in_process, test_run_many_process_pool
+from stimpl.test_profiler import test_profiler_counts, test_profiler_collapsed_stacks, test_profiler_errors
+from stimpl.test_serialize import test_serialize_round_trip, test_serialize_image
+from stimpl.test_cache import test_cache_replays_results, test_cache_replays_errors, test_cache_skips_uncacheable_programs
+from stimpl.test_vectorized import test_vectorized_batches
+from stimpl.test_limits import test_step_limits, test_size_limits, test_limited_runs
+from stimpl.test_aio import test_async_matches_run_stimpl, test_async_interleaves_programs, test_async_cancellation_and_limits
+from stimpl.test_checkpoint import test_checkpoint_round_trip, test_resume_in_another_process
+from stimpl.test_bench import test_bench_workloads, test_bench_regressions
+from stimpl.test_fuzz import test_generator, test_differential_check
+from stimpl.test_rope import test_rope_values, test_rope_programs
+from stimpl.test_resolve import test_resolution, test_compiled_slots
+from stimpl.test_imports import test_lazy_imports
+from stimpl.test_expression import test_expressions_are_slotted, test_expressions_compare_by_structure, test_hash_consing
 from stimpl.robustness import run_stimpl_robustness_tests
 from stimpl.test import run_stimpl_sanity_tests
-from stimpl.test_state import test_state_implementation
+from stimpl.test_state import test_state_implementation, test_state_many_updates, test_state_pickles_across_processes
 
 if __name__=='__main__':
   test_state_implementation()
+  test_state_many_updates()
+  test_state_pickles_across_processes()
   run_stimpl_sanity_tests()
+  test_compiled_sanity()
+  test_compiled_matches_evaluate()
+  test_compiled_program_is_reusable()
+  test_compiled_counting_loops()
+  test_typecheck_infers_types()
+  test_typecheck_rejects_ill_typed_programs()
+  test_checked_sanity()
+  test_checked_matches_evaluate()
+  test_vm_sanity()
+  test_vm_matches_evaluate()
+  test_vm_deep_programs()
+  test_vm_keeps_initial_state()
+  test_optimized_sanity()
+  test_optimized_matches_evaluate()
+  test_optimize_folds_literals()
+  test_optimize_eliminates_common_subexpressions()
+  test_optimize_hoists_loop_invariants()
+  test_optimized_final_state()
+  test_types_are_interned()
+  test_iterative_sanity()
+  test_iterative_matches_evaluate()
+  test_iterative_runs_in_slices()
+  test_iterative_deep_expression()
+  test_iterative_long_loop()
+  test_output_sinks()
+  test_output_flushed_on_error()
+  test_run_many_in_process()
+  test_run_many_process_pool()
+  test_profiler_counts()
+  test_profiler_collapsed_stacks()
+  test_profiler_errors()
+  test_serialize_round_trip()
+  test_serialize_image()
+  test_expressions_are_slotted()
+  test_expressions_compare_by_structure()
+  test_hash_consing()
+  test_cache_replays_results()
+  test_cache_replays_errors()
+  test_cache_skips_uncacheable_programs()
+  try:
+    test_vectorized_batches()
+  except SkipTest as e:
+    print(f"test_vectorized_batches skipped: {e}")
+  test_step_limits()
+  test_size_limits()
+  test_limited_runs()
+  test_async_matches_run_stimpl()
+  test_async_interleaves_programs()
+  test_async_cancellation_and_limits()
+  test_checkpoint_round_trip()
+  test_resume_in_another_process()
+  test_bench_workloads()
+  test_bench_regressions()
+  test_generator()
+  test_differential_check()
+  test_rope_values()
+  test_rope_programs()
+  test_resolution()
+  test_compiled_slots()
+  test_lazy_imports()
   run_stimpl_robustness_tests()
\ No newline at end of file